@@ -0,0 +1,496 @@
+# In[]:
+##################################################
+## Benchmarks for the facial analysis functions
+##################################################
+
+import collections
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import time
+import cv2
+import numpy as np
+import MLmodels.facial_analysis as fa
+from MLmodels import model_registry
+
+# In[]:
+##################################################
+## Accuracy vs speed of the face detector at different detection scales
+##################################################
+'''
+Function compare_detect_scales runs face_68_tracker on the same video with each detection scale, and compares speed and landmark accuracy
+against the full resolution detection (scale 1.0).
+Input:
+    - video_path: full path of video for analysis.
+    - scales: a list of detection scales to compare. Scale 1.0 is always included as reference.
+    - track_param: other track_param values used for every run. The default value is {}.
+Output:
+    - report: a list of dictionaries, one per scale, sorted by descending scale:
+        * scale: the detection scale
+        * seconds: processing time of face_68_tracker
+        * fps: processed frames per second
+        * speedup: processing time of scale 1.0 divided by processing time of the scale
+        * detect_rate: share of frames where a face is found
+        * missed_frame: number of frames where a face is found at scale 1.0 but not at the scale
+        * landmark_error: mean distance between the 68 trackers and the trackers found at scale 1.0, divided by the distance between the outer
+                        eye corners (normalized error commonly used for 68 point landmarks). Only frames with a face in both runs are compared.
+        * landmark_error_p95: 95th percentile of the per frame normalized error
+'''
+def compare_detect_scales(video_path, scales=(1.0, 0.75, 0.5, 0.33, 0.25), track_param={}):
+    scales = sorted(set([1.0] + [float(s) for s in scales]), reverse=True)
+    return _compare_track_param(video_path, 'detect_scale', scales, 1.0, track_param, 'scale')
+
+'''
+Function compare_roi_margins runs face_68_tracker on the same video with each roi_margin (see FrameAnalyzer), and compares speed and landmark
+accuracy against the search of the whole frame (roi_margin 0). The crop of roi_margin is aligned with the cells of the HOG detector, but the
+faces found in the crop can still differ by a few pixels from those found in the whole frame, and the trackers follow the boxes.
+Input:
+    - video_path: full path of video for analysis.
+    - margins: a list of roi_margin values to compare. 0 is always included as reference.
+    - track_param: other track_param values used for every run. The default value is {}.
+Output:
+    - report: a list of dictionaries, one per roi_margin, sorted by ascending roi_margin, with the keys of compare_detect_scales (roi_margin
+      instead of scale)
+'''
+def compare_roi_margins(video_path, margins=(0.25, 0.5, 1.0), track_param={}):
+    margins = sorted(set([0.0] + [float(m) for m in margins]))
+    return _compare_track_param(video_path, 'roi_margin', margins, 0.0, track_param, 'roi_margin')
+
+# run face_68_tracker with each value of one track_param key, and compare the landmarks with the run of the reference value
+def _compare_track_param(video_path, key, values, reference, track_param, label):
+    runs = {}
+    for value in values:
+        param = dict(track_param)
+        param[key] = value
+        t_start = time.time()
+        summary, face_tracker, errors = fa.face_68_tracker(video_path, verbose=False, track_param=param)
+        seconds = time.time() - t_start
+        if summary == {}:
+            raise IOError('; '.join(errors))
+        runs[value] = (seconds, summary, face_tracker)
+
+    ref_seconds, ref_summary, ref_tracker = runs[reference]
+    ref_landmarks = ref_tracker.landmarks.astype(np.float32)
+    # normalize by the distance between the outer corners of the two eyes
+    eye_dist = np.linalg.norm(ref_landmarks[:, 36] - ref_landmarks[:, 45], axis=1)
+
+    report = []
+    for value in values:
+        seconds, summary, face_tracker = runs[value]
+        both = ref_tracker.valid & face_tracker.valid
+        if both.any():
+            diff = np.linalg.norm(face_tracker.landmarks[both].astype(np.float32) - ref_landmarks[both], axis=2).mean(axis=1)
+            error = diff / eye_dist[both]
+            landmark_error = float(error.mean())
+            landmark_error_p95 = float(np.percentile(error, 95))
+        else:
+            landmark_error = float('nan')
+            landmark_error_p95 = float('nan')
+        report.append({label: value,
+                       'seconds': seconds,
+                       'fps': summary['processed_frame'] / seconds,
+                       'speedup': ref_seconds / seconds,
+                       'detect_rate': float(face_tracker.valid.mean()) if len(face_tracker) else 0.0,
+                       'missed_frame': int((ref_tracker.valid & ~face_tracker.valid).sum()),
+                       'landmark_error': landmark_error,
+                       'landmark_error_p95': landmark_error_p95,
+                       })
+    return report
+
+'''
+Function format_report formats a list of dictionaries (e.g. the output of compare_detect_scales) as a plain text table.
+'''
+def format_report(report, columns=None):
+    if len(report) == 0:
+        return ''
+    if columns is None:
+        columns = list(report[0].keys())
+    rows = [columns]
+    for item in report:
+        rows.append([('%.4g' % item[c]) if isinstance(item[c], float) else str(item[c]) for c in columns])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    lines = ['  '.join(value.rjust(widths[i]) for i, value in enumerate(row)) for row in rows]
+    return '\n'.join(lines)
+
+# In[]:
+##################################################
+## Speed of the engines for windowed blink thresholds
+##################################################
+'''
+Function synthetic_eye_ratio generates an eye aspect ratio series with open eyes around 0.3, blinks of 100-400ms every 2-6 seconds,
+and short gaps without a face (NaN).
+Input:
+    - frame_N: number of frames
+    - fps: frame per second
+    - seed: seed of the random generator
+Output:
+    - eye_aspect_ratio: an array (frame_N,)
+'''
+def synthetic_eye_ratio(frame_N, fps=30, seed=0):
+    rng = np.random.RandomState(seed)
+    eye_aspect_ratio = 0.3 + 0.02 * rng.randn(frame_N)
+    f = int(rng.uniform(2, 6) * fps)
+    while f < frame_N:
+        length = max(int(rng.uniform(0.1, 0.4) * fps), 1)
+        eye_aspect_ratio[f:f+length] = 0.1 + 0.02 * rng.randn(len(eye_aspect_ratio[f:f+length]))
+        f += length + int(rng.uniform(2, 6) * fps)
+    # frames without a face
+    for start in rng.randint(0, max(frame_N, 1), size=frame_N // 3000):
+        eye_aspect_ratio[start:start + int(fps)] = np.nan
+    return eye_aspect_ratio
+
+'''
+Function compare_threshold_engines times each engine of facial_analysis.window_thresholds on a synthetic eye aspect ratio series,
+and checks that all engines return the same thresholds as the first engine in the list.
+Input:
+    - frame_N: number of frames. Default value is one hour at 60fps.
+    - fps: frame per second
+    - auto_thresh_win: half width of the window in seconds, same as blink_param['auto_thresh_win'] of detect_blink
+    - auto_thresh_qt: same as blink_param['auto_thresh_qt'] of detect_blink
+    - engines: engines to compare. 'naive' is the per-frame implementation used before the rolling engines.
+Output:
+    - report: a list of dictionaries, one per engine:
+        * engine: name of the engine
+        * seconds: time to calculate the thresholds of all frames
+        * speedup: seconds of the first engine divided by seconds of the engine
+        * max_abs_diff: the largest difference from the thresholds of the first engine (0.0 when identical)
+'''
+def compare_threshold_engines(frame_N=216000, fps=60, auto_thresh_win=4, auto_thresh_qt=0.4, engines=('naive', 'heap', 'vectorized')):
+    eye_aspect_ratio = synthetic_eye_ratio(frame_N, fps)
+    adj_f = int(fps * auto_thresh_win)
+    report = []
+    reference = None
+    for engine in engines:
+        t_start = time.time()
+        thresholds = fa.window_thresholds(eye_aspect_ratio, adj_f, auto_thresh_qt, engine=engine)
+        seconds = time.time() - t_start
+        if reference is None:
+            reference = (seconds, thresholds)
+        # frames with a threshold must be the same for all engines
+        has_thresh = ~np.isnan(reference[1])
+        if np.array_equal(has_thresh, ~np.isnan(thresholds)):
+            max_abs_diff = float(np.abs(thresholds - reference[1])[has_thresh].max()) if has_thresh.any() else 0.0
+        else:
+            max_abs_diff = float('inf')
+        report.append({'engine': engine,
+                       'seconds': seconds,
+                       'speedup': reference[0] / seconds,
+                       'max_abs_diff': max_abs_diff,
+                       })
+    return report
+
+# In[]:
+##################################################
+## Synthetic video fixtures
+##################################################
+'''
+Synthetic videos are generated offline for the benchmark suite, so that runs on different machines and commits measure the same input.
+A face moves slowly around the center of the frame and closes its eyes at scripted times (blink_schedule). The face is a photo when
+face_image is given: its eyes are located once with the face detector and shape predictor, and closed eyes are painted over with the skin
+below the eyes. Otherwise a drawn face is used, which is enough to time decoding, blink detection and drawing but may not be found by the
+HOG face detector; use a photo to time detection and landmarks realistically.
+FIXTURES maps fixture names to (width, height, seconds, fps).
+'''
+FIXTURES = collections.OrderedDict([
+        ('360p_10s', (640, 360, 10, 30)),
+        ('720p_10s', (1280, 720, 10, 30)),
+        ('720p_60s', (1280, 720, 60, 30)),
+        ('1080p_10s', (1920, 1080, 10, 30)),
+        # blinks last 6-21 frames at 60fps, as in the videos face_68_tracker_adaptive samples
+        ('720p_40s_60fps', (1280, 720, 40, 60)),
+        ])
+
+'''
+Function blink_schedule returns the blinks of a synthetic video: a list of (start second, duration in seconds), one blink every 2-5 seconds
+lasting 150-350ms.
+'''
+def blink_schedule(seconds, seed=0):
+    rng = np.random.RandomState(seed)
+    blinks = []
+    t = rng.uniform(1, 3)
+    while t + 0.5 < seconds:
+        duration = rng.uniform(0.15, 0.35)
+        blinks.append((round(t, 3), round(duration, 3)))
+        t += duration + rng.uniform(2, 5)
+    return blinks
+
+# a drawn face of size x size pixels, and the 6 points of each eye in the order of the 68 trackers (corner, upper lid, corner, lower lid)
+def _drawn_face(size):
+    face = np.full((size, size, 3), 200, dtype=np.uint8)
+    center = (size // 2, size // 2)
+    cv2.ellipse(face, center, (int(size * 0.38), int(size * 0.47)), 0, 0, 360, (140, 170, 220), -1)
+    eyes = []
+    for cx in [0.33, 0.67]:
+        x, y, w, h = size * cx, size * 0.42, size * 0.08, size * 0.035
+        eye = np.array([[x - w, y], [x - w / 3, y - h], [x + w / 3, y - h], [x + w, y], [x + w / 3, y + h], [x - w / 3, y + h]], dtype=np.int32)
+        cv2.fillConvexPoly(face, eye, (255, 255, 255))
+        cv2.circle(face, (int(x), int(y)), int(h), (60, 40, 30), -1)
+        cv2.line(face, (int(x - w), int(y - 2.2 * h)), (int(x + w), int(y - 2.5 * h)), (40, 40, 60), max(size // 60, 1))
+        eyes.append(eye)
+    cv2.line(face, (size // 2, int(size * 0.45)), (size // 2, int(size * 0.62)), (100, 120, 170), max(size // 80, 1))
+    cv2.ellipse(face, (size // 2, int(size * 0.75)), (int(size * 0.12), int(size * 0.04)), 0, 0, 360, (80, 80, 170), -1)
+    return face, eyes
+
+# a photo of a face cropped to size x size pixels around the detected face, and the 6 points of each eye
+def _photo_face(face_image, size):
+    img = cv2.imread(face_image)
+    if img is None:
+        raise IOError('Cannot read face image %s' % face_image)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    dets = model_registry.get_detector()(gray, 1)
+    if len(dets) == 0:
+        raise ValueError('No face found in %s' % face_image)
+    det = max(dets, key=lambda d: d.width() * d.height())
+    # crop a square with a margin around the face
+    side = int(max(det.width(), det.height()) * 1.6)
+    cx, cy = (det.left() + det.right()) // 2, (det.top() + det.bottom()) // 2
+    img = cv2.copyMakeBorder(img, side, side, side, side, cv2.BORDER_REPLICATE)
+    left, top = cx - side // 2 + side, cy - side // 2 + side
+    face = cv2.resize(img[top:top + side, left:left + side], (size, size), interpolation=cv2.INTER_AREA)
+    shape = model_registry.get_predictor()(gray, det)
+    scale = size / float(side)
+    points = np.array([[(shape.part(i).x - cx + side // 2) * scale, (shape.part(i).y - cy + side // 2) * scale] for i in range(36, 48)])
+    return face, [points[:6].astype(np.int32), points[6:].astype(np.int32)]
+
+# paint closed eyes: fill each eye with the skin color below it and draw the lid
+def _close_eyes(face, eyes):
+    closed = face.copy()
+    for eye in eyes:
+        x, y, w, h = cv2.boundingRect(eye)
+        skin = face[min(y + 2 * h, face.shape[0] - 1):min(y + 3 * h + 1, face.shape[0]), x:x + w].reshape(-1, 3)
+        color = tuple(int(c) for c in np.median(skin, axis=0)) if len(skin) > 0 else (140, 170, 220)
+        cv2.fillConvexPoly(closed, cv2.convexHull(eye), color)
+        cv2.line(closed, tuple(int(v) for v in eye[0]), tuple(int(v) for v in eye[3]), (40, 40, 60), max(h // 3, 1))
+    return closed
+
+'''
+Function make_synthetic_video writes a synthetic MP4 video and a json file of its description (path + '.json').
+Input:
+    - path: full path of the video
+    - width, height, seconds, fps: size, length and frame rate of the video
+    - face_image: full path of a face photo. The default value is None, which draws a face.
+    - seed: seed of the blink schedule
+Output:
+    - meta: the description of the video: width, height, seconds, fps, frame_N, blinks (see blink_schedule), blink_count and face_image
+'''
+def make_synthetic_video(path, width, height, seconds, fps=30, face_image=None, seed=0):
+    frame_N = int(seconds * fps)
+    size = int(height * 0.45)
+    if face_image is not None:
+        open_face, eyes = _photo_face(face_image, size)
+    else:
+        open_face, eyes = _drawn_face(size)
+    closed_face = _close_eyes(open_face, eyes)
+    blinks = blink_schedule(seconds, seed)
+    closed = np.zeros(frame_N, dtype=bool)
+    for start, duration in blinks:
+        closed[int(start * fps):int((start + duration) * fps) + 1] = True
+    # a horizontal gradient, so that the background is not flat
+    background = np.tile(np.linspace(60, 180, width, dtype=np.uint8)[None, :, None], (height, 1, 3))
+
+    save_dir = os.path.dirname(path)
+    if save_dir and not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError('Cannot write video %s' % path)
+    for f in range(frame_N):
+        frame = background.copy()
+        # the face drifts around the center, so that the tracker has to follow it
+        x0 = (width - size) // 2 + int(width * 0.03 * np.sin(2 * np.pi * f / (fps * 4.0)))
+        y0 = (height - size) // 2 + int(height * 0.03 * np.cos(2 * np.pi * f / (fps * 6.0)))
+        frame[y0:y0 + size, x0:x0 + size] = closed_face if closed[f] else open_face
+        writer.write(frame)
+    writer.release()
+
+    meta = {'width': width, 'height': height, 'seconds': seconds, 'fps': fps, 'frame_N': frame_N, 'blinks': blinks, 'blink_count': len(blinks),
+            'face_image': face_image or ''}
+    with open(path + '.json', 'w') as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+'''
+Function ensure_fixtures generates the fixtures that do not exist yet in directory, and returns all of them.
+Input:
+    - directory: directory of the fixtures
+    - names: names of fixtures in FIXTURES. The default value is None, which uses all fixtures.
+    - face_image: passed to make_synthetic_video. Fixtures generated with another face image are generated again.
+Output:
+    - fixtures: an ordered dictionary of name: (path, meta)
+'''
+def ensure_fixtures(directory, names=None, face_image=None):
+    fixtures = collections.OrderedDict()
+    for name in (names or list(FIXTURES.keys())):
+        if name not in FIXTURES:
+            raise ValueError('Unknown fixture %s. Choose from %s' % (name, ', '.join(FIXTURES.keys())))
+        width, height, seconds, fps = FIXTURES[name]
+        path = os.path.join(directory, name + '.mp4')
+        meta = None
+        if os.path.exists(path) and os.path.exists(path + '.json'):
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            if meta.get('face_image', '') != (face_image or ''):
+                meta = None
+        if meta is None:
+            meta = make_synthetic_video(path, width, height, seconds, fps, face_image=face_image)
+        fixtures[name] = (path, meta)
+    return fixtures
+
+# In[]:
+##################################################
+## Benchmark suite of the facial analysis hot paths
+##################################################
+'''
+Function run_suite times the facial analysis hot paths on each fixture. Each case runs repeat times; the fastest run is reported, since
+slower runs are caused by other load on the machine.
+Cases:
+    * face_68_tracker: decoding, detection and landmarks of all frames
+    * detect_blink_global: detect_blink with one threshold for the whole video (auto_thresh_win 0)
+    * detect_blink_windowed: detect_blink with windowed thresholds (auto_thresh_win 4 seconds)
+    * face_68_tracker_adaptive: face_68_tracker_adaptive with the default sample_param, and detect_blink with one threshold on its result
+    * draw_shape: draw_dets and draw_shape on every frame with a face
+    * video_write: write every frame with open_video_writer, as render_marked_video does
+Input:
+    - fixtures: the output of ensure_fixtures
+    - repeat: number of runs of each case
+    - track_param: passed to face_68_tracker
+Output:
+    - results: a list of dictionaries, one per fixture and case:
+        * fixture, case: names of the fixture and the case
+        * frames: number of frames processed by the case
+        * seconds: time of the fastest run
+        * seconds_median: median time of the runs
+        * fps: frames per second of the fastest run
+        * blink_count, blink_count_expected: counted and scripted blinks (detect_blink and adaptive cases only)
+        * blink_count_dense, analyzed_ratio: blinks counted on the dense trackers, and share of frames analyzed (adaptive case only)
+        * note: why a case was skipped, e.g. no video encoder available
+'''
+def run_suite(fixtures, repeat=3, track_param={}):
+    results = []
+    for name, (path, meta) in fixtures.items():
+        def add(case, frames, times, **extra):
+            item = {'fixture': name, 'case': case, 'frames': frames, 'seconds': min(times), 'seconds_median': float(np.median(times)),
+                    'fps': frames / min(times) if min(times) > 0 else float('inf')}
+            item.update(extra)
+            results.append(item)
+
+        times = []
+        for _ in range(repeat):
+            t_start = time.time()
+            summary, face_tracker, errors = fa.face_68_tracker(path, verbose=False, track_param=track_param)
+            times.append(time.time() - t_start)
+        if summary == {}:
+            raise IOError('; '.join(errors))
+        add('face_68_tracker', summary['processed_frame'], times)
+
+        for case, auto_thresh_win in [('detect_blink_global', 0), ('detect_blink_windowed', 4)]:
+            times = []
+            for _ in range(repeat):
+                t_start = time.time()
+                eye_aspect_ratio, blink_count, blink_errors = fa.detect_blink(summary, face_tracker, blink_param={'auto_thresh_win': auto_thresh_win})
+                times.append(time.time() - t_start)
+            add(case, len(face_tracker), times, blink_count=blink_count[-1] if len(blink_count) > 0 else 0,
+                blink_count_expected=meta['blink_count'])
+            if auto_thresh_win == 0:
+                blink_count_dense = blink_count[-1] if len(blink_count) > 0 else 0
+
+        times = []
+        for _ in range(repeat):
+            t_start = time.time()
+            adaptive_summary, adaptive_tracker, errors = fa.face_68_tracker_adaptive(path, track_param=track_param)
+            times.append(time.time() - t_start)
+        eye_aspect_ratio, blink_count, blink_errors = fa.detect_blink(adaptive_summary, adaptive_tracker)
+        add('face_68_tracker_adaptive', adaptive_summary['processed_frame'], times, blink_count=blink_count[-1] if len(blink_count) > 0 else 0,
+            blink_count_expected=meta['blink_count'], blink_count_dense=blink_count_dense,
+            analyzed_ratio=adaptive_summary['sampling']['analyzed_ratio'])
+
+        frame = np.zeros((summary['height'], summary['width'], 3), dtype=np.uint8)
+        valid_index = np.nonzero(face_tracker.valid)[0]
+        times = []
+        for _ in range(repeat):
+            t_start = time.time()
+            for i in valid_index:
+                fa.draw_dets(frame, face_tracker.boxes[i], color=(255,255,0), pt=2)
+                fa.draw_shape(frame, face_tracker.landmarks[i], color=(255,0,0))
+            times.append(time.time() - t_start)
+        add('draw_shape', len(valid_index), times)
+
+        save_path = os.path.join(os.path.dirname(path), name + '_write.mp4')
+        times = []
+        note = ''
+        for _ in range(repeat):
+            t_start = time.time()
+            out = fa.open_video_writer(path, save_path, summary['fps'], summary['width'], summary['height'])
+            if not out.isOpened():
+                note = 'no video encoder for open_video_writer'
+                break
+            for _ in range(summary['processed_frame']):
+                out.write(frame)
+            out.release()
+            times.append(time.time() - t_start)
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        if note:
+            results.append({'fixture': name, 'case': 'video_write', 'frames': 0, 'note': note})
+        else:
+            add('video_write', summary['processed_frame'], times)
+    return results
+
+'''
+Functions to keep benchmark results in a json history file, a list of runs:
+    * load_history(path): return the runs in the file, or [] if it does not exist
+    * append_history(path, results, label): add a run with the results of run_suite, a label, the time, the git commit and the environment,
+        and return it. The file is replaced at once, so an interrupted write does not lose the history.
+    * compare_runs(base, new, threshold): compare the results of two runs by fixture and case. Return a list of dictionaries:
+        * fixture, case
+        * base_seconds, new_seconds: fastest times of the two runs
+        * speedup: base_seconds / new_seconds
+        * change: 'slower' when the new run takes more than (1 + threshold) times as long, 'faster' when the base run does, otherwise ''
+'''
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def append_history(path, results, label=''):
+    history = load_history(path)
+    run = {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+           'label': label,
+           'commit': _git_commit(),
+           'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+                           'machine': platform.machine(), 'cpu_count': multiprocessing.cpu_count(), 'host': platform.node()},
+           'results': results,
+           }
+    history.append(run)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(path + '.tmp', path)
+    return run
+
+def compare_runs(base, new, threshold=0.1):
+    base_results = dict(((item['fixture'], item['case']), item) for item in base['results'] if 'seconds' in item)
+    report = []
+    for item in new['results']:
+        key = (item['fixture'], item['case'])
+        if 'seconds' not in item or key not in base_results:
+            continue
+        base_seconds = base_results[key]['seconds']
+        speedup = base_seconds / item['seconds'] if item['seconds'] > 0 else float('inf')
+        change = ''
+        if item['seconds'] > base_seconds * (1 + threshold):
+            change = 'slower'
+        elif base_seconds > item['seconds'] * (1 + threshold):
+            change = 'faster'
+        report.append({'fixture': item['fixture'], 'case': item['case'], 'base_seconds': base_seconds, 'new_seconds': item['seconds'],
+                       'speedup': speedup, 'change': change})
+    return report
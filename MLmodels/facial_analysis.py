@@ -1,32 +1,613 @@
 # In[]:
 ##################################################
-## Set up environment and load facial recognition model
+## Set up environment
 ##################################################
 
 import os
+import collections
+import heapq
+import multiprocessing
+import queue
+import threading
 import dlib
 import cv2
 import numpy as np
 from scipy.spatial import distance as dist
-# import plotly
-import matplotlib
-matplotlib.use('agg') # this avoid using package tkinter which is not supported by AWS
-import matplotlib.pyplot as plt
 import time
+# the face detector and shape predictor are loaded on first use. see MLmodels/model_registry.py
+from MLmodels import model_registry
 
+# In[]:
+##################################################
+## Store face positions and trackers of a video in compact arrays
+##################################################
+'''
+Class FaceTrackerResult stores the face details of every frame in preallocated numpy arrays, instead of per-frame python lists of dlib objects.
+The arrays grow by doubling when the number of frames exceeds the capacity (CAP_PROP_FRAME_COUNT is only an estimate for some codecs).
+Attributes (views on the filled frames, no copy):
+    - start_times: float64 array (N,) of the start time of each frame
+    - boxes: int16 array (N,4) of the (left, top, right, bottom) coordinate of the face in each frame
+    - landmarks: int16 array (N,68,2) of the x-y coordinates of the 68 trackers in each frame
+    - valid: bool array (N,) indicating whether a face is detected in the frame. Boxes and landmarks of invalid frames are zeros.
+    - source: int8 array (N,) indicating how the face is located in each frame:
+        * SOURCE_NONE (0): no face
+        * SOURCE_DETECTED (1): face detected by the HOG detector
+        * SOURCE_TRACKED (2): face followed by a tracker from the previous frame
+        * SOURCE_SAMPLED (3): frame skipped by adaptive sampling, holding the face of the previous analyzed frame (see face_68_tracker_adaptive)
+        * SOURCE_REUSED (4): near-duplicate of the previous analyzed frame, reusing its face (see track_param['duplicate_thresh'] of FrameAnalyzer)
+    - faces: a dictionary of FaceTrackerResult by face id, filled when all faces are tracked (track_param['multi_face'] is 'all').
+            Each result covers the same frames as the main arrays; frames where the face is not seen are invalid.
+Compatibility:
+    - result[key] returns the arrays under the keys of the old dictionary output of face_68_tracker:
+        * 'start_times' -> start_times
+        * 'head_positions' -> boxes
+        * 'tracker_shapes', 'tracker_coords' -> landmarks
+        * 'valid' -> valid
+'''
+SOURCE_NONE = 0
+SOURCE_DETECTED = 1
+SOURCE_TRACKED = 2
+SOURCE_SAMPLED = 3
+SOURCE_REUSED = 4
+
+class FaceTrackerResult(object):
+
+    # map keys of the old dictionary output to array attributes
+    LEGACY_KEYS = {'start_times': 'start_times',
+                   'head_positions': 'boxes',
+                   'tracker_shapes': 'landmarks',
+                   'tracker_coords': 'landmarks',
+                   'valid': 'valid',
+                   }
+    ARRAY_NAMES = ['_start_times', '_boxes', '_landmarks', '_valid', '_source']
+
+    def __init__(self, capacity=0, dtype=np.int16):
+        capacity = max(int(capacity), 1)
+        self.n = 0
+        self._start_times = np.zeros(capacity, dtype=np.float64)
+        self._boxes = np.zeros((capacity, 4), dtype=dtype)
+        self._landmarks = np.zeros((capacity, 68, 2), dtype=dtype)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._source = np.zeros(capacity, dtype=np.int8)
+        self.faces = {}
+
+    def __len__(self):
+        return self.n
+
+    # arrays are exposed as views on the filled frames
+    @property
+    def start_times(self):
+        return self._start_times[:self.n]
+
+    @property
+    def boxes(self):
+        return self._boxes[:self.n]
+
+    @property
+    def landmarks(self):
+        return self._landmarks[:self.n]
+
+    @property
+    def valid(self):
+        return self._valid[:self.n]
+
+    @property
+    def source(self):
+        return self._source[:self.n]
+
+    # compatibility accessor for the old dictionary shape
+    def __getitem__(self, key):
+        if key not in self.LEGACY_KEYS:
+            raise KeyError(key)
+        return getattr(self, self.LEGACY_KEYS[key])
+
+    def __contains__(self, key):
+        return key in self.LEGACY_KEYS
+
+    def keys(self):
+        return self.LEGACY_KEYS.keys()
+
+    # double the capacity of all arrays
+    def _grow(self):
+        capacity = 2 * len(self._valid)
+        for name in self.ARRAY_NAMES:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    # append one frame. pos is a dlib.rectangle and shape is a dlib.full_object_detection; both are None if no face is detected.
+    def append(self, start_time, pos=None, shape=None, source=SOURCE_DETECTED):
+        if self.n == len(self._valid):
+            self._grow()
+        f = self.n
+        self._start_times[f] = start_time
+        if pos is not None and shape is not None:
+            self._boxes[f] = (pos.left(), pos.top(), pos.right(), pos.bottom())
+            landmarks = self._landmarks[f]
+            for i in range(68):
+                point = shape.part(i)
+                landmarks[i, 0] = point.x
+                landmarks[i, 1] = point.y
+            self._valid[f] = True
+            self._source[f] = source
+        self.n += 1
+
+    # store a face with a stable id in frame f_index. the frame must already be appended to this result.
+    def add_face(self, face_id, f_index, pos, shape, source=SOURCE_DETECTED):
+        if face_id not in self.faces:
+            self.faces[face_id] = FaceTrackerResult(capacity=len(self._valid))
+        face = self.faces[face_id]
+        # frames where the face is not seen are invalid
+        while face.n < f_index:
+            face.append(self._start_times[face.n])
+        face.append(self._start_times[f_index], pos, shape, source)
+
+    # wrap existing arrays (e.g. memory-mapped arrays of stored results) without copying them
+    @classmethod
+    def from_arrays(cls, start_times, boxes, landmarks, valid, source=None):
+        result = cls()
+        result._start_times = start_times
+        result._boxes = boxes
+        result._landmarks = landmarks
+        result._valid = valid
+        result._source = source if source is not None else np.where(valid, SOURCE_DETECTED, SOURCE_NONE).astype(np.int8)
+        result.n = len(valid)
+        return result
 
-# give path to the trained shape predictor model: shape_predictor_68_face_landmarks.dat
-#####  Download model from: http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2
-#####  Note that the license for the iBUG 300-W dataset excludes commercial use.
-#####  So you should contact Imperial College London to find out if it's OK for you to use this model file in a commercial product.
-from django.conf import settings
-predictor_path = settings.BASE_DIR + "/MLmodels/shape_predictor_68_face_landmarks.dat"
+    # merge results of consecutive chunks of a video in frame order
+    @classmethod
+    def concatenate(cls, results):
+        merged = cls()
+        if len(results) > 0:
+            for name in cls.ARRAY_NAMES:
+                setattr(merged, name, np.concatenate([getattr(r, name)[:r.n] for r in results]))
+            merged.n = sum(r.n for r in results)
+        return merged
 
-# load face detector from dlib - identifying all faces on an image
-detector = dlib.get_frontal_face_detector()
-# load share predictor - identifying position 64 trackers on face
-#####  see tracker index here: https://www.pyimagesearch.com/2017/04/10/detect-eyes-nose-lips-jaw-dlib-opencv-python/
-predictor = dlib.shape_predictor(predictor_path)
+    # release unused capacity once the video is processed
+    def trim(self):
+        for name in self.ARRAY_NAMES:
+            setattr(self, name, getattr(self, name)[:self.n].copy())
+        for face in self.faces.values():
+            while face.n < self.n:
+                face.append(self._start_times[face.n])
+            face.trim()
+        return self
+
+# In[]:
+##################################################
+## Locate the face and its details frame by frame
+##################################################
+'''
+Class FrameAnalyzer locates the face and its 68 trackers in consecutive frames of a video.
+By default the HOG face detector runs on every frame. When detect_every > 1, the detector runs every detect_every frames (counted from
+the first frame of the video) and the face is followed by a cheap tracker in between. The detector also runs again whenever the tracking is lost.
+Input:
+    - track_param: a dictionary that contains the following optional values. The default value is {}.
+        * detect_every: run the face detector on every detect_every-th frame. Default value is 1, i.e. detect on every frame.
+        * track_method: the tracker used between detections. Default value is 'correlation'.
+            'correlation': dlib.correlation_tracker started on the last detected face.
+            'landmarks': the detected box is moved along with the centre of the 68 trackers of the previous frame.
+        * track_quality: for 'correlation', re-detect when the peak-to-sidelobe ratio of the tracker falls below this value. Default value is 7.
+        * max_scale_change: re-detect when the width of the tracked face changes by more than this ratio compared with the last detection.
+                        Default value is 0.2
+        * detect_scale: the detector runs on a copy of the grayscale frame resized by this factor, and the detected box is mapped back to
+                        full resolution before the 68 trackers are predicted on the full resolution grayscale frame. Default value is 1.0 (no resizing).
+                        Faces smaller than about 80/detect_scale pixels are not detected. Use MLmodels.benchmark.compare_detect_scales() to choose a value.
+        * roi_margin: when larger than 0, the detector first searches a crop around the last known box of the face, expanded by roi_margin
+                        times the width and height of the box on each side, and searches the whole frame only when no face is found in the crop.
+                        The detection cost falls with the area of the crop, e.g. to about 17% for a 200 pixel face in a 1280x720 frame with
+                        roi_margin 0.5. The crop starts on the 8 pixel cell grid of the HOG detector (8/detect_scale pixels in the frame), but
+                        the detector also searches smaller pyramid levels and cannot see beyond the crop, so a face found in the crop can differ
+                        by a few pixels from the face found in the whole frame. Use MLmodels.benchmark.compare_roi_margins() to measure the
+                        landmark error on your videos. A new face outside the crop is only found when the analyzed face is lost.
+                        Default value is 0 (whole frame). Cannot be used with multi_face 'all'.
+        * duplicate_thresh: when larger than 0, a frame reuses the face of the previous analyzed frame, without detection, tracking or prediction,
+                        if both differ from that frame by at most duplicate_thresh gray levels on average (0-255):
+                            - a THUMB_WIDTH pixels wide grayscale thumbnail of the whole frame, and
+                            - the region of both eyes at full resolution, so that a blink is never taken for a duplicate
+                        Frames are compared with the last analyzed frame, not the previous frame, so slow changes add up until the frame is
+                        analyzed again. Frozen webcam frames and paused screens differ only by compression noise, well below 1; a value of
+                        1 to 2 skips them. Check skipped_frame on live recordings before using a larger value. Default value is 0 (every
+                        frame is analyzed).
+        * multi_face: what to do when the detector finds more than one face. Default value is 'largest'.
+            'largest': analyze the largest face.
+            'nearest': analyze the face nearest to the last known position of the analyzed face (the largest face if there is none yet).
+            'all': analyze the face chosen by 'nearest', and also keep the trackers of every detected face under a stable id.
+                Faces are matched to the ids of the previous detection by overlap. Between detections only the analyzed face is tracked.
+            'error': raise an exception, which aborts the analysis.
+Methods:
+    - process(frame, f_index): return (pos, shape, source, faces) of BGR frame f_index. pos and shape are None if no face is found.
+                faces is a list of (face_id, pos, shape) of all faces when multi_face is 'all', otherwise an empty list.
+    - reset(): forget the face of previous frames. The next frame is always detected.
+Attributes:
+    - counts: the number of detected and tracked frames, and the number of re-detections by trigger:
+        * detected, tracked: number of frames located by the detector and by the tracker
+        * scheduled: detection because frame index is a multiple of detect_every
+        * no_face: detection because no face was located in the previous frame
+        * low_quality: detection because the correlation tracker lost confidence
+        * scale_change: detection because the tracked face changed size
+        * multi_face: number of detections that found more than one face
+        * face_ids: number of distinct face ids (multi_face is 'all')
+        * roi_hit, roi_fallback: number of detections that found a face in the crop of roi_margin, and that searched the whole frame after
+                        finding none in the crop
+        * roi_area: number of pixels of the searched crops
+        * duplicate: number of frames that reused the face of the previous analyzed frame (duplicate_thresh)
+    - timer: a StageTimer with the time spent by process() in the convert, detect, track and predict stages. The frame loop adds its own
+                stages (decode, draw, encode) to the same timer.
+    - unused_param: the values of track_param that are not recognized
+'''
+class FrameAnalyzer(object):
+
+    TRACK_METHODS = ['correlation', 'landmarks']
+    MULTI_FACE_POLICIES = ['largest', 'nearest', 'all', 'error']
+    # minimum overlap (intersection over union) for a face to keep the id of a face in the previous detection
+    MIN_FACE_OVERLAP = 0.3
+    # width of the thumbnails compared by duplicate_thresh
+    THUMB_WIDTH = 32
+    # cell size of the HOG face detector of dlib
+    HOG_CELL_SIZE = 8
+
+    def __init__(self, track_param={}):
+        param = dict(track_param)
+        self.detect_every = max(int(param.pop('detect_every', 1)), 1)
+        self.track_method = param.pop('track_method', 'correlation')
+        self.track_quality = float(param.pop('track_quality', 7))
+        self.max_scale_change = float(param.pop('max_scale_change', 0.2))
+        self.detect_scale = float(param.pop('detect_scale', 1.0))
+        self.multi_face = param.pop('multi_face', 'largest')
+        self.roi_margin = float(param.pop('roi_margin', 0))
+        self.duplicate_thresh = float(param.pop('duplicate_thresh', 0))
+        if self.multi_face not in self.MULTI_FACE_POLICIES:
+            raise ValueError("Invalid multi-face policy: %s" % self.multi_face)
+        if self.roi_margin < 0 or (self.roi_margin > 0 and self.multi_face == 'all'):
+            raise ValueError("Invalid ROI margin: %s" % self.roi_margin)
+        if not 0 < self.detect_scale <= 1:
+            raise ValueError("Invalid detection scale: %s" % self.detect_scale)
+        if self.track_method not in self.TRACK_METHODS:
+            raise ValueError("Invalid tracking method: %s" % self.track_method)
+        self.unused_param = param
+        # crops of roi_margin start on multiples of the cell size of the detector, in frame pixels
+        self.roi_step = max(int(round(self.HOG_CELL_SIZE / self.detect_scale)), 1)
+        # models are loaded once per process on first analysis
+        self.detector = model_registry.get_detector()
+        self.predictor = model_registry.get_predictor()
+        self.counts = {'detected': 0, 'tracked': 0, 'scheduled': 0, 'no_face': 0, 'low_quality': 0, 'scale_change': 0, 'multi_face': 0, 'face_ids': 0,
+                       'roi_hit': 0, 'roi_fallback': 0, 'roi_area': 0, 'duplicate': 0}
+        self.timer = StageTimer()
+        self.reset()
+
+    def reset(self):
+        self.last_pos = None # dlib.rectangle of the face in the previous frame
+        self.last_shape = None # dlib.full_object_detection of the face in the previous frame
+        self.tracker = None # dlib.correlation_tracker started at the last detection
+        self.det_width = None # width of the face at the last detection
+        self.det_offset = None # offset from the centre of the trackers to the centre of the box at the last detection
+        self.known_pos = None # the last known position of the analyzed face, kept across frames without a face
+        self.face_boxes = {} # the box of each face id at the last detection (multi_face is 'all')
+        self.primary_id = None # the id of the analyzed face (multi_face is 'all')
+        self.last_faces = [] # faces of the last analyzed frame (multi_face is 'all')
+        self.last_thumb = None # thumbnail of the last analyzed frame (duplicate_thresh)
+        self.last_eyes = None # (top, bottom, left, right) and grayscale pixels of the eye region of the last analyzed frame (duplicate_thresh)
+
+    # detect faces on the whole grayscale frame
+    def _detect(self, gray):
+        scale = self.detect_scale
+        if scale != 1:
+            # INTER_AREA avoids aliasing when shrinking the frame
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # the second parameter specifies number of times for upsampling. this will enlarge the frame to detect more faces
+        dets = self.detector(gray, 0)
+        if scale != 1:
+            # map the rectangles back to full resolution
+            dets = [dlib.rectangle(int(round(d.left() / scale)), int(round(d.top() / scale)),
+                                   int(round(d.right() / scale)), int(round(d.bottom() / scale))) for d in dets]
+        return list(dets)
+
+    # detect faces in the crop around the last known face, then on the whole frame if none is found
+    def _detect_roi(self, gray):
+        if self.roi_margin > 0 and self.known_pos is not None:
+            box = self.known_pos
+            dx, dy = int(box.width() * self.roi_margin), int(box.height() * self.roi_margin)
+            # start the crop on the cell grid of the detector, so that the cells of the crop are cells of the whole frame
+            step = self.roi_step
+            left, top = max(box.left() - dx, 0) // step * step, max(box.top() - dy, 0) // step * step
+            right, bottom = min(box.right() + dx + 1, gray.shape[1]), min(box.bottom() + dy + 1, gray.shape[0])
+            if right > left and bottom > top:
+                # dlib needs a contiguous image
+                dets = self._detect(np.ascontiguousarray(gray[top:bottom, left:right]))
+                self.counts['roi_area'] += (right - left) * (bottom - top)
+                if len(dets) > 0:
+                    self.counts['roi_hit'] += 1
+                    # translate the rectangles back to frame coordinates
+                    return [dlib.rectangle(d.left() + left, d.top() + top, d.right() + left, d.bottom() + top) for d in dets]
+                self.counts['roi_fallback'] += 1
+        return self._detect(gray)
+
+    # choose the face to analyze among detected faces
+    def _select(self, dets):
+        if len(dets) == 0:
+            return None
+        elif len(dets) == 1:
+            return dets[0]
+        self.counts['multi_face'] += 1
+        if self.multi_face == 'error':
+            raise Exception("More than one face is dected in video.")
+        if self.multi_face == 'largest' or self.known_pos is None:
+            return max(dets, key=lambda d: d.area())
+        # nearest centre to the last known position
+        c = self.known_pos.center()
+        return min(dets, key=lambda d: (d.center().x - c.x) ** 2 + (d.center().y - c.y) ** 2)
+
+    # intersection over union of two rectangles
+    @staticmethod
+    def _overlap(a, b):
+        w = min(a.right(), b.right()) - max(a.left(), b.left())
+        h = min(a.bottom(), b.bottom()) - max(a.top(), b.top())
+        if w <= 0 or h <= 0:
+            return 0.0
+        inter = float(w * h)
+        return inter / (a.area() + b.area() - inter)
+
+    # give each detected face a stable id by matching it to the faces of the previous detection
+    def _match_faces(self, gray, dets, pos, shape):
+        pairs = sorted([(self._overlap(d, self.face_boxes[i]), n, i) for n, d in enumerate(dets) for i in self.face_boxes], reverse=True)
+        ids = {}
+        used = set()
+        for overlap, n, i in pairs:
+            if overlap < self.MIN_FACE_OVERLAP:
+                break
+            if n not in ids and i not in used:
+                ids[n] = i
+                used.add(i)
+        faces = []
+        for n, d in enumerate(dets):
+            if n not in ids:
+                ids[n] = self.counts['face_ids']
+                self.counts['face_ids'] += 1
+            self.face_boxes[ids[n]] = d
+            if d is pos:
+                self.primary_id = ids[n]
+                faces.append((ids[n], d, shape))
+            else:
+                faces.append((ids[n], d, self.predictor(gray, d)))
+        return faces
+
+    # centre of the 68 trackers
+    @staticmethod
+    def _shape_centre(shape):
+        xs = [shape.part(i).x for i in range(68)]
+        ys = [shape.part(i).y for i in range(68)]
+        return sum(xs) / 68.0, sum(ys) / 68.0
+
+    # follow the face from the previous frame. return None when the tracking is lost.
+    def _track(self, gray):
+        if self.track_method == 'correlation':
+            quality = self.tracker.update(gray)
+            if quality < self.track_quality:
+                self.counts['low_quality'] += 1
+                return None
+            rect = self.tracker.get_position()
+            pos = dlib.rectangle(int(round(rect.left())), int(round(rect.top())), int(round(rect.right())), int(round(rect.bottom())))
+        else:
+            # keep the box size of the last detection and move it with the trackers
+            cx, cy = self._shape_centre(self.last_shape)
+            cx, cy = cx + self.det_offset[0], cy + self.det_offset[1]
+            half_w = self.last_pos.width() / 2.0
+            half_h = self.last_pos.height() / 2.0
+            pos = dlib.rectangle(int(round(cx - half_w)), int(round(cy - half_h)), int(round(cx + half_w)), int(round(cy + half_h)))
+        if abs(pos.width() - self.det_width) > self.max_scale_change * self.det_width:
+            self.counts['scale_change'] += 1
+            return None
+        return pos
+
+    # store the state of a newly detected face
+    def _start_track(self, gray, pos, shape):
+        self.det_width = pos.width()
+        cx, cy = self._shape_centre(shape)
+        self.det_offset = (pos.center().x - cx, pos.center().y - cy)
+        # no tracker is needed when the detector runs on every frame
+        if self.track_method == 'correlation' and self.detect_every > 1:
+            self.tracker = dlib.correlation_tracker()
+            self.tracker.start_track(gray, pos)
+
+    # thumbnail of a grayscale frame for duplicate_thresh
+    def _thumbnail(self, gray):
+        height = max(int(round(gray.shape[0] * self.THUMB_WIDTH / float(gray.shape[1]))), 1)
+        return cv2.resize(gray, (self.THUMB_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+    # whether the frame is a near-duplicate of the last analyzed frame
+    def _is_duplicate(self, gray, thumb):
+        if self.last_thumb is None or thumb.shape != self.last_thumb.shape:
+            return False
+        if cv2.absdiff(thumb, self.last_thumb).mean() > self.duplicate_thresh:
+            return False
+        if self.last_eyes is not None:
+            (top, bottom, left, right), eyes = self.last_eyes
+            if cv2.absdiff(gray[top:bottom, left:right], eyes).mean() > self.duplicate_thresh:
+                return False
+        return True
+
+    # store the thumbnail and the eye region of an analyzed frame for duplicate_thresh
+    def _keep_reference(self, gray, thumb, shape):
+        self.last_thumb = thumb
+        self.last_eyes = None
+        if shape is not None:
+            xs = [shape.part(i).x for i in range(36, 48)]
+            ys = [shape.part(i).y for i in range(36, 48)]
+            # expand by the height of the eye region, so that the lids stay inside when the eyes open wider
+            margin = max(ys) - min(ys) + 2
+            top, bottom = max(min(ys) - margin, 0), min(max(ys) + margin + 1, gray.shape[0])
+            left, right = max(min(xs) - 2, 0), min(max(xs) + 3, gray.shape[1])
+            if bottom > top and right > left:
+                self.last_eyes = ((top, bottom, left, right), gray[top:bottom, left:right].copy())
+
+    def process(self, frame, f_index):
+        timer = self.timer
+        t = timer.clock()
+        # convert to grayscale once; the detector, the tracker and the predictor all work on the single channel frame
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.duplicate_thresh > 0:
+            thumb = self._thumbnail(gray)
+            duplicate = self._is_duplicate(gray, thumb)
+            t = timer.lap(STAGE_CONVERT, t)
+            if duplicate:
+                self.counts['duplicate'] += 1
+                source = SOURCE_REUSED if self.last_pos is not None else SOURCE_NONE
+                return self.last_pos, self.last_shape, source, self.last_faces
+        else:
+            t = timer.lap(STAGE_CONVERT, t)
+        pos = None
+        shape = None
+        source = SOURCE_NONE
+        faces = []
+
+        # follow the face with the tracker unless a detection is scheduled or the face was not found in the previous frame
+        if self.last_pos is None:
+            self.counts['no_face'] += 1
+        elif f_index % self.detect_every == 0:
+            self.counts['scheduled'] += 1
+        else:
+            pos = self._track(gray)
+            t = timer.lap(STAGE_TRACK, t)
+            if pos is not None:
+                shape = self.predictor(gray, pos)
+                t = timer.lap(STAGE_PREDICT, t)
+                source = SOURCE_TRACKED
+                self.counts['tracked'] += 1
+                if self.multi_face == 'all':
+                    faces = [(self.primary_id, pos, shape)]
+
+        # run the detector when tracking is not possible or lost
+        if pos is None:
+            dets = self._detect_roi(gray)
+            pos = self._select(dets)
+            t = timer.lap(STAGE_DETECT, t)
+            if pos is not None:
+                shape = self.predictor(gray, pos)
+                t = timer.lap(STAGE_PREDICT, t)
+                source = SOURCE_DETECTED
+                self.counts['detected'] += 1
+                self._start_track(gray, pos, shape)
+                t = timer.lap(STAGE_TRACK, t)
+            if self.multi_face == 'all':
+                # the trackers of the other faces
+                faces = self._match_faces(gray, dets, pos, shape)
+                t = timer.lap(STAGE_PREDICT, t)
+
+        self.last_pos = pos
+        self.last_shape = shape
+        self.last_faces = faces
+        if pos is not None:
+            self.known_pos = pos
+        if self.duplicate_thresh > 0:
+            self._keep_reference(gray, thumb, shape)
+        return pos, shape, source, faces
+
+# detections in the crop of roi_margin, for the summary of a video
+def roi_summary(counts, width, height):
+    searched = counts['roi_hit'] + counts['roi_fallback']
+    area_ratio = counts['roi_area'] / float(searched * width * height) if searched > 0 and width * height > 0 else None
+    return {'hit': counts['roi_hit'], 'fallback': counts['roi_fallback'], 'area_ratio': area_ratio}
+
+# In[]:
+##################################################
+## Report progress of a video analysis
+##################################################
+'''
+Class ProgressReporter calls a progress callback at most once per interval seconds while frames are processed.
+The clock is only read every check_every frames, so update() costs a comparison in the frame loop.
+Input:
+    - callback: a function that takes one dictionary, or None to disable reporting:
+        * stage: the current stage, e.g. 'tracking'
+        * frames: number of frames processed
+        * total_frame: number of frames in the video (CAP_PROP_FRAME_COUNT, which can be inaccurate)
+        * fps: processed frames per second since the start
+        * eta: estimated seconds until all frames are processed. None if unknown.
+    - total_frame: number of frames in the video
+    - interval: minimum seconds between two calls of callback. Default value is 1.0.
+    - check_every: number of frames between two readings of the clock. Default value is 8.
+Methods:
+    - update(frames): report progress if interval seconds have passed since the last report
+    - report(frames, stage=None): report progress now, and change the stage if given
+'''
+class ProgressReporter(object):
+    def __init__(self, callback, total_frame, interval=1.0, check_every=8, stage='tracking'):
+        self.callback = callback
+        self.total_frame = total_frame
+        self.interval = interval
+        self.check_every = max(int(check_every), 1)
+        self.stage = stage
+        self.t_start = time.time()
+        self.last_report = self.t_start
+        self.next_check = self.check_every
+
+    def update(self, frames):
+        if self.callback is None or frames < self.next_check:
+            return
+        self.next_check = frames + self.check_every
+        if time.time() - self.last_report >= self.interval:
+            self.report(frames)
+
+    def report(self, frames, stage=None):
+        if self.callback is None:
+            return
+        if stage is not None:
+            self.stage = stage
+        now = time.time()
+        self.last_report = now
+        fps = frames / max(now - self.t_start, 1e-9)
+        eta = max(self.total_frame - frames, 0) / fps if fps > 0 and self.total_frame > 0 else None
+        self.callback({'stage': self.stage, 'frames': frames, 'total_frame': self.total_frame, 'fps': fps, 'eta': eta})
+
+# In[]:
+##################################################
+## Time the stages of a video analysis
+##################################################
+'''
+Class StageTimer adds up the time spent in each stage of the frame loop with a monotonic clock (time.perf_counter). Each stage has a fixed
+index in STAGES, and lap() adds to a preallocated list, so timing a frame creates no dictionaries or lists.
+    t = timer.clock()
+    check, frame = cap.read()
+    t = timer.lap(STAGE_DECODE, t)
+Stages:
+    * decode: reading and decoding frames
+    * convert: grayscale conversion of frames
+    * detect: the HOG face detector, including the resize of detect_scale
+    * track: the correlation tracker (start and update) or the landmark tracker
+    * predict: the 68 point shape predictor
+    * draw: drawing positions and trackers on frames
+    * encode: encoding and writing the marked video
+Methods:
+    - clock(): the current time
+    - lap(stage, t): add the time since t to stage and return the current time
+    - merge(other): add the times of another StageTimer, or of the dictionary returned by seconds()
+    - seconds(): a dictionary of stage name: seconds
+'''
+STAGE_NAMES = ('decode', 'convert', 'detect', 'track', 'predict', 'draw', 'encode')
+STAGE_DECODE, STAGE_CONVERT, STAGE_DETECT, STAGE_TRACK, STAGE_PREDICT, STAGE_DRAW, STAGE_ENCODE = range(len(STAGE_NAMES))
+
+class StageTimer(object):
+    STAGES = STAGE_NAMES
+
+    def __init__(self):
+        self.totals = [0.0] * len(self.STAGES)
+        self.clock = time.perf_counter
+
+    def lap(self, stage, t):
+        now = self.clock()
+        self.totals[stage] += now - t
+        return now
+
+    def merge(self, other):
+        seconds = other.seconds() if isinstance(other, StageTimer) else other
+        for i, stage in enumerate(self.STAGES):
+            self.totals[i] += seconds.get(stage, 0.0)
+        return self
+
+    def seconds(self):
+        return dict(zip(self.STAGES, self.totals))
 
 # In[]:
 ##################################################
@@ -41,6 +622,16 @@ Input:
     - save_video: a boolean with default value as False. If True, then a copy of video with facial marks will be created.
     - save_path: Specify the full path (including filename and extension) to store the marked video. By default, the same directory of source video is used.
                 Suffix '_marked' is added to the source video name. Video format is .mp4
+    - track_param: a dictionary that controls how often the face detector runs. See FrameAnalyzer for possible values. The default value is {},
+                which runs the detector on every frame.
+    - workers: number of worker processes. Default value is 1. If larger than 1, face_68_tracker_parallel is used and verbose only prints progress.
+    - chunk_size: number of frames per chunk when workers is larger than 1. See face_68_tracker_parallel.
+    - pipeline: a boolean with default value as False. If True, face_68_tracker_pipeline is used: decoding, analysis and writing run in
+                separate threads. verbose only prints progress.
+    - analysis_workers: number of analysis threads when pipeline is True. See face_68_tracker_pipeline.
+    - progress: a function called with the progress of the analysis (see ProgressReporter), at most once per progress_interval seconds,
+                and once more when all frames are processed. Default value is None.
+    - progress_interval: minimum seconds between two calls of progress. Default value is 1.0.
 Output:
     - summary: a dictionary that contains meta data of the video:
         * total_frame: number of frames in total
@@ -49,14 +640,36 @@ Output:
         * width: width of the frame
         * height: height of the frame
         * interupt: whether the processing has been interupted
-    - face_tracker: a dictionary that contains face details:
-        * start_times: a list of the start time for each frame
-        * head_positions: a list of dlib.rectangle object with (left, top, right, bottom) cordinate of the face for each frame
-        * tracker_shapes: a list of dlib.full_object_detection object with 68 tracker postions of the face for each frame
-        * tracker_coords: Each value in the list corresponds to a frame. The value is a list of tuples that covers the x-y coordinates of all trackers
+        * detected_frame: number of frames where the face is located by the detector
+        * tracked_frame: number of frames where the face is followed by the tracker
+        * redetect: a dictionary with the number of detections by trigger (see FrameAnalyzer.counts)
+        * multi_face_frame: number of detections that found more than one face. See track_param['multi_face'] of FrameAnalyzer.
+        * face_num: number of distinct faces when track_param['multi_face'] is 'all', otherwise 0
+        * roi: detections in the crop of track_param['roi_margin'] (see FrameAnalyzer): a dictionary with hit (face found in the crop),
+            fallback (whole frame searched after the crop) and area_ratio (average area of the crops divided by the frame area)
+        * skipped_frame: number of near-duplicate frames that reused the face of the previous analyzed frame (see track_param['duplicate_thresh'])
+        * stages: a dictionary of seconds spent in each stage of the analysis (see StageTimer)
+    - face_tracker: a FaceTrackerResult that contains face details in compact arrays (see FaceTrackerResult):
+        * start_times: the start time for each frame
+        * boxes: (left, top, right, bottom) cordinate of the face for each frame. face_tracker['head_positions'] returns the same array
+        * landmarks: x-y coordinates of the 68 trackers for each frame. face_tracker['tracker_coords'] returns the same array
+        * valid: whether a face is detected in each frame
+        * source: whether the face of each frame is detected or tracked
+        * faces: results of each face id when track_param['multi_face'] is 'all'
     - errors: a list of errors generated during analysis
 '''
-def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=False, save_path=None):
+def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=False, save_path=None, track_param={}, workers=1, chunk_size=None,
+                    pipeline=False, analysis_workers=1, progress=None, progress_interval=1.0):
+
+    # split the video across worker processes
+    if workers != 1:
+        return face_68_tracker_parallel(video_path, workers=workers, chunk_size=chunk_size, save_video=save_video, save_path=save_path,
+                                        track_param=track_param, verbose=verbose, progress=progress, progress_interval=progress_interval)
+    # overlap decoding, analysis and writing in threads
+    if pipeline:
+        return face_68_tracker_pipeline(video_path, save_video=save_video, save_path=save_path, track_param=track_param,
+                                        analysis_workers=analysis_workers, verbose=verbose, progress=progress,
+                                        progress_interval=progress_interval)
     
     t_start = time.time()
     if verbose:
@@ -66,9 +679,12 @@ def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=F
     
     # initialize output
     summary = {}
-    face_tracker = {'start_times':[], 'head_positions':[], 'tracker_shapes':[],'tracker_coords':[]}
+    face_tracker = FaceTrackerResult()
     errors = []
     interupt = False
+    analyzer = FrameAnalyzer(track_param)
+    if len(analyzer.unused_param) > 0:
+        errors.append('Warning: there are unused arguments in track_param: %s' % analyzer.unused_param)
     
     # capture the video for analysis
     cap = cv2.VideoCapture(video_path)
@@ -79,6 +695,8 @@ def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=F
         fps= float(cap.get(cv2.CAP_PROP_FPS))
         width= int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height= int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # preallocate arrays for all frames
+        face_tracker = FaceTrackerResult(capacity=total_frame)
     else:
         # return error message
         errors.append("Analysis failed. Video file cannot be accessed: %s" % video_path)
@@ -86,75 +704,48 @@ def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=F
     
     # create a videoWriter if save value is true
     if save_video:
-        if save_path is None:
-            # split video path and file name
-            source_path, source_name = os.path.split(video_path)
-            # split source_name into video name and extension
-            video_name, video_extension = os.path.splitext(source_name)
-            # full path of saved video
-            save_path = source_path + '/' + video_name + "_marked.mp4"
-        else:
-            # create directory for save_path
-            save_dir, save_name = os.path.split(save_path)
-            # makedirs() allows making multi-level directory
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir)
-        # save video
-        # MP4V for mp4; XVID for avi
-#        fourcc = cv2.VideoWriter_fourcc(*'MP4V')
-#        out = cv2.VideoWriter(save_path, fourcc, fps, (width,height))
-        out = cv2.VideoWriter(save_path, 0x00000021, fps, (width,height))
+        out = open_video_writer(video_path, save_path, fps, width, height)
     
     # initialize frame counter 
     f_count = 0
+    reporter = ProgressReporter(progress, total_frame, progress_interval)
+    reporter.report(0)
     
+    timer = analyzer.timer
     while(cap.isOpened()):
         # initialize values
         pos = None
         shape = None
      
         # read each frame
+        t = timer.clock()
         check, source_frame = cap.read() # frame is in BGR 
+        timer.lap(STAGE_DECODE, t)
         if check:
             # make a copy of source_frame
             frame = source_frame
             
             # calculate frame start_time
             start_time = f_count / fps
-            f_count += 1
                    
-            # detect face area in the frame. the second parameter specifies number of times for upsampling. this will enlarge the frame to detect more faces
-            dets = detector(frame, 0)
-            
-            # throw an error message when more than one face is dected.
-            if len(dets) == 1:
-                # detect facial trackers
-                pos = dets[0]
-                shape = predictor(frame, pos)
-                
-                # convert coordinates of tacker into tuple
-                points=[]
-                for i in range(68):
-                    points.append((shape.part(i).x, shape.part(i).y))
-                
-            elif len(dets) == 0:
-                pass
-
-            else:
-                raise Exception("More than one face is dected in video.")
+            # detect or track face area in the frame, then detect facial trackers
+            pos, shape, source, faces = analyzer.process(frame, f_count)
             
             # store face trackers
-            face_tracker['start_times'].append(start_time)
-            face_tracker['head_positions'].append(pos)
-            face_tracker['tracker_shapes'].append(shape)
-            face_tracker['tracker_coords'].append(points)
+            face_tracker.append(start_time, pos, shape, source)
+            for face_id, face_pos, face_shape in faces:
+                face_tracker.add_face(face_id, f_count, face_pos, face_shape, source)
+            f_count += 1
+            reporter.update(f_count)
             
             # display and save frame based on parameter
             if verbose or save_video:       
+                t = timer.clock()
                 # draw facial position on frame; color is BGR
                 frame = draw_dets(frame, pos, color=(255,255,0), pt=2)            
                 # draw facial tracker on frame
                 frame = draw_shape(frame, shape, color=(255,0,0))
+                timer.lap(STAGE_DRAW, t)
                 
             if verbose:
                 # display video
@@ -162,7 +753,9 @@ def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=F
                 
             if save_video:
                 # save video
+                t = timer.clock()
                 out.write(frame)
+                timer.lap(STAGE_ENCODE, t)
                 
             # if interuption is allowed, then press 'q' to exit.
             if allow_interupt:
@@ -177,6 +770,8 @@ def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=F
     if save_video:
         out.release()
     cv2.destroyAllWindows()
+    face_tracker.trim()
+    reporter.report(f_count)
     
     # store output
     summary['total_frame'] = total_frame
@@ -185,6 +780,17 @@ def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=F
     summary['width'] = width
     summary['height'] = height
     summary['interupt'] = interupt
+    summary['detected_frame'] = analyzer.counts['detected']
+    summary['tracked_frame'] = analyzer.counts['tracked']
+    summary['redetect'] = {key: analyzer.counts[key] for key in ['scheduled', 'no_face', 'low_quality', 'scale_change']}
+    summary['multi_face_frame'] = analyzer.counts['multi_face']
+    summary['roi'] = roi_summary(analyzer.counts, width, height)
+    summary['skipped_frame'] = analyzer.counts['duplicate']
+    summary['face_num'] = len(face_tracker.faces)
+    summary['stages'] = timer.seconds()
+    if analyzer.counts['multi_face'] > 0:
+        errors.append('Warning: more than one face is detected in %d frames. The %s face is analyzed.'
+                      % (analyzer.counts['multi_face'], 'nearest' if analyzer.multi_face == 'all' else analyzer.multi_face))
     
     # print processing time
     t_end = time.time()
@@ -195,6 +801,711 @@ def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=F
     
     return summary, face_tracker, errors
 
+# In[]:
+##################################################
+## Track the face with pipelined decode / analysis / write stages
+##################################################
+'''
+Function face_68_tracker_pipeline runs the stages of face_68_tracker in separate threads joined by bounded queues, so that decoding and
+encoding overlap with face detection (OpenCV and dlib release the GIL while they work):
+    reader thread -> queue -> analysis worker thread(s) -> queue -> writer thread (restores frame order, stores trackers, draws and writes frames)
+The queues hold at most queue_size frames each, so memory stays flat regardless of the length of the video.
+Input:
+    - video_path, save_video, save_path, track_param, verbose, progress, progress_interval: same as face_68_tracker.
+    - analysis_workers: number of analysis threads. Default value is 1. Tracking between detections needs the previous frame, so more than
+                one analysis thread is only allowed when the detector runs on every frame (track_param['detect_every'] is 1). The result of
+                track_param['roi_margin'], track_param['duplicate_thresh'] and multi_face 'nearest' also depends on the previous frame an
+                analyzer has seen, which would depend on the scheduling of the threads, so frames are analyzed in one thread when any of
+                them is used (with a warning in errors).
+    - queue_size: the maximum number of frames waiting in each queue. Default value is 32.
+Output:
+    - summary, face_tracker, errors: same as face_68_tracker. summary has an additional key:
+        * pipeline: a dictionary with, for each stage ('decode', 'analysis', 'write'):
+            busy_seconds: time spent working (not waiting on queues), summed over the threads of the stage
+            utilisation: busy_seconds divided by wall time and by number of threads. The stage closest to 1 is the bottleneck.
+'''
+def face_68_tracker_pipeline(video_path, save_video=False, save_path=None, track_param={}, analysis_workers=1, queue_size=32, verbose=False,
+                             progress=None, progress_interval=1.0):
+
+    t_start = time.perf_counter()
+    summary = {}
+    face_tracker = FaceTrackerResult()
+    errors = []
+
+    cap = cv2.VideoCapture(video_path)
+    if(cap.isOpened()):
+        total_frame = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps= float(cap.get(cv2.CAP_PROP_FPS))
+        width= int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height= int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        face_tracker = FaceTrackerResult(capacity=total_frame)
+    else:
+        errors.append("Analysis failed. Video file cannot be accessed: %s" % video_path)
+        return summary, face_tracker, errors
+
+    # one analyzer per analysis thread
+    analyzers = [FrameAnalyzer(track_param)]
+    analysis_workers = max(int(analysis_workers), 1)
+    if analysis_workers > 1 and (analyzers[0].roi_margin > 0 or analyzers[0].duplicate_thresh > 0 or analyzers[0].multi_face == 'nearest'):
+        errors.append('Warning: roi_margin, duplicate_thresh and multi_face nearest depend on the previous frame; frames are analyzed in one thread.')
+        analysis_workers = 1
+    analyzers += [FrameAnalyzer(track_param) for _ in range(analysis_workers - 1)]
+    if len(analyzers) > 1 and analyzers[0].detect_every != 1:
+        cap.release()
+        raise ValueError("More than one analysis worker requires detect_every to be 1")
+    if len(analyzers) > 1 and analyzers[0].multi_face == 'all':
+        cap.release()
+        raise ValueError("More than one analysis worker cannot keep face ids: multi_face cannot be 'all'")
+    if len(analyzers[0].unused_param) > 0:
+        errors.append('Warning: there are unused arguments in track_param: %s' % analyzers[0].unused_param)
+    if save_video:
+        out = open_video_writer(video_path, save_path, fps, width, height)
+    reporter = ProgressReporter(progress, total_frame, progress_interval)
+    reporter.report(0)
+
+    frame_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event() # set when any stage fails
+    failures = []
+    busy = {'decode': 0.0, 'analysis': [0.0] * len(analyzers), 'write': 0.0}
+    # stages of the reader and writer threads; the analysis threads time their stages in their analyzers
+    read_timer = StageTimer()
+    write_timer = StageTimer()
+    DONE = None # marks the end of the stream in a queue
+
+    # put an item in a queue unless the pipeline is stopped
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # get an item from a queue unless the pipeline is stopped
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return DONE
+
+    def read_frames():
+        try:
+            f_count = 0
+            while True:
+                t = read_timer.clock()
+                check, frame = cap.read() # frame is in BGR
+                busy['decode'] += read_timer.lap(STAGE_DECODE, t) - t
+                if not check or not put(frame_queue, (f_count, frame)):
+                    break
+                f_count += 1
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+        finally:
+            for _ in analyzers:
+                put(frame_queue, DONE)
+
+    def analyze_frames(w):
+        analyzer = analyzers[w]
+        try:
+            while True:
+                item = get(frame_queue)
+                if item is DONE:
+                    break
+                f_index, frame = item
+                t = time.perf_counter()
+                pos, shape, source, faces = analyzer.process(frame, f_index)
+                busy['analysis'][w] += time.perf_counter() - t
+                if not put(result_queue, (f_index, frame, pos, shape, source, faces)):
+                    break
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+        finally:
+            put(result_queue, DONE)
+
+    def write_frames():
+        pending = {} # results that arrived before their preceding frames
+        next_index = 0
+        finished = 0
+        try:
+            while finished < len(analyzers):
+                item = get(result_queue)
+                if item is DONE:
+                    if stop.is_set():
+                        break
+                    finished += 1
+                    continue
+                pending[item[0]] = item
+                t = time.perf_counter()
+                while next_index in pending:
+                    f_index, frame, pos, shape, source, faces = pending.pop(next_index)
+                    face_tracker.append(f_index / fps, pos, shape, source)
+                    for face_id, face_pos, face_shape in faces:
+                        face_tracker.add_face(face_id, f_index, face_pos, face_shape, source)
+                    if save_video:
+                        # draw facial position and trackers on frame; color is BGR
+                        t_draw = write_timer.clock()
+                        frame = draw_dets(frame, pos, color=(255,255,0), pt=2)
+                        frame = draw_shape(frame, shape, color=(255,0,0))
+                        t_draw = write_timer.lap(STAGE_DRAW, t_draw)
+                        out.write(frame)
+                        write_timer.lap(STAGE_ENCODE, t_draw)
+                    next_index += 1
+                busy['write'] += time.perf_counter() - t
+                reporter.update(next_index)
+        except Exception as e:
+            failures.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=read_frames)]
+    threads += [threading.Thread(target=analyze_frames, args=(w,)) for w in range(len(analyzers))]
+    threads += [threading.Thread(target=write_frames)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cap.release()
+    if save_video:
+        out.release()
+    if failures:
+        raise failures[0]
+    face_tracker.trim()
+    reporter.report(len(face_tracker))
+
+    wall = max(time.perf_counter() - t_start, 1e-9)
+    counts = {}
+    for analyzer in analyzers:
+        for key in analyzer.counts:
+            counts[key] = counts.get(key, 0) + analyzer.counts[key]
+
+    summary['total_frame'] = total_frame
+    summary['processed_frame'] = len(face_tracker)
+    summary['fps'] = fps
+    summary['width'] = width
+    summary['height'] = height
+    summary['interupt'] = False
+    summary['detected_frame'] = counts['detected']
+    summary['tracked_frame'] = counts['tracked']
+    summary['redetect'] = {key: counts[key] for key in ['scheduled', 'no_face', 'low_quality', 'scale_change']}
+    summary['multi_face_frame'] = counts['multi_face']
+    summary['roi'] = roi_summary(counts, width, height)
+    summary['skipped_frame'] = counts['duplicate']
+    summary['face_num'] = len(face_tracker.faces)
+    if counts['multi_face'] > 0:
+        errors.append('Warning: more than one face is detected in %d frames. The %s face is analyzed.'
+                      % (counts['multi_face'], 'nearest' if analyzers[0].multi_face == 'all' else analyzers[0].multi_face))
+    timer = read_timer.merge(write_timer)
+    for analyzer in analyzers:
+        timer.merge(analyzer.timer)
+    # stage times are summed over threads, so they can add up to more than the wall time
+    summary['stages'] = timer.seconds()
+    summary['pipeline'] = {'decode': {'busy_seconds': busy['decode'], 'utilisation': busy['decode'] / wall},
+                           'analysis': {'busy_seconds': sum(busy['analysis']), 'utilisation': sum(busy['analysis']) / wall / len(analyzers)},
+                           'write': {'busy_seconds': busy['write'], 'utilisation': busy['write'] / wall},
+                           }
+
+    if verbose:
+        print("Process Completed")
+        print("Total frames: %d; Processing time: %.2fs" % (len(face_tracker), wall))
+        for stage in ['decode', 'analysis', 'write']:
+            print("Stage %s: %.0f%% busy" % (stage, 100 * summary['pipeline'][stage]['utilisation']))
+
+    return summary, face_tracker, errors
+
+# In[]:
+##################################################
+## Track the face in chunks of a video across several processes
+##################################################
+'''
+Function face_68_tracker_parallel splits the frames of a video into chunks and tracks the face of each chunk in a separate worker process.
+Each worker opens its own cv2.VideoCapture and seeks to the first frame of its chunk. The per-chunk arrays are merged in frame order.
+Every chunk starts with a detection. chunk_size is rounded up to a multiple of track_param['detect_every'], so that the detector runs
+on the same frames as in face_68_tracker and the result is identical to the sequential path, unless track_param['roi_margin'] or
+track_param['duplicate_thresh'] is used: each chunk starts without the last known face and the previous analyzed frame, so its first frame is
+searched in the whole frame and never reused, and the boxes and trackers can differ from face_68_tracker from there on.
+In a daemonic process (e.g. a pool worker of analyze_batch), which cannot start worker processes, the chunks are tracked one after another
+in the process itself, with the same result.
+Input:
+    - video_path: full path of video for analysis.
+    - workers: number of worker processes. Default value is the number of CPUs.
+    - chunk_size: number of frames per chunk. Default value splits the video into 4 chunks per worker.
+    - save_video, save_path: same as face_68_tracker. The marked video is rendered from the merged arrays once all chunks are done.
+    - track_param: same as face_68_tracker.
+    - verbose: a boolean with default value as False. If True, progress of chunks is printed.
+    - progress, progress_interval: same as face_68_tracker. Progress is reported when chunks are completed.
+Output:
+    - summary, face_tracker, errors: same as face_68_tracker. summary has an additional key:
+        * chunks: a list of dictionaries with start, stop, processed_frame and seconds of each chunk, in frame order
+'''
+def face_68_tracker_parallel(video_path, workers=None, chunk_size=None, save_video=False, save_path=None, track_param={}, verbose=False,
+                             progress=None, progress_interval=1.0):
+
+    t_start = time.time()
+    summary = {}
+    face_tracker = FaceTrackerResult()
+    errors = []
+
+    # read the meta data of the video
+    cap = cv2.VideoCapture(video_path)
+    if(cap.isOpened()):
+        total_frame = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps= float(cap.get(cv2.CAP_PROP_FPS))
+        width= int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height= int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+    else:
+        errors.append("Analysis failed. Video file cannot be accessed: %s" % video_path)
+        return summary, face_tracker, errors
+
+    # validate track_param once in the main process
+    analyzer = FrameAnalyzer(track_param)
+    if len(analyzer.unused_param) > 0:
+        errors.append('Warning: there are unused arguments in track_param: %s' % analyzer.unused_param)
+    # 'nearest' and 'all' follow the face across chunk boundaries, which a worker cannot see
+    if analyzer.multi_face in ['nearest', 'all']:
+        raise ValueError("Multi-face policy '%s' is not supported with more than one worker" % analyzer.multi_face)
+
+    reporter = ProgressReporter(progress, total_frame, progress_interval, check_every=1)
+    reporter.report(0)
+
+    # split frames into chunks aligned with the detection schedule
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if chunk_size is None:
+        chunk_size = int(np.ceil(max(total_frame, 1) / float(workers * 4)))
+    chunk_size = int(np.ceil(max(chunk_size, 1) / float(analyzer.detect_every))) * analyzer.detect_every
+    starts = list(range(0, max(total_frame, 1), chunk_size))
+    # the last chunk reads until the end of the stream, since CAP_PROP_FRAME_COUNT can be inaccurate
+    tasks = [(video_path, start, start + chunk_size if i < len(starts)-1 else None, fps, track_param) for i, start in enumerate(starts)]
+
+    # track chunks in worker processes and collect results in frame order
+    chunk_results = []
+    if multiprocessing.current_process().daemon:
+        pool = None
+        results = map(_track_chunk, tasks)
+    else:
+        # load models once per worker. workers forked after preload() share the models of the parent process
+        pool = multiprocessing.Pool(processes=min(workers, len(tasks)), initializer=model_registry.preload)
+        results = pool.imap(_track_chunk, tasks)
+    try:
+        for result in results:
+            chunk_results.append(result)
+            reporter.update(sum(len(r['face_tracker']) for r in chunk_results))
+            if verbose:
+                print("Chunk from frame %d completed: %d frames in %.2fs" % (result['start'], len(result['face_tracker']), result['seconds']))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # merge chunks
+    face_tracker = FaceTrackerResult.concatenate([result['face_tracker'] for result in chunk_results])
+    reporter.report(len(face_tracker))
+    counts = {}
+    timer = StageTimer()
+    for result in chunk_results:
+        errors.extend(result['errors'])
+        timer.merge(result['stages'])
+        for key in result['counts']:
+            counts[key] = counts.get(key, 0) + result['counts'][key]
+
+    if save_video:
+        render_marked_video(video_path, face_tracker, save_path, timer=timer)
+
+    summary['total_frame'] = total_frame
+    summary['processed_frame'] = len(face_tracker)
+    summary['fps'] = fps
+    summary['width'] = width
+    summary['height'] = height
+    summary['interupt'] = False
+    summary['detected_frame'] = counts['detected']
+    summary['tracked_frame'] = counts['tracked']
+    summary['redetect'] = {key: counts[key] for key in ['scheduled', 'no_face', 'low_quality', 'scale_change']}
+    summary['multi_face_frame'] = counts['multi_face']
+    summary['roi'] = roi_summary(counts, width, height)
+    summary['skipped_frame'] = counts['duplicate']
+    summary['face_num'] = 0
+    # stage times are summed over processes, so they can add up to more than the wall time
+    summary['stages'] = timer.seconds()
+    if counts['multi_face'] > 0:
+        errors.append('Warning: more than one face is detected in %d frames. The %s face is analyzed.'
+                      % (counts['multi_face'], analyzer.multi_face))
+    summary['chunks'] = [{'start': result['start'], 'stop': result['start'] + len(result['face_tracker']),
+                          'processed_frame': len(result['face_tracker']), 'seconds': result['seconds']} for result in chunk_results]
+
+    if verbose:
+        print("Process Completed")
+        print("Total frames: %d; Chunks: %d; Processing time: %.2fs" % (len(face_tracker), len(chunk_results), time.time()-t_start))
+
+    return summary, face_tracker, errors
+
+# track the face from frame start (included) to frame stop (excluded) of a video. stop is None for the end of the video.
+def _track_chunk(task):
+    video_path, start, stop, fps, track_param = task
+    t_start = time.time()
+    analyzer = FrameAnalyzer(track_param)
+    face_tracker = FaceTrackerResult(capacity=(stop - start) if stop is not None else 1)
+    errors = []
+
+    cap = cv2.VideoCapture(video_path)
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        # fall back to decoding from the beginning if the backend cannot seek to the exact frame
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            cap.release()
+            cap = cv2.VideoCapture(video_path)
+            for _ in range(start):
+                cap.grab()
+
+    f_count = start
+    timer = analyzer.timer
+    while cap.isOpened() and (stop is None or f_count < stop):
+        t = timer.clock()
+        check, frame = cap.read()
+        timer.lap(STAGE_DECODE, t)
+        if not check:
+            break
+        pos, shape, source, faces = analyzer.process(frame, f_count)
+        face_tracker.append(f_count / fps, pos, shape, source)
+        f_count += 1
+    cap.release()
+
+    return {'start': start,
+            'face_tracker': face_tracker.trim(),
+            'counts': analyzer.counts,
+            'stages': timer.seconds(),
+            'errors': errors,
+            'seconds': time.time() - t_start,
+            }
+
+# In[]:
+##################################################
+## Track the face on a subset of frames, and on all frames around blinks
+##################################################
+'''
+Function face_68_tracker_adaptive analyzes a subset of frames, and all frames only where a blink is possible. Blinks last 100-400ms, i.e.
+6 to 24 frames of a 60fps video, so most frames of a video are far from any blink.
+    1. coarse pass: every sample_every-th frame is decoded and analyzed. The frames in between are skipped with cap.grab(), which does not
+        convert them to BGR (compressed frames still have to be decoded by the codec, as later frames depend on them).
+    2. the eye aspect ratio of the sampled frames is compared with the thresholds of blink_param (see detect_blink), calculated from the
+        sampled frames. A sampled frame is near the threshold when its ratio is below (1 + near_margin) times its threshold.
+    3. refine pass: the frames between a sampled frame near the threshold and its neighbouring samples are decoded and analyzed. Other
+        frames are skipped with cap.grab(), and decoding stops after the last refined frame.
+Frames that are neither sampled nor refined hold the box and trackers of the previous sampled frame (source SOURCE_SAMPLED), so detect_blink,
+the overlay data and the charts work on the result as on the output of face_68_tracker.
+Tolerance: with track_param['detect_every'] 1 (the default) and sample_every not larger than blink_param['consec_frame'], every run of closed
+eyes long enough to be counted contains a sampled frame, and all frames of the run and the frame after it are refined, as long as the
+eye aspect ratio of that sampled frame is below (1 + near_margin) times the threshold estimated from the sampled frames. Refined frames are
+identical to the dense analysis, so the blink count of detect_blink on the result differs from the dense analysis only through thresholds:
+the automatic thresholds are calculated from all frames of the result, where held frames repeat the ratio of sampled frames. The size of
+that difference has not been measured: compare the adaptive and dense counts (blink_count and blink_count_dense) of the
+face_68_tracker_adaptive case of MLmodels.benchmark.run_suite, e.g. on the 720p_40s_60fps fixture generated from a face photo, or on your
+own videos. Larger sample_every or smaller near_margin analyze fewer frames and can miss short blinks. With detect_every larger than 1 each refined span starts with a detection, so its trackers can differ
+slightly from the dense analysis.
+Input:
+    - video_path, track_param, verbose, progress, progress_interval: same as face_68_tracker. track_param['multi_face'] cannot be 'all'.
+    - blink_param: the blink_param that detect_blink will use on the result (see detect_blink). Only the thresholds are used here.
+    - sample_param: a dictionary that contains the following optional values. The default value is {}.
+        * sample_every: analyze every sample_every-th frame in the coarse pass. Default value is 3.
+        * near_margin: sampled frames whose eye aspect ratio is below (1 + near_margin) times the threshold are refined. Default value is 0.25
+Output:
+    - summary, face_tracker, errors: same as face_68_tracker. processed_frame counts the frames covered by the result, analyzed or not.
+      summary has an additional key:
+        * sampling: a dictionary with sample_every, near_margin, sampled_frame (frames analyzed in the coarse pass), refined_frame (frames
+            analyzed in the refine pass), held_frame (frames that hold the previous sampled frame) and analyzed_ratio (share of frames analyzed)
+'''
+def face_68_tracker_adaptive(video_path, track_param={}, blink_param={}, sample_param={}, verbose=False, progress=None, progress_interval=1.0):
+
+    t_start = time.time()
+    param = dict(sample_param)
+    sample_every = max(int(param.pop('sample_every', 3)), 1)
+    near_margin = float(param.pop('near_margin', 0.25))
+    summary = {}
+    face_tracker = FaceTrackerResult()
+    errors = []
+    if len(param) > 0:
+        errors.append('Warning: there are unused arguments in sample_param: %s' % param)
+    analyzer = FrameAnalyzer(track_param)
+    if analyzer.multi_face == 'all':
+        raise ValueError("Multi-face policy 'all' is not supported with adaptive sampling")
+    if len(analyzer.unused_param) > 0:
+        errors.append('Warning: there are unused arguments in track_param: %s' % analyzer.unused_param)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        errors.append("Analysis failed. Video file cannot be accessed: %s" % video_path)
+        return summary, face_tracker, errors
+    total_frame = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = float(cap.get(cv2.CAP_PROP_FPS))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    reporter = ProgressReporter(progress, total_frame, progress_interval, stage='sampling')
+    reporter.report(0)
+
+    # coarse pass; the analyzer counts sampled frames, so detect_every applies to sampled frames
+    timer = analyzer.timer
+    sampled = FaceTrackerResult(capacity=total_frame // sample_every + 1)
+    f_count = 0
+    while True:
+        t = timer.clock()
+        if f_count % sample_every == 0:
+            check, frame = cap.read()
+        else:
+            check = cap.grab()
+        timer.lap(STAGE_DECODE, t)
+        if not check:
+            break
+        if f_count % sample_every == 0:
+            pos, shape, source, faces = analyzer.process(frame, f_count // sample_every)
+            sampled.append(f_count / fps, pos, shape, source)
+        f_count += 1
+        reporter.update(f_count)
+    cap.release()
+    frame_N = f_count
+
+    # sampled frames near the threshold of closed eyes. with less than 10 sampled faces no threshold can be estimated, so all are refined.
+    sample_index = np.arange(0, frame_N, sample_every)
+    ear = eye_ratio_batch(sampled.landmarks, sampled.valid)['both']
+    if np.count_nonzero(sampled.valid) >= 10:
+        thresholds = blink_thresholds(ear, fps / sample_every, dict(blink_param))
+        # NaN thresholds (windows with too few faces) are refined too
+        with np.errstate(invalid='ignore'):
+            near = sampled.valid & ~(ear >= np.asarray(thresholds) * (1 + near_margin))
+    else:
+        near = sampled.valid.copy()
+    refine = np.zeros(frame_N, dtype=bool)
+    for offset in range(1 - sample_every, sample_every):
+        index = sample_index[near] + offset
+        refine[index[(index >= 0) & (index < frame_N)]] = True
+    refine[sample_index] = False
+    refine_index = np.flatnonzero(refine)
+
+    # refine pass with its own analyzer; a new span starts with a detection
+    reporter.report(frame_N, stage='refining')
+    refiner = FrameAnalyzer(track_param)
+    refiner.timer = timer
+    refined = FaceTrackerResult(capacity=len(refine_index))
+    if len(refine_index) > 0:
+        cap = cv2.VideoCapture(video_path)
+        previous = -1
+        for f in range(refine_index[-1] + 1):
+            t = timer.clock()
+            if refine[f]:
+                check, frame = cap.read()
+            else:
+                check = cap.grab()
+            timer.lap(STAGE_DECODE, t)
+            if not check:
+                break
+            if refine[f]:
+                if f != previous + 1:
+                    refiner.reset()
+                pos, shape, source, faces = refiner.process(frame, f)
+                refined.append(f / fps, pos, shape, source)
+                previous = f
+        cap.release()
+        refine_index = refine_index[:len(refined)]
+
+    # frames in between hold the previous sampled frame, then sampled and refined frames are written at their index
+    hold = np.arange(frame_N) // sample_every
+    valid = sampled.valid[hold]
+    source = np.where(valid, SOURCE_SAMPLED, SOURCE_NONE).astype(np.int8)
+    source[sample_index] = sampled.source
+    boxes = sampled.boxes[hold]
+    landmarks = sampled.landmarks[hold]
+    for name, array in [('valid', valid), ('source', source), ('boxes', boxes), ('landmarks', landmarks)]:
+        array[refine_index] = getattr(refined, name)
+    face_tracker = FaceTrackerResult.from_arrays(np.arange(frame_N) / fps, boxes, landmarks, valid, source)
+    reporter.report(frame_N)
+
+    counts = dict((key, analyzer.counts[key] + refiner.counts[key]) for key in analyzer.counts)
+    analyzed = len(sampled) + len(refined)
+    summary['total_frame'] = total_frame
+    summary['processed_frame'] = frame_N
+    summary['fps'] = fps
+    summary['width'] = width
+    summary['height'] = height
+    summary['interupt'] = False
+    summary['detected_frame'] = counts['detected']
+    summary['tracked_frame'] = counts['tracked']
+    summary['redetect'] = {key: counts[key] for key in ['scheduled', 'no_face', 'low_quality', 'scale_change']}
+    summary['multi_face_frame'] = counts['multi_face']
+    summary['roi'] = roi_summary(counts, width, height)
+    summary['skipped_frame'] = counts['duplicate']
+    summary['face_num'] = 0
+    summary['stages'] = timer.seconds()
+    summary['sampling'] = {'sample_every': sample_every, 'near_margin': near_margin, 'sampled_frame': len(sampled), 'refined_frame': len(refined),
+                           'held_frame': frame_N - analyzed, 'analyzed_ratio': analyzed / float(frame_N) if frame_N > 0 else 0.0}
+    if counts['multi_face'] > 0:
+        errors.append('Warning: more than one face is detected in %d frames. The %s face is analyzed.' % (counts['multi_face'], analyzer.multi_face))
+
+    if verbose:
+        print("Process Completed")
+        print("Total frames: %d; analyzed: %d (%d sampled, %d refined)" % (frame_N, analyzed, len(sampled), len(refined)))
+        print("Processing time: %.2fs" % (time.time() - t_start))
+
+    return summary, face_tracker, errors
+
+# In[]:
+##################################################
+## Store face positions and trackers as overlay data for the browser
+##################################################
+'''
+Overlay data is a compact binary file with the face box and 68 trackers of every frame, which the browser draws on a canvas over the
+original video (see video_details.html). Records have a fixed size, so the trackers of frames [a, b) are at bytes
+[OVERLAY_HEADER_SIZE + a*OVERLAY_RECORD_SIZE, OVERLAY_HEADER_SIZE + b*OVERLAY_RECORD_SIZE) and can be fetched with an HTTP Range request.
+All values are little-endian.
+    - header (32 bytes): magic b'VALM', version (uint16), header size (uint16), record size (uint16), reserved (uint16),
+                         number of frames (uint32), fps (float32), width (uint16), height (uint16), 8 bytes of padding
+    - record of each frame (141 int16): source (see FaceTrackerResult, 0 if no face), left, top, right, bottom, x0, y0, ..., x67, y67
+'''
+OVERLAY_MAGIC = b'VALM'
+OVERLAY_VERSION = 1
+OVERLAY_HEADER = np.dtype([('magic', 'S4'), ('version', '<u2'), ('header_size', '<u2'), ('record_size', '<u2'), ('reserved', '<u2'),
+                           ('frame_count', '<u4'), ('fps', '<f4'), ('width', '<u2'), ('height', '<u2'), ('padding', 'V8')])
+OVERLAY_RECORD = np.dtype('<i2')
+OVERLAY_RECORD_LEN = 1 + 4 + 68*2
+OVERLAY_HEADER_SIZE = OVERLAY_HEADER.itemsize
+OVERLAY_RECORD_SIZE = OVERLAY_RECORD_LEN * OVERLAY_RECORD.itemsize
+
+'''
+Function write_overlay_data writes the face positions and trackers of a video as overlay data.
+Input:
+    - face_tracker: the FaceTrackerResult of the video
+    - summary: the summary from face_68_tracker(), for fps, width and height
+    - path: full path of the overlay data file
+'''
+def write_overlay_data(face_tracker, summary, path):
+    frame_N = len(face_tracker)
+    header = np.zeros(1, dtype=OVERLAY_HEADER)
+    header['magic'] = OVERLAY_MAGIC
+    header['version'] = OVERLAY_VERSION
+    header['header_size'] = OVERLAY_HEADER_SIZE
+    header['record_size'] = OVERLAY_RECORD_SIZE
+    header['frame_count'] = frame_N
+    header['fps'] = summary['fps']
+    header['width'] = summary['width']
+    header['height'] = summary['height']
+
+    records = np.zeros((frame_N, OVERLAY_RECORD_LEN), dtype=OVERLAY_RECORD)
+    records[:, 0] = np.where(face_tracker.valid, face_tracker.source, SOURCE_NONE)
+    records[:, 1:5] = face_tracker.boxes
+    records[:, 5:] = face_tracker.landmarks.reshape(frame_N, 68*2)
+
+    save_dir = os.path.dirname(path)
+    if save_dir and not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+    with open(path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(records.tobytes())
+
+'''
+Function read_overlay_data reads overlay data back as a FaceTrackerResult. The file is memory-mapped, so only the requested frames are read.
+Input:
+    - path: full path of the overlay data file
+    - start, stop: the range of frames to read. Default value is all frames.
+Output:
+    - header: a dictionary with version, frame_count, fps, width and height
+    - face_tracker: a FaceTrackerResult of frames [start, stop)
+'''
+def read_overlay_data(path, start=0, stop=None):
+    header = np.fromfile(path, dtype=OVERLAY_HEADER, count=1)
+    if len(header) == 0 or header['magic'][0] != OVERLAY_MAGIC:
+        raise ValueError("Invalid overlay data: %s" % path)
+    header = {name: header[name][0].item() for name in ['version', 'frame_count', 'fps', 'width', 'height', 'header_size', 'record_size']}
+    frame_N = header['frame_count']
+    stop = frame_N if stop is None else min(stop, frame_N)
+    start = min(max(start, 0), stop)
+
+    records = np.memmap(path, dtype=OVERLAY_RECORD, mode='r', offset=header['header_size'], shape=(frame_N, OVERLAY_RECORD_LEN))[start:stop]
+    face_tracker = FaceTrackerResult.from_arrays(start_times=np.arange(start, stop) / header['fps'],
+                                                 boxes=records[:, 1:5],
+                                                 landmarks=records[:, 5:].reshape(-1, 68, 2),
+                                                 valid=records[:, 0] != SOURCE_NONE,
+                                                 source=records[:, 0])
+    return header, face_tracker
+
+# In[]:
+##################################################
+## Write a copy of video with facial marks
+##################################################
+'''
+Function open_video_writer creates a cv2.VideoWriter for the marked copy of a video.
+Input:
+    - video_path: full path of the source video.
+    - save_path: full path (including filename and extension) of the marked video. If None, suffix '_marked' is added to the source video name
+                in the same directory. Video format is .mp4
+    - fps, width, height: frame rate and frame size of the source video
+Output:
+    - out: the cv2.VideoWriter
+'''
+def open_video_writer(video_path, save_path, fps, width, height):
+    if save_path is None:
+        # split video path and file name
+        source_path, source_name = os.path.split(video_path)
+        # split source_name into video name and extension
+        video_name, video_extension = os.path.splitext(source_name)
+        # full path of saved video
+        save_path = source_path + '/' + video_name + "_marked.mp4"
+    else:
+        # create directory for save_path
+        save_dir, save_name = os.path.split(save_path)
+        # makedirs() allows making multi-level directory
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+    # save video
+    # MP4V for mp4; XVID for avi
+#    fourcc = cv2.VideoWriter_fourcc(*'MP4V')
+#    out = cv2.VideoWriter(save_path, fourcc, fps, (width,height))
+    out = cv2.VideoWriter(save_path, 0x00000021, fps, (width,height))
+    return out
+
+'''
+Function render_marked_video writes a copy of video with the face positions and trackers stored in face_tracker, without running any detection.
+Input:
+    - video_path: full path of the source video.
+    - face_tracker: the FaceTrackerResult of the video.
+    - save_path: same as open_video_writer.
+    - timer: a StageTimer that the decode, draw and encode times are added to. The default value is None.
+'''
+def render_marked_video(video_path, face_tracker, save_path=None, timer=None):
+    cap = cv2.VideoCapture(video_path)
+    fps= float(cap.get(cv2.CAP_PROP_FPS))
+    width= int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height= int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    out = open_video_writer(video_path, save_path, fps, width, height)
+
+    boxes = face_tracker.boxes
+    landmarks = face_tracker.landmarks
+    valid = face_tracker.valid
+    if timer is None:
+        timer = StageTimer()
+    f_count = 0
+    while cap.isOpened():
+        t = timer.clock()
+        check, frame = cap.read()
+        t = timer.lap(STAGE_DECODE, t)
+        if not check:
+            break
+        if f_count < len(face_tracker) and valid[f_count]:
+            # draw facial position and trackers on frame; color is BGR
+            frame = draw_dets(frame, boxes[f_count], color=(255,255,0), pt=2)
+            frame = draw_shape(frame, landmarks[f_count], color=(255,0,0))
+            t = timer.lap(STAGE_DRAW, t)
+        out.write(frame)
+        timer.lap(STAGE_ENCODE, t)
+        f_count += 1
+
+    cap.release()
+    out.release()
+
 # In[]:
 ##################################################
 ## Use OpenCV to draw facial position and details on frame image
@@ -203,7 +1514,7 @@ def face_68_tracker(video_path, verbose=True, allow_interupt=False, save_video=F
 Function draw_dets draws a rectangle around the face in the frame image
 Input:
     - img: targe frame image
-    - dets: dlib.rectangle object for the target frame
+    - dets: dlib.rectangle object for the target frame, or an array of (left, top, right, bottom) coordinate
     - color: BGR color of the rectangle
     - pt: thickness of line
 Output:
@@ -213,12 +1524,16 @@ def draw_dets(img, dets, color=(0,0,0), pt=1): # color is in BGR order
     out_img = img
     
     # return original image if dets is None
-    if dets == None:
+    if dets is None:
         return out_img
     
     # identify top-left and bottom-right corner of rectangle
-    left_top = (dets.left(), dets.top())
-    right_bottom = (dets.right(), dets.bottom())
+    if isinstance(dets, np.ndarray):
+        left_top = (int(dets[0]), int(dets[1]))
+        right_bottom = (int(dets[2]), int(dets[3]))
+    else:
+        left_top = (dets.left(), dets.top())
+        right_bottom = (dets.right(), dets.bottom())
     
     # add rectangle to image
     out_img = cv2.rectangle(img, left_top, right_bottom, color, pt)
@@ -229,7 +1544,7 @@ def draw_dets(img, dets, color=(0,0,0), pt=1): # color is in BGR order
 Function draw_shape draws the outline of face details on frame
 Input:
     - img: targe frame image
-    - shape: dlib.full_object_detection object for the target frame
+    - shape: dlib.full_object_detection object for the target frame, or an array (68,2) of the x-y coordinates of the trackers
     - color: BGR color of the rectangle
     - pt: thickness of line
 Output:
@@ -239,13 +1554,16 @@ def draw_shape(img, shape, color=(0,0,0), pt=1):
     out_img = img
     
     # return original image if shape is None
-    if shape == None:
+    if shape is None:
         return out_img
     
     points=[]
     for i in range(68):
         # convert shape.part to tuple cordination
-        points.append((shape.part(i).x, shape.part(i).y))
+        if isinstance(shape, np.ndarray):
+            points.append((int(shape[i,0]), int(shape[i,1])))
+        else:
+            points.append((shape.part(i).x, shape.part(i).y))
         
         # connect trackers in sequence
         if i in [0,17,22,27,36,42,48,60]:
@@ -302,6 +1620,201 @@ def eye_ratio_calc(tracker_coord, method='both'):
     eye_ratio = (right_eye_ratio + left_eye_ratio) * 0.5
     return eye_ratio
 
+'''
+Function eye_ratio_batch calculates eye_aspect_ratio of all frames of a video at once. It gives the same values as eye_ratio_calc.
+Input:
+    - landmarks: an array (N,68,2) of the x-y coordinates of the 68 facial trackers in each frame, e.g. FaceTrackerResult.landmarks
+    - valid: an optional bool array (N,) indicating frames with a detected face. The ratio of other frames is NaN.
+Output:
+    - eye_ratio: a dictionary of arrays (N,) with the eye aspect ratio of each frame:
+        * right: ratio of the right eye
+        * left: ratio of the left eye
+        * both: average ratio of both eyes
+'''
+# tracker indices of (upper, lower) eyelid pairs and (inner, outer) eye corners; right eye first, then left eye
+EYE_HEIGHT_PAIRS = ([37, 38, 43, 44], [41, 40, 47, 46])
+EYE_WIDTH_PAIRS = ([36, 42], [39, 45])
+
+def eye_ratio_batch(landmarks, valid=None):
+    landmarks = np.asarray(landmarks).reshape(-1, 68, 2)
+    # only the 12 eye trackers are converted to float
+    eyes = landmarks[:, 36:48].astype(np.float64)
+    upper, lower = np.array(EYE_HEIGHT_PAIRS) - 36
+    inner, outer = np.array(EYE_WIDTH_PAIRS) - 36
+
+    # eyelid distances (N,4) and eye widths (N,2), right eye first
+    heights = np.sqrt(((eyes[:, upper] - eyes[:, lower]) ** 2).sum(axis=2))
+    widths = np.sqrt(((eyes[:, inner] - eyes[:, outer]) ** 2).sum(axis=2))
+    # frames without a face have zero widths; their ratio is set to NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = (heights[:, 0::2] + heights[:, 1::2]) * 0.5 / widths
+    if valid is not None:
+        ratios[~np.asarray(valid, dtype=bool)] = np.nan
+    ratios[~np.isfinite(ratios)] = np.nan
+
+    eye_ratio = {'right': ratios[:, 0],
+                 'left': ratios[:, 1],
+                 'both': (ratios[:, 0] + ratios[:, 1]) * 0.5}
+    return eye_ratio
+
+'''
+Function window_thresholds calculates the threshold of closed eyes for each frame within an adjacent window of the frame. For frame f, the window
+covers frames [max(0, f-adj_f), min(N-1, f+adj_f)) and the threshold is min + (kth_max - min) * auto_thresh_qt, where min and kth_max are the
+smallest and the 10th largest eye aspect ratio in the window. Frames without a face (NaN) are ignored. The threshold is NaN if the window has
+less than 10 frames with a face.
+Input:
+    - eye_aspect_ratio: an array (N,) of eye aspect ratio of each frame
+    - adj_f: number of adjacent frames before and after each frame
+    - auto_thresh_qt: the lower quantile between min and kth_max used as threshold
+    - engine: the method used for the calculation. All engines return the same thresholds.
+        * 'heap': a sliding minimum and a sliding k-th largest value maintained incrementally with a monotonic deque and two heaps. O(N log W).
+        * 'vectorized': numpy partition over a strided view of all windows, in blocks of frames. O(N W) but without python loops.
+        * 'naive': slice and partition the window of every frame. O(N W); kept as reference.
+    - k: the k-th largest value is used as maximum, in order to avoid outliers. Default value is 10.
+Output:
+    - thresholds: an array (N,) of the threshold of each frame
+'''
+def window_thresholds(eye_aspect_ratio, adj_f, auto_thresh_qt, engine='heap', k=10):
+    ear = np.asarray(eye_aspect_ratio, dtype=np.float64)
+    if engine == 'heap':
+        ear_min, ear_max = _window_min_max_heap(ear, adj_f, k)
+    elif engine == 'vectorized':
+        ear_min, ear_max = _window_min_max_vectorized(ear, adj_f, k)
+    elif engine == 'naive':
+        ear_min, ear_max = _window_min_max_naive(ear, adj_f, k)
+    else:
+        raise ValueError("Invalid threshold engine: %s" % engine)
+    return ear_min + (ear_max - ear_min) * auto_thresh_qt
+
+# window bounds of each frame
+def _window_bounds(frame_N, adj_f):
+    f = np.arange(frame_N)
+    lb = np.maximum(0, f - adj_f)
+    ub = np.maximum(lb, np.minimum(frame_N - 1, f + adj_f))
+    return lb, ub
+
+# reference implementation: partition the window of every frame
+def _window_min_max_naive(ear, adj_f, k):
+    frame_N = len(ear)
+    ear_min = np.full(frame_N, np.nan)
+    ear_max = np.full(frame_N, np.nan)
+    lb, ub = _window_bounds(frame_N, adj_f)
+    for f in range(frame_N):
+        adj_ear = ear[lb[f]:ub[f]]
+        adj_ear = adj_ear[~np.isnan(adj_ear)]
+        if len(adj_ear) >= k:
+            ear_max[f] = np.partition(adj_ear, -k)[-k]
+            ear_min[f] = np.min(adj_ear)
+    return ear_min, ear_max
+
+# sliding minimum with a monotonic deque, and sliding k-th largest with two heaps and lazy deletion
+def _window_min_max_heap(ear, adj_f, k):
+    frame_N = len(ear)
+    ear_min = np.full(frame_N, np.nan)
+    ear_max = np.full(frame_N, np.nan)
+    lb, ub = _window_bounds(frame_N, adj_f)
+    is_valid = ~np.isnan(ear)
+    values = ear.tolist()
+
+    min_deque = collections.deque() # indices of increasing values; the front is the window minimum
+    top = [] # min-heap of (value, index) of the k largest values in the window
+    rest = [] # max-heap of (-value, -index) of the other values in the window
+    in_top = np.zeros(frame_N, dtype=bool)
+    removed = np.zeros(frame_N, dtype=bool)
+    sizes = [0, 0] # number of live entries in top and rest
+
+    def clean():
+        while top and removed[top[0][1]]:
+            heapq.heappop(top)
+        while rest and removed[-rest[0][1]]:
+            heapq.heappop(rest)
+
+    def rebalance():
+        clean()
+        while sizes[0] > k:
+            v, i = heapq.heappop(top)
+            in_top[i] = False
+            heapq.heappush(rest, (-v, -i))
+            sizes[0] -= 1
+            sizes[1] += 1
+            clean()
+        while sizes[0] < k and sizes[1] > 0:
+            v, i = heapq.heappop(rest)
+            in_top[-i] = True
+            heapq.heappush(top, (-v, -i))
+            sizes[0] += 1
+            sizes[1] -= 1
+            clean()
+
+    def add(i):
+        v = values[i]
+        while min_deque and values[min_deque[-1]] >= v:
+            min_deque.pop()
+        min_deque.append(i)
+        clean()
+        if sizes[0] < k or (v, i) > top[0]:
+            heapq.heappush(top, (v, i))
+            in_top[i] = True
+            sizes[0] += 1
+        else:
+            heapq.heappush(rest, (-v, -i))
+            sizes[1] += 1
+        rebalance()
+
+    def remove(i):
+        removed[i] = True
+        if in_top[i]:
+            sizes[0] -= 1
+        else:
+            sizes[1] -= 1
+        rebalance()
+
+    lo = hi = 0 # frames [lo, hi) are in the window
+    for f in range(frame_N):
+        while hi < ub[f]:
+            if is_valid[hi]:
+                add(hi)
+            hi += 1
+        while lo < lb[f]:
+            if is_valid[lo]:
+                remove(lo)
+            lo += 1
+        while min_deque and min_deque[0] < lo:
+            min_deque.popleft()
+        if sizes[0] == k:
+            ear_max[f] = top[0][0]
+            ear_min[f] = values[min_deque[0]]
+    return ear_min, ear_max
+
+# numpy partition over a strided view of all windows
+def _window_min_max_vectorized(ear, adj_f, k, block_size=2**22):
+    frame_N = len(ear)
+    ear_min = np.full(frame_N, np.nan)
+    ear_max = np.full(frame_N, np.nan)
+    width = 2 * adj_f
+    if frame_N == 0 or width < k:
+        return ear_min, ear_max
+
+    # pad with NaN so that every window has the same width. the last frame is never part of a window (see window_thresholds)
+    padded = np.concatenate([np.full(adj_f, np.nan), ear[:frame_N-1], np.full(adj_f + 1, np.nan)])
+    if hasattr(np.lib.stride_tricks, 'sliding_window_view'):
+        windows = np.lib.stride_tricks.sliding_window_view(padded, width)[:frame_N]
+    else:
+        windows = np.lib.stride_tricks.as_strided(padded, shape=(frame_N, width), strides=(padded.strides[0], padded.strides[0]), writeable=False)
+
+    # process blocks of frames to bound the memory of the copied windows
+    rows = max(block_size // width, 1)
+    for start in range(0, frame_N, rows):
+        block = windows[start:start+rows]
+        missing = np.isnan(block)
+        count = width - missing.sum(axis=1)
+        block_min = np.where(missing, np.inf, block).min(axis=1)
+        block_max = np.partition(np.where(missing, -np.inf, block), width - k, axis=1)[:, width - k]
+        enough = count >= k
+        ear_min[start:start+rows][enough] = block_min[enough]
+        ear_max[start:start+rows][enough] = block_max[enough]
+    return ear_min, ear_max
+
 '''
 Function detect_blink calculates the eye aspect ratio and accumulative blinking count for each frame of a video. 
 If a threshold is given to identify closed eyes, then it will be used across whole video. Otherwise, the function dynamically identifies a threshold within
@@ -309,7 +1822,7 @@ an adjacent window of each frame.
 
 Input:
     - video_summary: the output from face_68_tracker()
-    - face_tracker: the output from face_68_tracker()
+    - face_tracker: the output from face_68_tracker(). Any mapping with key 'tracker_coords' (and optionally 'valid') is accepted.
     - method: a string that specifies the method to calculate eye aspect ratio. "both" returns the average ratio of both eyes. "left" or "right"
               returns the ratio of a single. Default value is "both".
     - blink_param: a dictionary that contains four possible values. The default value is {}.
@@ -322,92 +1835,147 @@ Input:
                         this arguement is used when ratio_thresh is not provided. default value is 0.4
         * consec_frame: the minimum number of consecutive frames with closed eyes that is considered a blink. default value is 3 frames.
 Output:
-    - eye_aspect_ratio: a list that consists of the eye aspect ratio of each frame
+    - eye_aspect_ratio: an array that consists of the eye aspect ratio of each frame. The ratio is NaN for frames without a face.
     - blink_count: a list that consists of accumulative count of blinking. this value is returned only when blink_param is provided as input
     - errors: a list of errors generated during analysis
 '''
 def detect_blink(video_summary, face_tracker, method="both", blink_param={}):
 
+    if method not in ['both', 'left','right']:
+        raise ValueError("Invalid calculation method: %s" % method)
+
     # initialize values
     coords = face_tracker['tracker_coords']
+    valid = face_tracker['valid'] if 'valid' in face_tracker else None
     frame_N = len(coords)
-    eye_aspect_ratio = []
-    blink_count = []
     errors = []
 
-    # loop through all frames to calculate eye_aspect_ratio
-    for f in range(frame_N):
-        ear = eye_ratio_calc(coords[f], method)
-        eye_aspect_ratio.append(ear)  
+    # calculate eye_aspect_ratio of all frames at once
+    eye_aspect_ratio = eye_ratio_batch(coords, valid)[method]
 
     # check whether the proper arguments are provided in blink_param for blink counting
-    param = blink_param
-    ratio_thresh = param.pop('ratio_thresh', None)
+    param = dict(blink_param)
     consec_frame = param.pop('consec_frame', 3)
-    
-    if ratio_thresh == None:
-        auto_thresh_qt = param.pop('auto_thresh_qt', 0.4) 
-        auto_thresh_win = param.pop('auto_thresh_win', 0)
-        
-        # identify a global threshold if time window is not provided 
-        if auto_thresh_win == 0:
-            ear_max = np.partition(eye_aspect_ratio,-10)[-10] # retrieve the 10th largest eye aspect ratio, in order to avoid outliers in maximum
-            ear_min = np.min(eye_aspect_ratio)
-            ratio_thresh = ear_min + (ear_max-ear_min)  * auto_thresh_qt
+    ratio_thresh = blink_thresholds(eye_aspect_ratio, video_summary['fps'], param)
 
     # check whether the proper arguments are provided in blink_param    
     if len(param)>0:
-        errors.append('Warning: there are unused arguments in blink_param:\n', param)
+        errors.append('Warning: there are unused arguments in blink_param: %s' % param)
 #   if ratio_thresh == None and consec_frame == None:
 #       raise ValueError('Required parameters is missing in blink_param:\n', blink_param)   
 
-    # count number of blinks
-    acc_count = 0 # accumulative count of blinks
-    f_count = 0 # count of consecutive frames
-    
-    for f in range(frame_N):
-        if eye_aspect_ratio[f] < ratio_thresh:
-            f_count += 1 # add one consecutive frame count when eye aspect ratio is below threshold
-        else:
-            if f_count >= consec_frame: # count one blink when consecutive frame count reaches threshold
-                acc_count += 1
-            f_count = 0 # reset consecutive frame count when eye aspect ratio is above threshold
-        blink_count.append(acc_count)
-
-    # process is completed here if ratio_thresh is used.
-    if ratio_thresh != None:
-        return eye_aspect_ratio, blink_count, errors
-    
-    # now, calculate dynamic threshold within each time window
-    # loop through all frames again to calculate blink_param dynamically
-    adj_f = int(video_summary['fps'] * auto_thresh_win) # number of adjacent frames within adjacent time window
+    if frame_N > 0 and np.isnan(eye_aspect_ratio).all():
+        errors.append('Warning: no face is detected in the video, so no blink is counted.')
 
-#    print("adj_f: ", adj_f)
-#    print("ear_min: ", ear_min)
-    
-    for f in range(frame_N):
-        # lower and upper bound of frame indeces
-        lb = np.maximum(0, f-adj_f) 
-        ub = np.minimum(frame_N-1, f+adj_f)
-        adj_ear = eye_aspect_ratio[lb:ub]
-        
-        # calculate the quantile as threshold within adjacent time window
-        ''' the calculation can be further optimized across iterations '''
-        adj_ear_max = np.partition(adj_ear,-10)[-10] # retrieve the 10th largest eye aspect ratio, in order to avoid outliers in maximum
-        adj_ear_min = np.min(adj_ear)
-        adj_ratio_thresh = adj_ear_min + (adj_ear_max-adj_ear_min)  * auto_thresh_qt
-        
-#        if f % 30 ==0:
-#            print("adj_ear_max: ", adj_ear_max)
-#            print("adj_ratio_thresh: ", adj_ratio_thresh)
-            
-        # after setting the threshold within the time window, use the same process to count blinks
-        if eye_aspect_ratio[f] < adj_ratio_thresh:
-            f_count += 1 
-        else:
-            if f_count >= consec_frame:
-                acc_count += 1
-            f_count = 0
-        blink_count.append(acc_count)
-    
-    return eye_aspect_ratio, blink_count, errors
\ No newline at end of file
+    # frames below the threshold of each frame. NaN (no face or no threshold) is never below the threshold
+    with np.errstate(invalid='ignore'):
+        below = eye_aspect_ratio < np.broadcast_to(ratio_thresh, (frame_N,))
+
+    # count number of blinks: a run of at least consec_frame frames below the threshold is one blink, counted on the first frame after
+    # the run. a run that lasts until the end of the video is not counted.
+    ends, lengths = _closed_runs(below)
+    blink_count = np.cumsum(np.bincount(ends[lengths >= consec_frame], minlength=frame_N)).tolist()
+
+    return eye_aspect_ratio, blink_count, errors
+
+# threshold of closed eyes of detect_blink: ratio_thresh, or automatic thresholds. the threshold values are popped from param.
+def blink_thresholds(eye_aspect_ratio, fps, param):
+    ratio_thresh = param.pop('ratio_thresh', None)
+    if ratio_thresh is not None:
+        return ratio_thresh
+    auto_thresh_qt = param.pop('auto_thresh_qt', 0.4)
+    auto_thresh_win = param.pop('auto_thresh_win', 0)
+
+    # identify a global threshold if time window is not provided
+    if auto_thresh_win == 0:
+        ear_min, ear_max = _global_min_max(eye_aspect_ratio)
+        return ear_min + (ear_max-ear_min)  * auto_thresh_qt
+    # otherwise, calculate dynamic threshold within adjacent time window of each frame
+    adj_f = int(fps * auto_thresh_win) # number of adjacent frames within adjacent time window
+    return window_thresholds(eye_aspect_ratio, adj_f, auto_thresh_qt)
+
+# minimum and k-th largest eye aspect ratio of the video. the k-th largest avoids outliers in the maximum. with less than k faces both bounds
+# are the minimum, so no blink is counted (as in windows with less than k faces, see window_thresholds); without a face both are NaN.
+def _global_min_max(eye_aspect_ratio, k=10):
+    # frames without a face are excluded when identifying thresholds
+    valid_ear = eye_aspect_ratio[~np.isnan(eye_aspect_ratio)]
+    if len(valid_ear) == 0:
+        return np.nan, np.nan
+    k = min(k, len(valid_ear))
+    return np.min(valid_ear), np.partition(valid_ear, -k)[-k]
+
+# In[]:
+##################################################
+## Count blinks for a grid of blink parameters at once
+##################################################
+'''
+Function sweep_blink counts the blinks of one eye aspect ratio series for every combination of a grid of blink_param values, with the same
+result as blink_count[-1] of detect_blink for each combination. Work is shared across the grid:
+    * the window minimum and maximum are calculated once per auto_thresh_win, and reused for every auto_thresh_qt
+    * the spans of frames below each threshold are run-length encoded once, and a bincount of the run lengths gives the blinks of every
+      consec_frame value (a blink is a run of at least consec_frame frames that ends before the end of the video)
+Input:
+    - eye_aspect_ratio: an array (N,) of eye aspect ratio of each frame (NaN for frames without a face), e.g. the output of detect_blink
+    - fps: frame per second of the video, used by auto_thresh_win
+    - param_grid: a dictionary of lists of blink_param values (see detect_blink):
+        * ratio_thresh: fixed thresholds. Default value is [].
+        * auto_thresh_win: Default value is [0].
+        * auto_thresh_qt: Default value is [0.4] if no ratio_thresh is given, otherwise [].
+        * consec_frame: values of at least 1. Default value is [3].
+      Every ratio_thresh, and every (auto_thresh_win, auto_thresh_qt) pair, is combined with every consec_frame.
+Output:
+    - results: a list of dictionaries, the blink_param of each combination with an additional key blink_count
+'''
+def sweep_blink(eye_aspect_ratio, fps, param_grid={}):
+    grid = dict(param_grid)
+    consec_frames = [int(c) for c in grid.pop('consec_frame', [3])]
+    ratio_threshs = list(grid.pop('ratio_thresh', []))
+    auto_thresh_qts = list(grid.pop('auto_thresh_qt', [0.4] if len(ratio_threshs) == 0 else []))
+    auto_thresh_wins = list(grid.pop('auto_thresh_win', [0]))
+    if len(grid) > 0:
+        raise ValueError("Invalid arguments in param_grid: %s" % list(grid.keys()))
+    if len(consec_frames) == 0 or min(consec_frames) < 1:
+        raise ValueError("Invalid consec_frame: %s" % consec_frames)
+    ear = np.asarray(eye_aspect_ratio, dtype=np.float64)
+    results = []
+
+    def count(param, thresholds):
+        # NaN (no face or no threshold) is never below the threshold
+        with np.errstate(invalid='ignore'):
+            below = ear < thresholds
+        blinks = _blinks_by_consec(_closed_runs(below)[1], consec_frames)
+        for consec_frame, blink_count in zip(consec_frames, blinks):
+            result = dict(param)
+            result['consec_frame'] = consec_frame
+            result['blink_count'] = blink_count
+            results.append(result)
+
+    for ratio_thresh in ratio_threshs:
+        count({'ratio_thresh': ratio_thresh}, ratio_thresh)
+    if len(auto_thresh_qts) > 0:
+        for auto_thresh_win in auto_thresh_wins:
+            # same thresholds as detect_blink; without a face the thresholds are NaN and no blink is counted
+            if auto_thresh_win == 0:
+                ear_min, ear_max = _global_min_max(ear)
+            else:
+                ear_min, ear_max = _window_min_max_heap(ear, int(fps * auto_thresh_win), 10)
+            for auto_thresh_qt in auto_thresh_qts:
+                count({'auto_thresh_win': auto_thresh_win, 'auto_thresh_qt': auto_thresh_qt}, ear_min + (ear_max - ear_min) * auto_thresh_qt)
+    return results
+
+# ends (the first frame after the run) and lengths of the runs of closed eyes that end before the end of the video
+def _closed_runs(below):
+    edges = np.diff(np.concatenate(([0], below.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    # detect_blink counts a blink on the first frame after the run
+    if len(ends) > 0 and ends[-1] == len(below):
+        ends, lengths = ends[:-1], lengths[:-1]
+    return ends, lengths
+
+# number of runs at least c frames long for each c in consec_frames
+def _blinks_by_consec(lengths, consec_frames):
+    hist = np.bincount(lengths, minlength=max(consec_frames) + 1)
+    at_least = np.cumsum(hist[::-1])[::-1]
+    return [int(at_least[c]) for c in consec_frames]
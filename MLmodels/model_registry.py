@@ -0,0 +1,99 @@
+# In[]:
+##################################################
+## Registry of facial recognition models
+##################################################
+'''
+The dlib face detector and the ~100MB shape predictor are loaded on first use instead of at import time, so that processes which never
+analyze a video (web workers serving pages, manage.py migrate, createsu, ...) do not pay the load time and memory.
+Call preload() in a parent process (e.g. the gunicorn master, see videoanalyzer/gunicorn_conf.py) to load the models once before forking:
+the forked workers then share the model pages copy-on-write.
+Functions:
+    - get_detector(): return the dlib frontal face detector, loading it if needed
+    - get_predictor(): return the dlib 68 trackers shape predictor, loading it if needed
+    - preload(): load all models and return stats()
+    - stats(): a dictionary with, for each loaded model:
+        * load_seconds: time to load the model
+        * rss_bytes: increase of resident memory of the process while loading the model. None without psutil, which is needed to read the
+          current resident memory.
+        * pid: the process that loaded the model. Forked processes report the pid of their parent.
+    - format_stats(model_stats): the stats of a model as text, e.g. '1.23s, 95.2MB'
+'''
+
+import os
+import threading
+import time
+
+# give path to the trained shape predictor model: shape_predictor_68_face_landmarks.dat
+#####  Download model from: http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2
+#####  Note that the license for the iBUG 300-W dataset excludes commercial use.
+#####  So you should contact Imperial College London to find out if it's OK for you to use this model file in a commercial product.
+PREDICTOR_FILE = 'shape_predictor_68_face_landmarks.dat'
+
+_models = {}
+_stats = {}
+_lock = threading.Lock()
+
+# path of the shape predictor. ML_PREDICTOR_PATH environment variable overrides the default location in MLmodels folder
+def predictor_path():
+    if 'ML_PREDICTOR_PATH' in os.environ:
+        return os.environ['ML_PREDICTOR_PATH']
+    try:
+        from django.conf import settings
+        return os.path.join(settings.BASE_DIR, 'MLmodels', PREDICTOR_FILE)
+    except Exception:
+        # outside of django (e.g. benchmark scripts), use the folder of this module
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), PREDICTOR_FILE)
+
+# resident memory of the current process in bytes, or None without psutil. resource.getrusage() only reports the peak resident memory,
+# which does not grow while a model is loaded into memory freed earlier.
+def _rss():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+def _load(name, loader):
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        if name not in _models:
+            rss_start = _rss()
+            t_start = time.time()
+            _models[name] = loader()
+            _stats[name] = {'load_seconds': time.time() - t_start,
+                            'rss_bytes': _rss() - rss_start if rss_start is not None else None,
+                            'pid': os.getpid(),
+                            }
+    return _models[name]
+
+def _load_detector():
+    import dlib
+    # load face detector from dlib - identifying all faces on an image
+    return dlib.get_frontal_face_detector()
+
+def _load_predictor():
+    import dlib
+    # load share predictor - identifying position 64 trackers on face
+    #####  see tracker index here: https://www.pyimagesearch.com/2017/04/10/detect-eyes-nose-lips-jaw-dlib-opencv-python/
+    return dlib.shape_predictor(predictor_path())
+
+def get_detector():
+    return _load('detector', _load_detector)
+
+def get_predictor():
+    return _load('predictor', _load_predictor)
+
+def preload():
+    get_detector()
+    get_predictor()
+    return stats()
+
+def stats():
+    return {name: dict(value) for name, value in _stats.items()}
+
+def format_stats(model_stats):
+    if model_stats['rss_bytes'] is None:
+        return '%.2fs, memory unknown (install psutil)' % model_stats['load_seconds']
+    return '%.2fs, %.1fMB' % (model_stats['load_seconds'], model_stats['rss_bytes'] / 2.0**20)
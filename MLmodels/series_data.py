@@ -0,0 +1,133 @@
+# In[]:
+##################################################
+## Per-frame time series of a video analysis
+##################################################
+
+import os
+import struct
+import zipfile
+import numpy as np
+
+'''
+This module only needs numpy, so that web processes can serve time series without importing dlib and OpenCV.
+Series data is an .npz file written after each analysis (see dashboard.analysis.persist_video_analysis) with one column per array,
+so that charts and reports can use the results of an analysis without running it again:
+    - start_times (float64), eye_aspect_ratio (float32, NaN without a face), blink_count (int32, accumulative), boxes (int16, N x 4),
+      landmarks (int16, N x 68 x 2), valid (bool), source (int8)
+    - meta (float64): SERIES_VERSION, fps, total_frame, width, height
+Columns are stored without compression, so read_series_data can memory-map each column at its offset in the zip file and read only the
+frames of the requested time range. The int16 landmarks take 272 bytes per frame (about 59MB for one hour at 60fps).
+Blinks detected again from stored trackers (see dashboard.analysis.compute_blink_analysis) are written without the tracker columns
+(TRACKER_COLUMNS), with a reference to the series data that has them instead:
+    - base (str): the path of that series data, relative to the directory of the file. read_series_data reads the tracker columns from it.
+'''
+SERIES_VERSION = 1
+SERIES_COLUMNS = ['start_times', 'eye_aspect_ratio', 'blink_count', 'boxes', 'landmarks', 'valid', 'source']
+TRACKER_COLUMNS = ['start_times', 'boxes', 'landmarks', 'valid', 'source']
+
+'''
+Function write_series_data writes the results of an analysis as series data.
+Input:
+    - face_tracker: the FaceTrackerResult of the video (see facial_analysis.face_68_tracker). Not used if base is given.
+    - eye_aspect_ratio, blink_count: the output of facial_analysis.detect_blink()
+    - summary: the summary from facial_analysis.face_68_tracker()
+    - path: full path of the series data file
+    - base: None (default) to write the tracker columns, otherwise the path of the series data with the tracker columns, relative to the
+            directory where the file will be read. It must not refer to a file written with base itself (see base_reference).
+'''
+def write_series_data(face_tracker, eye_aspect_ratio, blink_count, summary, path, base=None):
+    save_dir = os.path.dirname(path)
+    if save_dir and not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+    meta = np.array([SERIES_VERSION, summary['fps'], summary['total_frame'], summary['width'], summary['height']], dtype=np.float64)
+    columns = {'eye_aspect_ratio': np.asarray(eye_aspect_ratio, dtype=np.float32),
+               'blink_count': np.asarray(blink_count, dtype=np.int32),
+               'meta': meta}
+    if base is None:
+        columns.update(start_times=face_tracker.start_times, boxes=face_tracker.boxes, landmarks=face_tracker.landmarks,
+                       valid=face_tracker.valid, source=face_tracker.source)
+    else:
+        columns['base'] = np.array(base)
+    # a file object keeps numpy from appending .npz to the path
+    with open(path, 'wb') as f:
+        np.savez(f, **columns)
+
+# the base reference of series data written with base, otherwise None
+def base_reference(path):
+    with np.load(path) as data:
+        return str(data['base']) if 'base' in data.files else None
+
+# members of an .npz file by column name, and whether all of them are stored without compression
+def _npz_members(path):
+    with zipfile.ZipFile(path) as archive:
+        infos = {info.filename[:-len('.npy')]: info for info in archive.infolist()}
+    return infos, all(info.compress_type == zipfile.ZIP_STORED for info in infos.values())
+
+def _read_columns(path, names, members=None):
+    infos, stored = members if members is not None else _npz_members(path)
+    if stored:
+        return {name: _map_npz_member(path, infos[name]) for name in names}
+    with np.load(path) as data:
+        return {name: data[name] for name in names}
+
+# memory-map a column of an uncompressed .npz file
+def _map_npz_member(path, info):
+    with open(path, 'rb') as f:
+        # local file header: 30 bytes, then the file name and the extra field
+        f.seek(info.header_offset)
+        local = f.read(30)
+        if local[:4] != b'PK\x03\x04':
+            raise ValueError("Invalid series data: %s" % path)
+        name_len, extra_len = struct.unpack('<HH', local[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if fortran_order or dtype.hasobject:
+        raise ValueError("Invalid series data: %s" % path)
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+'''
+Function read_series_data reads the frames of a time range from series data. Columns are memory-mapped, so only the requested frames are read
+from disk. Compressed files (not written by write_series_data) are read whole. Tracker columns of series data written with base are read from
+the base series data.
+Input:
+    - path: full path of the series data file
+    - start_time, end_time: the time range in seconds; frames with start_time <= start time < end_time are returned. Default value is all frames.
+    - columns: the columns to read. Default value is all columns (see SERIES_COLUMNS).
+Output:
+    - meta: a dictionary with version, fps, total_frame, width, height, and the frame range (start, stop) of the returned arrays
+    - series: a dictionary of arrays by column
+'''
+def read_series_data(path, start_time=None, end_time=None, columns=None):
+    if columns is None:
+        columns = SERIES_COLUMNS
+    for column in columns:
+        if column not in SERIES_COLUMNS:
+            raise ValueError("Invalid series column: %s" % column)
+    names = ['meta', 'start_times'] + [column for column in columns if column != 'start_times']
+    members = _npz_members(path)
+    infos = members[0]
+    arrays = _read_columns(path, [name for name in names if name in infos], members)
+    missing = [name for name in names if name not in arrays]
+    if len(missing) > 0 and 'base' in infos:
+        base_path = os.path.join(os.path.dirname(path), base_reference(path))
+        arrays.update(_read_columns(base_path, missing))
+
+    meta = {name: arrays['meta'][i].item() for i, name in enumerate(['version', 'fps', 'total_frame', 'width', 'height'])}
+    for name in ['version', 'total_frame', 'width', 'height']:
+        meta[name] = int(meta[name])
+    # start_times is sorted: a binary search reads only a few pages of it
+    start_times = arrays['start_times']
+    start = 0 if start_time is None else int(np.searchsorted(start_times, start_time, side='left'))
+    stop = len(start_times) if end_time is None else int(np.searchsorted(start_times, end_time, side='left'))
+    stop = max(stop, start)
+    meta['start'] = start
+    meta['stop'] = stop
+    series = {column: arrays[column][start:stop] for column in columns}
+    return meta, series
@@ -1,8 +1,12 @@
 from django.contrib import admin
 
 # Register your models here.
-from dashboard.models import Files, VideoMetrics, ImageMetrics
+from dashboard.models import Files, VideoMetrics, ImageMetrics, AnalysisJob, AnalysisCache, UploadSession, ModelLoad
 
 admin.site.register(Files)
 admin.site.register(VideoMetrics)
-admin.site.register(ImageMetrics)
\ No newline at end of file
+admin.site.register(ImageMetrics)
+admin.site.register(AnalysisJob)
+admin.site.register(AnalysisCache)
+admin.site.register(UploadSession)
+admin.site.register(ModelLoad)
@@ -0,0 +1,500 @@
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+from dashboard.models import Files, VideoMetrics, AnalysisJob, AnalysisCache
+import datetime
+import hashlib
+import json
+import os
+import posixpath
+import tempfile
+import time
+import traceback
+from MLmodels import series_data
+
+# minimum seconds between two progress updates of a running job
+PROGRESS_INTERVAL = 2.0
+
+# In[]: video analysis
+'''
+define a function to analyze a video. Nothing is written to the database, so that it can run in any process.
+    # input
+        * video_path: full path of the video
+        * track_param: passed to facial_analysis.face_68_tracker
+        * blink_param: passed to facial_analysis.detect_blink
+        * progress: passed to facial_analysis.face_68_tracker (see facial_analysis.ProgressReporter)
+        * sample_param: None (default) to analyze every frame, otherwise passed to facial_analysis.face_68_tracker_adaptive, which analyzes
+            a subset of frames and all frames near blinks
+        * workers: processes that track chunks of the video (see facial_analysis.face_68_tracker_parallel). Default value is None, which
+            uses settings.ANALYSIS_WORKERS. Not used with sample_param.
+    # output - a dictionary
+        * status: 's' if the analysis is successful, otherwise 'e'
+        * errors: a list of error messages
+        * summary, face_tracker: the output of face_68_tracker. summary['stages'] also has the seconds of detect_blink ('blink').
+        * eye_aspect_ratio, blink_count: the output of detect_blink. None and [] if face_68_tracker failed.
+'''
+def compute_video_analysis(video_path, track_param={}, blink_param={}, progress=None, sample_param=None, workers=None):
+    # facial_analysis imports dlib, cv2 and scipy. import it only when a video is analyzed, so that processes serving pages stay light
+    import MLmodels.facial_analysis as fa
+    result = {'status': 's', 'errors': [], 'eye_aspect_ratio': None, 'blink_count': []}
+    # get facial trackers of the video. trackers are stored as overlay data and drawn by the browser, instead of re-encoding a marked video
+    if sample_param is not None:
+        summary, face_tracker, tracker_errors = fa.face_68_tracker_adaptive(video_path, track_param=track_param, blink_param=blink_param,
+                                                                            sample_param=sample_param, progress=progress,
+                                                                            progress_interval=PROGRESS_INTERVAL)
+    else:
+        if workers is None:
+            workers = getattr(settings, 'ANALYSIS_WORKERS', 1)
+        summary, face_tracker, tracker_errors = fa.face_68_tracker(video_path, verbose=False, track_param=track_param, workers=workers,
+                                                                   progress=progress, progress_interval=PROGRESS_INTERVAL)
+    result['summary'] = summary
+    result['face_tracker'] = face_tracker
+    # conduct further analysis if facial tracker is successfull run. Otherwise append error messages.
+    if summary != {}:
+        # analyze blinking
+        t = time.perf_counter()
+        eye_aspect_ratio, blink_count, blink_errors = fa.detect_blink(summary, face_tracker, blink_param=blink_param)
+        summary.setdefault('stages', {})['blink'] = time.perf_counter() - t
+        result['eye_aspect_ratio'] = eye_aspect_ratio
+        result['blink_count'] = blink_count
+        # tracker warnings (e.g. more than one face in the video) are kept with a successful analysis
+        if len(tracker_errors) > 0:
+            result['errors'].append(tracker_errors)
+        result['errors'].append(blink_errors)
+    else:
+        result['status'] = 'e'
+        result['errors'].append(tracker_errors)
+    return result
+
+'''
+define functions to store the result of compute_video_analysis as a new VideoMetrics entry of the video.
+    * build_video_metrics(): save the landmark and series data files and return an unsaved VideoMetrics, without database access, so that
+        files can be written in analysis processes and metrics saved in batches (see save_video_metrics and analyze_batch)
+    * save_video_metrics(video_metrics_list): save VideoMetrics built by build_video_metrics in one transaction, and update count_analyzed
+        and latest_metrics of their files
+    * persist_video_analysis(): build and save the metrics of one analysis
+    # input
+        * video: the Files instance
+        * result: the output of compute_video_analysis or compute_blink_analysis
+        * params: the parameters of the analysis, stored with the metrics
+        * landmark_data: the name of stored landmark data to refer to (e.g. of the analysis that a blink re-analysis starts from).
+            Default value is None, which writes the landmark data of the result.
+    # output
+        * video_metrics: the VideoMetrics instance. Its stage_seconds are summary['stages'] of the result, with the seconds spent writing and
+            saving the landmark and series data files ('copy').
+        * status: 's' or 'e'
+        * errors: errors of the result, and errors when saving files
+'''
+# a new temporary file in the directory of the uploader. Names are unique, so that processes analyzing videos of the same name at the
+# same time (see analyze_batch and run_analysis_worker) do not write to the same file.
+def _temp_path(video, suffix):
+    temp_dir = settings.BASE_DIR + '/__tempfile/%s' % (video.upload_by.username)
+    os.makedirs(temp_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=suffix, prefix='%s_' % (slugify(video.name)), dir=temp_dir)
+    os.close(fd)
+    return temp_path
+
+def _remove_temp(temp_path):
+    if temp_path is not None and os.path.exists(temp_path):
+        os.remove(temp_path)
+
+def build_video_metrics(video, result, params={}, landmark_data=None):
+    import MLmodels.facial_analysis as fa
+    status = result['status']
+    errors = list(result['errors'])
+    summary = result['summary']
+    blink_count = result['blink_count']
+    # the name to save landmark data; slugify() converts string to URL and filename friendly
+    save_name= '%s_landmarks.bin' % (slugify(video.name))
+
+    # store output in VideoMetrics model as a new entry
+    video_metrics = VideoMetrics()
+    video_metrics.file_id = video
+    video_metrics.analyzer_version = ANALYZER_VERSION
+    video_metrics.params = json.dumps(params)
+    t_copy = time.perf_counter()
+    # save landmark data and remove temporary file. If failed then write to error messages.
+    if landmark_data is not None:
+        video_metrics.landmark_data = landmark_data
+    else:
+        temp_path = None
+        try:
+            temp_path = _temp_path(video, '_landmarks.bin')
+            fa.write_overlay_data(result['face_tracker'], summary, temp_path)
+            with open(temp_path, mode='rb') as f:
+                video_metrics.landmark_data.save(save_name, File(f), save=False)
+        except:
+            status = 'e'
+            errors.append('An error prevent facial trackers to be saved. Only analysis metrics are available.')
+        finally:
+            _remove_temp(temp_path)
+    # save per-frame time series for charts and reports
+    if result['eye_aspect_ratio'] is not None:
+        series_name = '%s_series.npz' % (slugify(video.name))
+        series_path = None
+        try:
+            series_path = _temp_path(video, '_series.npz')
+            # refer to the trackers of the series data of a blink re-analysis, relative to the directory the file is saved to
+            base = None
+            if result.get('series_base'):
+                save_dir = posixpath.dirname(video_metrics.series_data.field.generate_filename(video_metrics, series_name))
+                base = posixpath.relpath(result['series_base'], save_dir)
+            series_data.write_series_data(result['face_tracker'], result['eye_aspect_ratio'], blink_count, summary, series_path, base=base)
+            with open(series_path, mode='rb') as f:
+                video_metrics.series_data.save(series_name, File(f), save=False)
+        except:
+            errors.append('An error prevent time series to be saved. Only analysis metrics are available.')
+        finally:
+            _remove_temp(series_path)
+    stages = dict(summary.get('stages', {}))
+    stages['copy'] = time.perf_counter() - t_copy
+    video_metrics.stage_seconds = json.dumps(stages)
+
+    video_metrics.calc_status = status
+    video_metrics.frame_num = summary.get('total_frame')
+    video_metrics.fps = summary.get('fps')
+    video_metrics.blink_count = blink_count[-1] if len(blink_count) > 0 else None
+    return video_metrics, status, errors
+
+def save_video_metrics(video_metrics_list):
+    with transaction.atomic():
+        VideoMetrics.objects.bulk_create(video_metrics_list)
+        # metrics are created in order, so the last metrics of a file is its latest
+        for video_metrics in video_metrics_list:
+            Files.objects.filter(pk=video_metrics.file_id_id).update(count_analyzed=F('count_analyzed') + 1, latest_metrics=video_metrics)
+
+# count the analysis in the database rather than saving the whole file, so that concurrent changes of the file (e.g. a rename, or an
+# analysis finished by another worker) are kept. The instance is updated to match.
+def _mark_analyzed(video, video_metrics):
+    Files.objects.filter(pk=video.pk).update(count_analyzed=F('count_analyzed') + 1, latest_metrics=video_metrics)
+    video.refresh_from_db(fields=['count_analyzed'])
+    video.latest_metrics = video_metrics
+
+def persist_video_analysis(video, result, params={}, landmark_data=None):
+    video_metrics, status, errors = build_video_metrics(video, result, params, landmark_data)
+    video_metrics.save()
+    _mark_analyzed(video, video_metrics)
+    return video_metrics, status, errors
+
+# In[]: blink re-analysis
+'''
+define a function to detect blinks again from the stored time series of an analysis, without decoding the video.
+    # input
+        * source_metrics: a VideoMetrics with series_data
+        * blink_param: passed to facial_analysis.detect_blink
+    # output - a dictionary, same as compute_video_analysis. face_tracker refers to the memory-mapped columns of the series data. An additional
+      key series_base is the storage name of the series data with the trackers, so that the series data of the result refers to it instead
+      of copying the trackers (see build_video_metrics).
+'''
+def compute_blink_analysis(source_metrics, blink_param={}):
+    import MLmodels.facial_analysis as fa
+    source_name = source_metrics.series_data.name
+    meta, series = series_data.read_series_data(source_metrics.series_data.path)
+    # the source may itself refer to the series data with the trackers
+    base = series_data.base_reference(source_metrics.series_data.path)
+    series_base = source_name if base is None else posixpath.normpath(posixpath.join(posixpath.dirname(source_name), base))
+    summary = {'total_frame': meta['total_frame'], 'processed_frame': meta['stop'], 'fps': meta['fps'], 'width': meta['width'], 'height': meta['height']}
+    face_tracker = fa.FaceTrackerResult.from_arrays(series['start_times'], series['boxes'], series['landmarks'], series['valid'], series['source'])
+    t = time.perf_counter()
+    eye_aspect_ratio, blink_count, blink_errors = fa.detect_blink(summary, face_tracker, blink_param=blink_param)
+    summary['stages'] = {'blink': time.perf_counter() - t}
+    return {'status': 's', 'errors': [blink_errors], 'summary': summary, 'face_tracker': face_tracker,
+            'eye_aspect_ratio': eye_aspect_ratio, 'blink_count': blink_count, 'series_base': series_base}
+
+# In[]: marked video export
+'''
+define a function to export a copy of video with facial marks, drawn from the landmark data of the latest analysis.
+    # input
+        * video: the Files instance
+    # output
+        * video_metrics: the VideoMetrics instance that stores the marked video. None if the video has not been analyzed.
+        * status: 's' or 'e'
+        * errors: a list of error messages
+'''
+def export_marked_video(video):
+    import MLmodels.facial_analysis as fa
+    status = 's'
+    errors = []
+    video_metrics = video.latest_metrics
+    if video_metrics is None or not video_metrics.landmark_data:
+        return None, 'e', ['The video has not been analyzed yet.']
+
+    # the path to save marked video; slugify() converts string to URL and filename friendly
+    save_name= '%s_analyzed.mp4' % (slugify(video.name))
+    temp_path = None
+    # draw stored trackers on the original video; no detection is run again
+    try:
+        temp_path = _temp_path(video, '_analyzed.mp4')
+        header, face_tracker = fa.read_overlay_data(video_metrics.landmark_data.path)
+        fa.render_marked_video(video.file.path, face_tracker, save_path=temp_path)
+        with open(temp_path, mode='rb') as f:
+            video_metrics.marked_video.save(save_name, File(f), save=True)
+    except:
+        status = 'e'
+        errors.append('An error prevent marked video to be exported.')
+    finally:
+        _remove_temp(temp_path)
+    return video_metrics, status, errors
+
+# In[]: result cache
+'''
+define functions to reuse the analysis of identical videos. Results are cached by (Files.content_hash, ANALYZER_VERSION, params_key(params)).
+A hit creates a VideoMetrics entry that refers to the stored files of the cached analysis, without decoding the video.
+    * params_key(params): SHA-1 of the parameters in a canonical JSON form
+    * lookup_cache(video, params): return the AnalysisCache entry of the video and params, or None
+    * metrics_from_cache(video, entry): create and return a VideoMetrics entry of the video from a cached analysis
+    * store_cache(video, params, video_metrics): cache a successful analysis
+    * cache_stats(): number of entries, stored bytes, and hits and misses of analysis jobs
+    * evict_cache(max_age_days, max_bytes, dry_run): remove entries not used for max_age_days, then the least recently used entries until
+        the cached files take at most max_bytes. Stored files (landmark and series data, with the series data of blink re-analyses that
+        refer to them) are deleted with the entry. Entries whose files a file shows as its latest analysis are never evicted, and count
+        towards max_bytes.
+'''
+# change when facial_analysis changes its results, so that older cached analyses are not reused
+ANALYZER_VERSION = '2'
+
+def params_key(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+def lookup_cache(video, params):
+    if not video.content_hash:
+        return None
+    return (AnalysisCache.objects.select_related('metrics')
+            .filter(content_hash=video.content_hash, analyzer_version=ANALYZER_VERSION, params_key=params_key(params),
+                    metrics__landmark_data__gt='')
+            .first())
+
+def metrics_from_cache(video, entry):
+    cached = entry.metrics
+    video_metrics = VideoMetrics()
+    video_metrics.file_id = video
+    video_metrics.calc_status = cached.calc_status
+    # refer to the same stored file instead of copying it
+    video_metrics.landmark_data = cached.landmark_data.name
+    video_metrics.series_data = cached.series_data.name
+    video_metrics.analyzer_version = cached.analyzer_version
+    video_metrics.params = cached.params
+    video_metrics.frame_num = cached.frame_num
+    video_metrics.fps = cached.fps
+    video_metrics.blink_count = cached.blink_count
+    video_metrics.save()
+    _mark_analyzed(video, video_metrics)
+    AnalysisCache.objects.filter(pk=entry.pk).update(hit_count=F('hit_count') + 1, last_used_datetime=timezone.now())
+    return video_metrics
+
+def store_cache(video, params, video_metrics):
+    if not video.content_hash or video_metrics.calc_status != 's' or not video_metrics.landmark_data:
+        return None
+    size_bytes = 0
+    for field in [video_metrics.landmark_data, video_metrics.series_data]:
+        try:
+            size_bytes += field.size if field else 0
+        except OSError:
+            pass
+    entry, created = AnalysisCache.objects.get_or_create(content_hash=video.content_hash, analyzer_version=ANALYZER_VERSION,
+                                                         params_key=params_key(params),
+                                                         defaults={'metrics': video_metrics, 'size_bytes': size_bytes})
+    return entry
+
+def cache_stats():
+    stats = AnalysisCache.objects.aggregate(entries=Count('id'), size_bytes=Sum('size_bytes'))
+    stats.update(AnalysisJob.objects.aggregate(hits=Count('id', filter=Q(cache_hit=True)), misses=Count('id', filter=Q(cache_hit=False))))
+    stats['size_bytes'] = stats['size_bytes'] or 0
+    stats['hit_rate'] = stats['hits'] / float(stats['hits'] + stats['misses']) if stats['hits'] + stats['misses'] > 0 else None
+    return stats
+
+# landmark data names of the entries that a file shows as its latest analysis. their files are kept and the entries are never evicted.
+def _cached_files_in_use(entries):
+    names = [entry.metrics.landmark_data.name for entry in entries if entry.metrics.landmark_data]
+    return set(Files.objects.filter(latest_metrics__landmark_data__in=names).values_list('latest_metrics__landmark_data', flat=True))
+
+# delete the stored files of an evicted entry. return the number of bytes freed, or None if a file shows them as its latest analysis.
+def _release_cached_files(entry):
+    name = entry.metrics.landmark_data.name
+    if not name:
+        return 0
+    # checked again, as a cache hit may have made the files the latest analysis of a file since the entries were selected
+    if Files.objects.filter(latest_metrics__landmark_data=name).exists():
+        return None
+    users = VideoMetrics.objects.filter(landmark_data=name)
+    storage = entry.metrics.landmark_data.storage
+    # blink re-analyses refer to the same landmark data, and their series data to the series data of the entry, so both go together
+    series_names = set(users.exclude(series_data='').exclude(series_data=None).values_list('series_data', flat=True))
+    if entry.metrics.series_data:
+        series_names.add(entry.metrics.series_data.name)
+    storage.delete(name)
+    for series_name in series_names:
+        storage.delete(series_name)
+    users.update(landmark_data=None, series_data=None)
+    VideoMetrics.objects.filter(series_data__in=series_names).update(series_data=None)
+    return entry.size_bytes
+
+def evict_cache(max_age_days=None, max_bytes=None, dry_run=False):
+    entries = list(AnalysisCache.objects.select_related('metrics').order_by('last_used_datetime'))
+    in_use = _cached_files_in_use(entries)
+    total = sum(entry.size_bytes for entry in entries)
+    evicted = []
+    kept = []
+    limit = timezone.now() - datetime.timedelta(days=max_age_days) if max_age_days is not None else None
+    for entry in entries:
+        if limit is not None and entry.last_used_datetime < limit and entry.metrics.landmark_data.name not in in_use:
+            evicted.append(entry)
+        else:
+            kept.append(entry)
+    total -= sum(entry.size_bytes for entry in evicted)
+    # least recently used first
+    for entry in list(kept):
+        if max_bytes is None or total <= max_bytes:
+            break
+        if entry.metrics.landmark_data.name in in_use:
+            continue
+        kept.remove(entry)
+        evicted.append(entry)
+        total -= entry.size_bytes
+    freed = 0
+    if not dry_run:
+        for entry in list(evicted):
+            size = _release_cached_files(entry)
+            if size is None:
+                evicted.remove(entry)
+                total += entry.size_bytes
+                continue
+            freed += size
+            entry.delete()
+    return {'evicted': len(evicted), 'freed_bytes': freed, 'size_bytes': total}
+
+# In[]: job queue
+'''
+define functions to run analysis in a background worker (python manage.py run_analysis_worker) instead of inside the HTTP request.
+    * enqueue_job(file, calc_method, user, params): create a queued AnalysisJob, or return the queued or running job of the same file,
+        calc_method and params, so that reloading a page does not analyze a video twice.
+    * claim_job(worker): mark the oldest queued job as running and return it, or None if there is no queued job. Jobs are locked with
+        SELECT ... FOR UPDATE SKIP LOCKED, so that workers never claim the same job and never wait for each other.
+    * run_job(job): run the calculation of a claimed job and store status, errors and metrics on the job.
+    * requeue_stale_jobs(seconds): put back running jobs whose progress has not been updated for seconds (e.g. the worker was killed).
+        progress_datetime is the heartbeat of a job: it is set when the job is claimed and on each progress update, so long analyses
+        that still report progress are not requeued. seconds must be longer than the stages that report no progress (e.g. 'rendering').
+    * job_progress(job): a progress callback for face_68_tracker that stores the progress on the job
+    * set_job_stage(job, stage): store the current stage of a job
+Progress is written with one UPDATE of the progress fields (at most every PROGRESS_INTERVAL seconds), so the job row is never reloaded or saved whole.
+'''
+# look up the result of a job in the cache, and record whether it is a hit
+def _job_cache_lookup(job, video, params):
+    # files uploaded in chunks, or before content hashes were stored, are hashed once here. only the hash is written, as in _mark_analyzed
+    if not video.content_hash:
+        set_job_stage(job, 'hashing')
+        Files.objects.filter(pk=video.pk).update(content_hash=video.pop_content_hash(save=False))
+    entry = lookup_cache(video, params)
+    AnalysisJob.objects.filter(pk=job.pk).update(cache_hit=entry is not None)
+    return entry
+
+def video_analysis_job(job):
+    video = job.file_id
+    params = job.get_params()
+    entry = _job_cache_lookup(job, video, params)
+    if entry is not None:
+        return metrics_from_cache(video, entry), 's', []
+
+    result = compute_video_analysis(video.file.path, track_param=params.get('track_param', {}), blink_param=params.get('blink_param', {}),
+                                    progress=job_progress(job), sample_param=params.get('sample_param'))
+    set_job_stage(job, 'saving')
+    video_metrics, status, errors = persist_video_analysis(video, result, params)
+    store_cache(video, params, video_metrics)
+    return video_metrics, status, errors
+
+# detect blinks from the stored trackers of the latest successful analysis with the same trackers (analyzer version and track_param).
+# run the full analysis if there is none. trackers of adaptive sampling (sample_param) are only refined around the blinks of their own
+# blink_param, so they are never reused.
+def blink_analysis_job(job):
+    video = job.file_id
+    params = job.get_params()
+    entry = _job_cache_lookup(job, video, params)
+    if entry is not None:
+        return metrics_from_cache(video, entry), 's', []
+
+    track_param = params.get('track_param', {})
+    source_metrics = None
+    for video_metrics in (VideoMetrics.objects.filter(file_id=video, calc_status='s', analyzer_version=ANALYZER_VERSION, series_data__gt='')
+                          .order_by('-create_datetime')):
+        source_params = json.loads(video_metrics.params or '{}')
+        if 'sample_param' in params or 'sample_param' in source_params:
+            continue
+        if source_params.get('track_param', {}) == track_param:
+            source_metrics = video_metrics
+            break
+    if source_metrics is None:
+        return video_analysis_job(job)
+
+    set_job_stage(job, 'blink')
+    result = compute_blink_analysis(source_metrics, params.get('blink_param', {}))
+    set_job_stage(job, 'saving')
+    video_metrics, status, errors = persist_video_analysis(video, result, params, landmark_data=source_metrics.landmark_data.name)
+    store_cache(video, params, video_metrics)
+    return video_metrics, status, errors
+
+def video_export_job(job):
+    set_job_stage(job, 'rendering')
+    return export_marked_video(job.file_id)
+
+# calc_method of AnalysisJob -> function that runs the job and returns (video_metrics, status, errors)
+JOB_RUNNERS = {
+        'video_analysis': video_analysis_job,
+        'blink_analysis': blink_analysis_job,
+        'video_export': video_export_job,
+        }
+
+def enqueue_job(file, calc_method, user, params={}):
+    if calc_method not in JOB_RUNNERS:
+        raise ValueError("Invalid calculation method: %s" % calc_method)
+    params = json.dumps(params, sort_keys=True)
+    with transaction.atomic():
+        job = (AnalysisJob.objects.select_for_update()
+               .filter(file_id=file, calc_method=calc_method, params=params, status__in=['q', 'r'])
+               .order_by('create_datetime').first())
+        if job is None:
+            job = AnalysisJob(file_id=file, calc_method=calc_method, requested_by=user, params=params)
+            job.save()
+    return job
+
+def claim_job(worker=''):
+    with transaction.atomic():
+        job = (AnalysisJob.objects.select_for_update(skip_locked=True)
+               .filter(status='q').order_by('create_datetime').first())
+        if job is None:
+            return None
+        job.status = 'r'
+        job.worker = worker
+        job.start_datetime = timezone.now()
+        job.progress_datetime = job.start_datetime
+        job.save(update_fields=['status', 'worker', 'start_datetime', 'progress_datetime'])
+    return job
+
+def run_job(job):
+    try:
+        video_metrics, status, errors = JOB_RUNNERS[job.calc_method](job)
+    except Exception:
+        video_metrics, status, errors = None, 'e', ['The analysis failed unexpectedly.']
+        traceback.print_exc()
+    # update() writes the final state in one query without touching other fields
+    AnalysisJob.objects.filter(pk=job.pk).update(status=status, errors=json.dumps(errors), metrics=video_metrics,
+                                                 finish_datetime=timezone.now())
+    job.status = status
+    return job
+
+def job_progress(job):
+    def progress(info):
+        AnalysisJob.objects.filter(pk=job.pk).update(progress_stage=info['stage'], progress_frames=info['frames'], progress_total=info['total_frame'],
+                                                     progress_fps=info['fps'], progress_datetime=timezone.now())
+    return progress
+
+def set_job_stage(job, stage):
+    AnalysisJob.objects.filter(pk=job.pk).update(progress_stage=stage, progress_datetime=timezone.now())
+
+def requeue_stale_jobs(seconds):
+    limit = timezone.now() - datetime.timedelta(seconds=seconds)
+    # jobs claimed without a heartbeat fall back to their start
+    stale = Q(progress_datetime__lt=limit) | Q(progress_datetime__isnull=True, start_datetime__lt=limit)
+    return AnalysisJob.objects.filter(stale, status='r').update(status='q', worker='', start_datetime=None, progress_datetime=None)
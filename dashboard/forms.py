@@ -5,11 +5,52 @@ from django.utils.translation import ugettext_lazy as _
 define a form for user to upload a file
     # fields -
         * name: Files.name
-        * file: Files.file
+        * file: Files.file. The first bytes must match the magic bytes of the file extension (see models.FILE_MAGIC_BYTES), as in chunked uploads.
 '''
-from dashboard.models import Files
+from dashboard.models import Files, magic_bytes_match, MAGIC_HEAD_SIZE
+import os
 
 class FileUploadModelForm(forms.ModelForm):    
     class Meta:
         model = Files
-        fields = ['name','file']
\ No newline at end of file
+        fields = ['name','file']
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        extension = os.path.splitext(file.name)[1].upper()
+        file.seek(0)
+        head = file.read(MAGIC_HEAD_SIZE)
+        file.seek(0)
+        if not magic_bytes_match(extension, head):
+            raise forms.ValidationError(_('The content of the file does not match its extension %(extension)s'), params={'extension': extension})
+        return file
+'''
+define a form for user to choose the blink detection parameters of an analysis (see facial_analysis.detect_blink)
+    # fields -
+        * ratio_thresh: a fixed threshold of eye aspect ratio. Leave empty to identify thresholds automatically.
+        * auto_thresh_win: half width (seconds) of the window for automatic thresholds. 0 uses the whole video.
+        * auto_thresh_qt: quantile of eye aspect ratio for automatic thresholds
+        * consec_frame: minimum number of consecutive frames with closed eyes that is counted as a blink
+        * full_recompute: track the face again instead of reusing the trackers of the latest analysis
+        * sample_every: track the face on every sample_every-th frame, and on all frames near blinks (see facial_analysis.face_68_tracker_adaptive).
+            Leave empty to track every frame.
+    # methods -
+        * blink_param(): the blink_param dictionary of the entered values. Empty fields are left out, so detect_blink uses its defaults.
+        * sample_param(): the sample_param dictionary of adaptive sampling, or None to track every frame
+'''
+class BlinkParamForm(forms.Form):
+    ratio_thresh = forms.FloatField(label=_('Eye ratio threshold'), required=False, min_value=0)
+    auto_thresh_win = forms.FloatField(label=_('Threshold window (s)'), required=False, min_value=0)
+    auto_thresh_qt = forms.FloatField(label=_('Threshold quantile'), required=False, min_value=0, max_value=1)
+    consec_frame = forms.IntegerField(label=_('Consecutive frames'), required=False, min_value=1)
+    full_recompute = forms.BooleanField(label=_('Track the face again'), required=False)
+    sample_every = forms.IntegerField(label=_('Sample every n frames'), required=False, min_value=1)
+
+    def blink_param(self):
+        return {key: self.cleaned_data[key] for key in ['ratio_thresh', 'auto_thresh_win', 'auto_thresh_qt', 'consec_frame']
+                if self.cleaned_data.get(key) is not None}
+
+    def sample_param(self):
+        if self.cleaned_data.get('sample_every') is None:
+            return None
+        return {'sample_every': self.cleaned_data['sample_every']}
@@ -0,0 +1,162 @@
+'''
+This script analyzes many stored videos at once, e.g. to backfill analyses after a change of the facial analysis or of its parameters.
+python manage.py analyze_batch --never-analyzed --processes 4
+python manage.py analyze_batch --stale --user alice --since 2018-01-01 --checkpoint backfill.txt
+python manage.py analyze_batch <file_id> [<file_id> ...] --params '{"blink_param": {"consec_frame": 2}}'
+
+Videos are analyzed in a pool of processes, which are replaced after --max-tasks-per-child videos so that memory of long runs stays bounded.
+The processes write the landmark and series data files; the command saves the VideoMetrics of every --batch-size videos in one transaction.
+With --checkpoint, the ids of saved videos are appended to the file, and videos listed in it are skipped, so an interrupted run resumes where
+it stopped. Videos with a cached analysis (see dashboard.analysis.lookup_cache) reuse it without decoding.
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+from django import db
+from django.db.models import Q
+from django.utils import dateparse
+from dashboard import analysis
+from dashboard.models import Files
+from MLmodels import model_registry
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+
+# analyze one video in a pool process. the database is not used; the unsaved VideoMetrics is returned to the command.
+def analyze_file(task):
+    video, params = task
+    t_start = time.time()
+    try:
+        # pool processes cannot start processes of their own, so each video is tracked in one process; --processes uses the cores
+        result = analysis.compute_video_analysis(video.file.path, track_param=params.get('track_param', {}),
+                                                 blink_param=params.get('blink_param', {}), sample_param=params.get('sample_param'), workers=1)
+        video_metrics, status, errors = analysis.build_video_metrics(video, result, params)
+        frames = result['summary'].get('processed_frame', 0)
+    except Exception:
+        traceback.print_exc()
+        video_metrics, status, errors, frames = None, 'e', ['The analysis failed unexpectedly.'], 0
+    return {'video': video, 'video_metrics': video_metrics, 'status': status, 'errors': errors, 'frames': frames,
+            'seconds': time.time() - t_start}
+
+
+class Command(BaseCommand):
+    help = 'Analyze stored videos selected by filters in a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_id', nargs='*', help='ids of the video files. Default is all videos matching the filters')
+        parser.add_argument('--user', default=None, help='username of the uploader')
+        parser.add_argument('--since', default=None, help='uploaded on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', default=None, help='uploaded before this date (YYYY-MM-DD)')
+        parser.add_argument('--never-analyzed', action='store_true', help='only videos without any analysis')
+        parser.add_argument('--stale', action='store_true', help='only videos whose latest analysis is not of the current analyzer version')
+        parser.add_argument('--include-deleted', action='store_true', help='include deleted files')
+        parser.add_argument('--limit', type=int, default=None, help='analyze at most this many videos')
+        parser.add_argument('--params', default='{}', help='parameters of the analysis in json: {"track_param": {...}, "blink_param": {...}, '
+                            '"sample_param": {...}}')
+        parser.add_argument('--processes', type=int, default=1, help='number of videos analyzed at the same time')
+        parser.add_argument('--max-tasks-per-child', type=int, default=10, help='videos analyzed by a process before it is replaced')
+        parser.add_argument('--batch-size', type=int, default=20, help='videos whose metrics are saved in one transaction')
+        parser.add_argument('--checkpoint', default=None, help='file of the ids of saved videos, to resume an interrupted run')
+        parser.add_argument('--no-cache', action='store_true', help='analyze videos with a cached analysis again')
+
+    def select_files(self, options):
+        files = Files.objects.filter(file_type='v').select_related('upload_by', 'latest_metrics').order_by('upload_datetime')
+        if options['file_id']:
+            files = files.filter(id__in=options['file_id'])
+        if not options['include_deleted']:
+            files = files.filter(deleted=False)
+        if options['user'] is not None:
+            files = files.filter(upload_by__username=options['user'])
+        for option, lookup in [('since', 'upload_datetime__date__gte'), ('until', 'upload_datetime__date__lt')]:
+            if options[option] is not None:
+                date = dateparse.parse_date(options[option])
+                if date is None:
+                    raise CommandError('Invalid date: %s' % options[option])
+                files = files.filter(**{lookup: date})
+        if options['never_analyzed']:
+            files = files.filter(count_analyzed=0)
+        if options['stale']:
+            files = files.filter(Q(latest_metrics__isnull=True) | ~Q(latest_metrics__analyzer_version=analysis.ANALYZER_VERSION))
+        return files
+
+    def handle(self, *args, **options):
+        try:
+            params = json.loads(options['params'])
+        except ValueError:
+            raise CommandError('Invalid json in --params')
+        done = set()
+        if options['checkpoint'] is not None and os.path.exists(options['checkpoint']):
+            with open(options['checkpoint']) as f:
+                done = set(line.strip() for line in f if line.strip())
+            self.stdout.write('Resuming: %d videos in checkpoint %s' % (len(done), options['checkpoint']))
+        files = [file for file in self.select_files(options) if str(file.id) not in done]
+        if options['limit'] is not None:
+            files = files[:options['limit']]
+        self.stdout.write('Videos to analyze: %d' % len(files))
+        if len(files) == 0:
+            return
+
+        t_start = time.time()
+        stats = {'success': 0, 'error': 0, 'cached': 0, 'frames': 0, 'seconds': 0.0}
+        tasks = []
+        for file in files:
+            entry = None if options['no_cache'] else analysis.lookup_cache(file, params)
+            if entry is not None:
+                analysis.metrics_from_cache(file, entry)
+                self.checkpoint(options['checkpoint'], [file])
+                stats['cached'] += 1
+            else:
+                tasks.append((file, params))
+
+        if len(tasks) > 0:
+            model_registry.preload()
+            # connections must not be shared with the pool processes
+            db.connections.close_all()
+            pool = multiprocessing.Pool(max(options['processes'], 1), maxtasksperchild=options['max_tasks_per_child'])
+            batch = []
+            try:
+                for count, output in enumerate(pool.imap_unordered(analyze_file, tasks), 1):
+                    video = output['video']
+                    stats['success' if output['status'] == 's' else 'error'] += 1
+                    stats['frames'] += output['frames']
+                    stats['seconds'] += output['seconds']
+                    if output['status'] != 's':
+                        self.stderr.write('%s (%s): %s' % (video.id, video.name, output['errors']))
+                    if output['video_metrics'] is not None:
+                        batch.append(output)
+                    if len(batch) >= options['batch_size'] or count == len(tasks):
+                        self.save_batch(batch, params, options['checkpoint'])
+                    elapsed = time.time() - t_start
+                    self.stdout.write('%d/%d videos, %.1f videos/hour' % (count, len(tasks), 3600 * count / elapsed))
+            finally:
+                # metrics of analyzed videos are kept when the run is interrupted
+                self.save_batch(batch, params, options['checkpoint'])
+                pool.terminate()
+
+        elapsed = time.time() - t_start
+        analyzed = stats['success'] + stats['error']
+        self.stdout.write('Analyzed: %d (%d successful, %d with errors); From cache: %d; Time: %.1fs'
+                          % (analyzed, stats['success'], stats['error'], stats['cached'], elapsed))
+        self.stdout.write('Throughput: %.1f videos/hour; %.1f frames/sec overall; %.1f frames/sec per process'
+                          % (3600 * (analyzed + stats['cached']) / elapsed, stats['frames'] / elapsed,
+                             stats['frames'] / stats['seconds'] if stats['seconds'] > 0 else 0))
+
+    def save_batch(self, batch, params, checkpoint):
+        if len(batch) == 0:
+            return
+        # empty the batch first, so that it is not saved again when the run is interrupted
+        outputs = list(batch)
+        del batch[:]
+        analysis.save_video_metrics([output['video_metrics'] for output in outputs])
+        for output in outputs:
+            analysis.store_cache(output['video'], params, output['video_metrics'])
+        self.checkpoint(checkpoint, [output['video'] for output in outputs])
+
+    def checkpoint(self, checkpoint, files):
+        if checkpoint is None:
+            return
+        with open(checkpoint, 'a') as f:
+            for file in files:
+                f.write('%s\n' % file.id)
@@ -0,0 +1,22 @@
+'''
+This script compares the engines that calculate windowed blink thresholds on a synthetic eye aspect ratio series.
+python manage.py benchmark_blink_threshold --minutes 60 --fps 60 --window 4
+'''
+
+from django.core.management.base import BaseCommand
+from MLmodels import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Compare the speed of the engines that calculate windowed blink thresholds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=float, default=60, help='length of the synthetic video in minutes')
+        parser.add_argument('--fps', type=float, default=60, help='frame per second of the synthetic video')
+        parser.add_argument('--window', type=float, default=4, help='auto_thresh_win in seconds')
+        parser.add_argument('--engines', nargs='+', default=['naive', 'heap', 'vectorized'], help='engines to compare; the first one is the reference')
+
+    def handle(self, *args, **options):
+        frame_N = int(options['minutes'] * 60 * options['fps'])
+        report = benchmark.compare_threshold_engines(frame_N=frame_N, fps=options['fps'], auto_thresh_win=options['window'], engines=options['engines'])
+        self.stdout.write(benchmark.format_report(report))
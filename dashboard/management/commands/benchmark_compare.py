@@ -0,0 +1,41 @@
+'''
+This script compares two runs of the benchmark history written by benchmark_suite. By default the last run is compared with the one before it.
+python manage.py benchmark_compare --history benchmark_history.json
+python manage.py benchmark_compare --base 3 --new 5 --threshold 0.05 --fail-on-slower
+
+Runs are numbered from 1 in the order they were added; negative numbers count from the last run (-1).
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+from MLmodels import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Compare two runs of the benchmark history and show slower and faster cases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', default='benchmark_history.json', help='json file written by benchmark_suite')
+        parser.add_argument('--base', type=int, default=-2, help='run to compare with')
+        parser.add_argument('--new', type=int, default=-1, help='run to check')
+        parser.add_argument('--threshold', type=float, default=0.1, help='relative change of time below which a case is unchanged')
+        parser.add_argument('--fail-on-slower', action='store_true', help='exit with an error if a case is slower, e.g. in a deployment script')
+
+    def run(self, history, number):
+        try:
+            return history[number - 1 if number > 0 else number]
+        except IndexError:
+            raise CommandError('No run %d in the history (%d runs)' % (number, len(history)))
+
+    def handle(self, *args, **options):
+        history = benchmark.load_history(options['history'])
+        if len(history) < 2:
+            raise CommandError('The history %s needs at least two runs' % options['history'])
+        base = self.run(history, options['base'])
+        new = self.run(history, options['new'])
+        for title, run in [('Base', base), ('New', new)]:
+            self.stdout.write('%s: %s %s %s' % (title, run['time'], run['commit'] or '-', run['label']))
+        report = benchmark.compare_runs(base, new, threshold=options['threshold'])
+        self.stdout.write(benchmark.format_report(report))
+        slower = [item for item in report if item['change'] == 'slower']
+        if slower and options['fail_on_slower']:
+            raise CommandError('%d cases are slower' % len(slower))
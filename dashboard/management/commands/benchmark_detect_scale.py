@@ -0,0 +1,22 @@
+'''
+This script compares speed and landmark accuracy of face_68_tracker at several detection scales.
+python manage.py benchmark_detect_scale <video_path> [<video_path> ...] --scales 1 0.75 0.5 0.33
+'''
+
+from django.core.management.base import BaseCommand
+from MLmodels import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Compare speed and landmark accuracy of face_68_tracker at several detection scales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('video_path', nargs='+', help='full path of videos for analysis')
+        parser.add_argument('--scales', nargs='+', type=float, default=[1.0, 0.75, 0.5, 0.33, 0.25], help='detection scales to compare')
+
+    def handle(self, *args, **options):
+        for video_path in options['video_path']:
+            report = benchmark.compare_detect_scales(video_path, scales=options['scales'])
+            self.stdout.write('%s' % video_path)
+            self.stdout.write(benchmark.format_report(report))
+            self.stdout.write('')
@@ -0,0 +1,44 @@
+'''
+This script times the facial analysis hot paths on synthetic videos and adds the results to a json history file.
+python manage.py benchmark_suite --label "before detect cache" --history benchmark_history.json
+python manage.py benchmark_suite --fixtures 360p_10s 720p_10s --repeat 5 --face-image face.jpg
+
+The synthetic videos (see MLmodels.benchmark.FIXTURES) are generated in --fixtures-dir on the first run and reused afterwards.
+Compare runs with python manage.py benchmark_compare.
+'''
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from MLmodels import benchmark
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = 'Time face_68_tracker, detect_blink, draw_shape and video writing on synthetic videos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', nargs='+', default=None, help='fixtures to run: %s. Default is all' % ', '.join(benchmark.FIXTURES.keys()))
+        parser.add_argument('--fixtures-dir', default=os.path.join(settings.BASE_DIR, '__tempfile', 'benchmark'), help='directory of the synthetic videos')
+        parser.add_argument('--face-image', default=None, help='photo of a face used in the synthetic videos. Default draws a face')
+        parser.add_argument('--repeat', type=int, default=3, help='runs of each case; the fastest is reported')
+        parser.add_argument('--track-param', default='{}', help='track_param of face_68_tracker in json')
+        parser.add_argument('--history', default='benchmark_history.json', help='json file the results are added to')
+        parser.add_argument('--label', default='', help='label of the run in the history, e.g. the change being measured')
+
+    def handle(self, *args, **options):
+        fixtures = benchmark.ensure_fixtures(options['fixtures_dir'], options['fixtures'], face_image=options['face_image'])
+        results = benchmark.run_suite(fixtures, repeat=options['repeat'], track_param=json.loads(options['track_param']))
+        run = benchmark.append_history(options['history'], results, label=options['label'])
+        columns = ['fixture', 'case', 'frames', 'seconds', 'seconds_median', 'fps']
+        self.stdout.write(benchmark.format_report([item for item in results if 'seconds' in item], columns))
+        for item in results:
+            if 'blink_count' in item and item['blink_count'] != item['blink_count_expected']:
+                self.stdout.write('%s %s: %d blinks counted, %d scripted' % (item['fixture'], item['case'], item['blink_count'],
+                                                                           item['blink_count_expected']))
+            if 'blink_count_dense' in item:
+                self.stdout.write('%s %s: %d blinks, %d with dense trackers; %.0f%% of frames analyzed'
+                                  % (item['fixture'], item['case'], item['blink_count'], item['blink_count_dense'], 100 * item['analyzed_ratio']))
+            if 'note' in item:
+                self.stdout.write('%s %s skipped: %s' % (item['fixture'], item['case'], item['note']))
+        self.stdout.write('Run %d (%s) added to %s' % (len(benchmark.load_history(options['history'])), run['commit'] or '-', options['history']))
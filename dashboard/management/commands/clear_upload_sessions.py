@@ -0,0 +1,18 @@
+'''
+This script deletes chunked uploads (see dashboard.uploads) that were not resumed for a while, together with their partial files.
+python manage.py clear_upload_sessions --hours 24
+'''
+
+from django.core.management.base import BaseCommand
+from dashboard import uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned chunked uploads and their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='delete uploads not updated for this many hours')
+
+    def handle(self, *args, **options):
+        count = uploads.clear_sessions(options['hours'])
+        self.stdout.write('Deleted %d upload sessions' % count)
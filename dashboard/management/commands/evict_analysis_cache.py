@@ -0,0 +1,29 @@
+'''
+This script prints the statistics of the analysis cache and removes old or least recently used entries.
+python manage.py evict_analysis_cache --max-age-days 90 --max-size-mb 5000
+'''
+
+from django.core.management.base import BaseCommand
+from dashboard import analysis
+
+
+class Command(BaseCommand):
+    help = 'Print statistics of the analysis cache and evict entries by age and total size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-days', type=float, default=None, help='evict entries not used for this many days')
+        parser.add_argument('--max-size-mb', type=float, default=None, help='evict least recently used entries until cached files take at most this size')
+        parser.add_argument('--dry-run', action='store_true', help='only print what would be evicted')
+
+    def handle(self, *args, **options):
+        stats = analysis.cache_stats()
+        self.stdout.write('Entries: %d; Size: %.1fMB; Hits: %d; Misses: %d; Hit rate: %s'
+                          % (stats['entries'], stats['size_bytes'] / 2.0**20, stats['hits'], stats['misses'],
+                             '%.1f%%' % (100 * stats['hit_rate']) if stats['hit_rate'] is not None else '-'))
+        if options['max_age_days'] is None and options['max_size_mb'] is None:
+            return
+        max_bytes = int(options['max_size_mb'] * 2**20) if options['max_size_mb'] is not None else None
+        result = analysis.evict_cache(max_age_days=options['max_age_days'], max_bytes=max_bytes, dry_run=options['dry_run'])
+        self.stdout.write('%s %d entries; Freed: %.1fMB; Remaining size: %.1fMB'
+                          % ('Would evict' if options['dry_run'] else 'Evicted', result['evicted'], result['freed_bytes'] / 2.0**20,
+                             result['size_bytes'] / 2.0**20))
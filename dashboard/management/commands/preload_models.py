@@ -0,0 +1,16 @@
+'''
+This script loads the facial recognition models and prints load time and memory of each model.
+python manage.py preload_models
+'''
+
+from django.core.management.base import BaseCommand
+from MLmodels import model_registry
+
+
+class Command(BaseCommand):
+    help = 'Load the facial recognition models and print load time and memory'
+
+    def handle(self, *args, **options):
+        stats = model_registry.preload()
+        for name in sorted(stats):
+            self.stdout.write('%s: %s' % (name, model_registry.format_stats(stats[name])))
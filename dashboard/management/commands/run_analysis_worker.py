@@ -0,0 +1,86 @@
+'''
+This script runs queued analysis jobs (see dashboard.models.AnalysisJob) in the background, outside of the web requests.
+python manage.py run_analysis_worker --concurrency 4
+
+Each of the concurrency processes claims one job at a time with SELECT ... FOR UPDATE SKIP LOCKED, so several workers (on the same or
+different servers) can share the queue. The facial recognition models are loaded once before the processes are forked.
+Each video analysis tracks its frames in settings.ANALYSIS_WORKERS processes, so a server runs up to --concurrency x ANALYSIS_WORKERS analysis
+processes: keep the product at about the number of cores, e.g. --concurrency 4 with ANALYSIS_WORKERS = 4 on 16 cores.
+'''
+
+from django.core.management.base import BaseCommand
+from django import db
+from dashboard import analysis, metrics
+from MLmodels import model_registry
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+
+
+# claim and run jobs until the queue is empty (once) or forever
+def work(poll, once):
+    # connections must not be shared with the parent process
+    db.connections.close_all()
+    worker = '%s:%d' % (socket.gethostname(), os.getpid())
+    while True:
+        # drop connections the database has closed (e.g. after a restart or an idle timeout), as django does between requests
+        db.close_old_connections()
+        try:
+            job = analysis.claim_job(worker)
+        except db.DatabaseError:
+            traceback.print_exc()
+            time.sleep(poll)
+            continue
+        if job is None:
+            if once:
+                return
+            time.sleep(poll)
+            continue
+        print('%s: %s %s started' % (worker, job.calc_method, job.id))
+        t_start = time.time()
+        try:
+            job = analysis.run_job(job)
+        except db.DatabaseError:
+            # the job stays running until --requeue-after puts it back
+            traceback.print_exc()
+            continue
+        print('%s: %s %s finished with status %s in %.1fs' % (worker, job.calc_method, job.id, job.status, time.time() - t_start))
+
+
+class Command(BaseCommand):
+    help = 'Run queued analysis jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='number of jobs to run at the same time. Each job uses settings.ANALYSIS_WORKERS processes')
+        parser.add_argument('--poll', type=float, default=2.0, help='seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+        parser.add_argument('--requeue-after', type=float, default=0, help='put back running jobs without a progress update for this '
+                            'many seconds, e.g. after a worker was killed. 0 (default) never requeues')
+
+    def handle(self, *args, **options):
+        if options['requeue_after'] > 0:
+            count = analysis.requeue_stale_jobs(options['requeue_after'])
+            self.stdout.write('Requeued %d stale jobs' % count)
+        stats = model_registry.preload()
+        for name in sorted(stats):
+            self.stdout.write('Loaded %s in %s' % (name, model_registry.format_stats(stats[name])))
+        # exported by the web processes in /metrics
+        metrics.record_model_loads(stats)
+
+        if options['concurrency'] <= 1:
+            work(options['poll'], options['once'])
+            return
+
+        db.connections.close_all()
+        processes = [multiprocessing.Process(target=work, args=(options['poll'], options['once'])) for _ in range(options['concurrency'])]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # running jobs are left in status 'r'; use --requeue-after to put them back
+            for process in processes:
+                process.terminate()
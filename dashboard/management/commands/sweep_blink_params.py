@@ -0,0 +1,72 @@
+'''
+This script counts the blinks of stored analyses for a grid of blink parameters, from the stored trackers and without decoding the videos.
+python manage.py sweep_blink_params <file_id> [<file_id> ...] --auto-thresh-win 0 2 4 --auto-thresh-qt 0.3 0.4 0.5 --consec-frame 2 3 4
+python manage.py sweep_blink_params --all --ratio-thresh 0.18 0.2 0.22 --csv sweep.csv
+
+It runs in the command process, not in the analysis workers. Analyses that cannot be read or have no face are reported and skipped.
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.models import Files, VideoMetrics
+from MLmodels import benchmark, series_data
+import csv
+import zipfile
+
+
+class Command(BaseCommand):
+    help = 'Count blinks of stored analyses for a grid of blink parameters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_id', nargs='*', help='ids of the analyzed video files')
+        parser.add_argument('--all', action='store_true', help='use the latest analysis of every video')
+        parser.add_argument('--ratio-thresh', nargs='+', type=float, default=[], help='fixed thresholds of eye aspect ratio')
+        parser.add_argument('--auto-thresh-win', nargs='+', type=float, default=[0], help='half widths (seconds) of automatic threshold windows')
+        parser.add_argument('--auto-thresh-qt', nargs='+', type=float, default=None, help='quantiles of automatic thresholds')
+        parser.add_argument('--consec-frame', nargs='+', type=int, default=[3], help='minimum numbers of consecutive frames of a blink')
+        parser.add_argument('--csv', default=None, help='write the results to a csv file instead of printing them')
+
+    def handle(self, *args, **options):
+        import MLmodels.facial_analysis as fa
+        if options['all']:
+            files = Files.objects.filter(file_type='v', deleted=False)
+        else:
+            files = Files.objects.filter(id__in=options['file_id'])
+        if len(files) == 0:
+            raise CommandError('No file to sweep: give file ids or --all')
+
+        param_grid = {'ratio_thresh': options['ratio_thresh'], 'auto_thresh_win': options['auto_thresh_win'], 'consec_frame': options['consec_frame']}
+        if options['auto_thresh_qt'] is not None:
+            param_grid['auto_thresh_qt'] = options['auto_thresh_qt']
+
+        report = []
+        for file in files:
+            file_metrics = (VideoMetrics.objects.filter(file_id=file, calc_status='s', series_data__gt='')
+                            .order_by('-create_datetime').first())
+            if file_metrics is None:
+                self.stderr.write('%s: no stored analysis' % file.id)
+                continue
+            # eye aspect ratio from the stored trackers, same as detect_blink
+            try:
+                meta, series = series_data.read_series_data(file_metrics.series_data.path, columns=['landmarks', 'valid'])
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                self.stderr.write('%s: stored analysis cannot be read (%s)' % (file.id, e))
+                continue
+            if not series['valid'].any():
+                self.stderr.write('%s: no face detected in the stored analysis' % file.id)
+                continue
+            eye_aspect_ratio = fa.eye_ratio_batch(series['landmarks'], series['valid'])['both']
+            for result in fa.sweep_blink(eye_aspect_ratio, meta['fps'], param_grid):
+                row = {'file_id': str(file.id), 'name': file.name}
+                for key in ['ratio_thresh', 'auto_thresh_win', 'auto_thresh_qt', 'consec_frame', 'blink_count']:
+                    row[key] = result.get(key, '')
+                report.append(row)
+
+        columns = ['file_id', 'name', 'ratio_thresh', 'auto_thresh_win', 'auto_thresh_qt', 'consec_frame', 'blink_count']
+        if options['csv'] is not None:
+            with open(options['csv'], 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(report)
+            self.stdout.write('%d rows written to %s' % (len(report), options['csv']))
+        else:
+            self.stdout.write(benchmark.format_report(report, columns))
@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+import mimetypes
+import os
+import re
+
+# In[]: media serving
+'''
+define functions to serve stored media files (uploaded files, marked videos, trackers data) to browsers, replacing the static() development
+helper. Video players request byte ranges to seek, so a player can start anywhere in a long video without downloading everything before it.
+    * media_response(request, path): return the response for the file at storage name path. Access must be checked by the caller.
+        - Range: a single byte range is answered with 206 (Partial Content), an unsatisfiable range with 416. Several ranges in one request
+          are answered with the whole file, which HTTP allows.
+        - If-Range, If-None-Match, If-Modified-Since, If-Match, If-Unmodified-Since: conditional requests with the ETag and Last-Modified
+          of the file (304 Not Modified / 412 Precondition Failed)
+        - the file is streamed with FileResponse. WSGI servers with wsgi.file_wrapper (e.g. gunicorn) send it with sendfile(), starting at
+          the offset of the range, without copying it through python.
+    # settings
+        * MEDIA_SENDFILE_HEADER: None (default) to stream files from django. 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (apache, lighttpd)
+          to let the front server send the file after the access check; the front server then handles ranges and conditional requests.
+        * MEDIA_ACCEL_PREFIX: the internal nginx location of MEDIA_ROOT for X-Accel-Redirect, e.g. '/protected/'
+'''
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# a file-like object that reads length bytes from the current position of f. fileno() lets sendfile() start at that position.
+class RangeFile:
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+# parse a Range header against the file size. Return (start, end) inclusive, None to send the whole file, or False if unsatisfiable.
+def parse_range(header, size):
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        # several ranges or other units
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        # suffix range: the last end bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = size - 1 if end == '' else min(int(end), size - 1)
+    if start >= size or start > end:
+        return False
+    return start, end
+
+def media_response(request, path):
+    full_path = default_storage.path(path)
+    stat = os.stat(full_path)
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if header:
+        response = HttpResponse(content_type=content_type)
+        if header == 'X-Accel-Redirect':
+            response[header] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected/').rstrip('/') + '/' + path
+        else:
+            response[header] = full_path
+        return response
+
+    etag = quote_etag('%x-%x' % (int(stat.st_mtime), stat.st_size))
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META:
+        if_range = request.META.get('HTTP_IF_RANGE')
+        # If-Range: send the range only if the file is unchanged, otherwise the whole file
+        if if_range is None or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+            byte_range = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % stat.st_size
+        return response
+
+    start, end = byte_range if byte_range is not None else (0, stat.st_size - 1)
+    length = end - start + 1
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        f = open(full_path, 'rb')
+        f.seek(start)
+        response = FileResponse(RangeFile(f, length), content_type=content_type)
+    if byte_range is not None:
+        response.status_code = 206
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, stat.st_size)
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # files are served to their owners only; shared caches must not keep them
+    response['Cache-Control'] = 'private'
+    return response
@@ -0,0 +1,104 @@
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Min, Q, Sum
+from django.utils import timezone
+from dashboard.models import AnalysisJob, ModelLoad
+from dashboard import analysis
+import datetime
+import os
+import socket
+
+# In[]: prometheus metrics
+'''
+define functions to export metrics of the analyses in the Prometheus text format (version 0.0.4), for capacity planning. The text is built
+from the database on each scrape, so the numbers are the same whichever web process answers.
+    * render_metrics(): return the text of all metrics
+        - videoanalyzer_jobs{status}: number of analysis jobs by status. Queued jobs ('queued') are the queue depth.
+        - videoanalyzer_queue_oldest_seconds: age of the oldest queued job
+        - videoanalyzer_job_duration_seconds{calc_method}: histogram of the run time of finished jobs (start to finish)
+        - videoanalyzer_job_frames_per_second{calc_method}: histogram of the processing speed of successful jobs, as last reported by
+          their progress (see dashboard.analysis.job_progress). Jobs that reused a cached analysis report no speed and are left out.
+        - videoanalyzer_model_load_seconds{host,model}: load time of the facial recognition models in the analysis workers of each host,
+          as recorded by record_model_loads when the worker started
+        - videoanalyzer_model_memory_bytes{host,model}: memory taken by loading each model, for hosts where it is known (see
+          MLmodels.model_registry.stats)
+        - videoanalyzer_cache_hits_total, videoanalyzer_cache_misses_total, videoanalyzer_cache_bytes: see dashboard.analysis.cache_stats
+    * record_model_loads(stats): store model_registry.stats() of this host in ModelLoad, for the processes that load the models
+        (see run_analysis_worker). Web processes usually never load them.
+Histograms are cumulative over all jobs in the database; the time spent in each stage of single analyses is in VideoMetrics.stage_seconds.
+'''
+# upper bounds of histogram buckets
+JOB_DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+FRAMES_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 25, 30, 60, 120)
+JOB_STATUS_NAMES = dict((key, value.lower()) for key, value in AnalysisJob.STATUS_CHOICES)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _family(lines, name, kind, help_text):
+    lines.append('# HELP %s %s' % (name, help_text))
+    lines.append('# TYPE %s %s' % (name, kind))
+
+# rows: a list of dictionaries with calc_method, count, sum and b<i> (number of values up to the i-th bucket)
+def _histogram(lines, name, buckets, rows):
+    for row in rows:
+        method = _label(row['calc_method'])
+        for i, bound in enumerate(buckets):
+            lines.append('%s_bucket{calc_method="%s",le="%s"} %d' % (name, method, bound, row['b%d' % i]))
+        lines.append('%s_bucket{calc_method="%s",le="+Inf"} %d' % (name, method, row['count']))
+        lines.append('%s_sum{calc_method="%s"} %s' % (name, method, repr(float(row['sum'] or 0))))
+        lines.append('%s_count{calc_method="%s"} %d' % (name, method, row['count']))
+
+def _job_durations():
+    finished = (AnalysisJob.objects.filter(status__in=['s', 'e'], start_datetime__isnull=False, finish_datetime__isnull=False)
+                .annotate(duration=ExpressionWrapper(F('finish_datetime') - F('start_datetime'), output_field=DurationField())))
+    # one query: a count per bucket and method
+    buckets = dict(('b%d' % i, Count('id', filter=Q(duration__lte=datetime.timedelta(seconds=bound))))
+                   for i, bound in enumerate(JOB_DURATION_BUCKETS))
+    rows = list(finished.values('calc_method').order_by('calc_method').annotate(count=Count('id'), sum=Sum('duration'), **buckets))
+    for row in rows:
+        row['sum'] = row['sum'].total_seconds() if row['sum'] is not None else 0
+    return rows
+
+def _job_speeds():
+    successful = AnalysisJob.objects.filter(status='s', progress_fps__gt=0)
+    buckets = dict(('b%d' % i, Count('id', filter=Q(progress_fps__lte=bound))) for i, bound in enumerate(FRAMES_PER_SECOND_BUCKETS))
+    return list(successful.values('calc_method').order_by('calc_method').annotate(count=Count('id'), sum=Sum('progress_fps'), **buckets))
+
+def render_metrics():
+    lines = []
+    # queue depth; order_by() drops the default ordering, which would be grouped by too
+    counts = dict((row['status'], row['count']) for row in AnalysisJob.objects.values('status').order_by().annotate(count=Count('id')))
+    _family(lines, 'videoanalyzer_jobs', 'gauge', 'Number of analysis jobs by status.')
+    for status in sorted(JOB_STATUS_NAMES):
+        lines.append('videoanalyzer_jobs{status="%s"} %d' % (JOB_STATUS_NAMES[status], counts.get(status, 0)))
+    oldest = AnalysisJob.objects.filter(status='q').aggregate(oldest=Min('create_datetime'))['oldest']
+    _family(lines, 'videoanalyzer_queue_oldest_seconds', 'gauge', 'Age of the oldest queued analysis job.')
+    lines.append('videoanalyzer_queue_oldest_seconds %s' % repr((timezone.now() - oldest).total_seconds() if oldest is not None else 0.0))
+
+    _family(lines, 'videoanalyzer_job_duration_seconds', 'histogram', 'Run time of finished analysis jobs.')
+    _histogram(lines, 'videoanalyzer_job_duration_seconds', JOB_DURATION_BUCKETS, _job_durations())
+    _family(lines, 'videoanalyzer_job_frames_per_second', 'histogram', 'Processing speed of successful analysis jobs.')
+    _histogram(lines, 'videoanalyzer_job_frames_per_second', FRAMES_PER_SECOND_BUCKETS, _job_speeds())
+
+    loads = list(ModelLoad.objects.all())
+    _family(lines, 'videoanalyzer_model_load_seconds', 'gauge', 'Load time of the facial recognition models in the analysis workers.')
+    for load in loads:
+        lines.append('videoanalyzer_model_load_seconds{host="%s",model="%s"} %s' % (_label(load.host), _label(load.model), repr(load.load_seconds)))
+    _family(lines, 'videoanalyzer_model_memory_bytes', 'gauge', 'Memory taken by loading the facial recognition models in the analysis workers.')
+    for load in loads:
+        if load.rss_bytes is not None:
+            lines.append('videoanalyzer_model_memory_bytes{host="%s",model="%s"} %d' % (_label(load.host), _label(load.model), load.rss_bytes))
+
+    cache = analysis.cache_stats()
+    _family(lines, 'videoanalyzer_cache_hits_total', 'counter', 'Analysis jobs answered from the result cache.')
+    lines.append('videoanalyzer_cache_hits_total %d' % cache['hits'])
+    _family(lines, 'videoanalyzer_cache_misses_total', 'counter', 'Analysis jobs that analyzed the video.')
+    lines.append('videoanalyzer_cache_misses_total %d' % cache['misses'])
+    _family(lines, 'videoanalyzer_cache_bytes', 'gauge', 'Bytes of stored files of cached analyses.')
+    lines.append('videoanalyzer_cache_bytes %d' % cache['size_bytes'])
+    return '\n'.join(lines) + '\n'
+
+def record_model_loads(stats):
+    host = socket.gethostname()
+    for name, value in stats.items():
+        ModelLoad.objects.update_or_create(host=host, model=name, defaults={'load_seconds': value['load_seconds'], 'rss_bytes': value['rss_bytes'],
+                                                                            'pid': value.get('pid', os.getpid())})
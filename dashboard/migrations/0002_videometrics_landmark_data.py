@@ -0,0 +1,19 @@
+# Generated by Django 2.0.1 on 2026-10-18 09:12
+
+import dashboard.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videometrics',
+            name='landmark_data',
+            field=models.FileField(blank=True, null=True, upload_to=dashboard.models.marked_file_path, verbose_name='Landmark Data'),
+        ),
+    ]
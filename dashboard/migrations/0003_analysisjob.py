@@ -0,0 +1,41 @@
+# Generated by Django 2.0.1 on 2026-10-18 11:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('dashboard', '0002_videometrics_landmark_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, help_text='Unique Id for each analysis job', primary_key=True, serialize=False, verbose_name='Unique ID')),
+                ('calc_method', models.CharField(max_length=50, verbose_name='Calculation Method')),
+                ('status', models.CharField(choices=[('q', 'Queued'), ('r', 'Running'), ('s', 'Success'), ('e', 'Error')], default='q', max_length=1, verbose_name='Job Status')),
+                ('params', models.TextField(blank=True, default='{}', verbose_name='Parameters')),
+                ('errors', models.TextField(blank=True, default='[]', verbose_name='Errors')),
+                ('worker', models.CharField(blank=True, default='', max_length=100, verbose_name='Worker')),
+                ('create_datetime', models.DateTimeField(auto_now_add=True, verbose_name='Creation Datetime')),
+                ('start_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Start Datetime')),
+                ('finish_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Finish Datetime')),
+                ('file_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.Files')),
+                ('metrics', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dashboard.VideoMetrics')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['create_datetime'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(fields=['status', 'create_datetime'], name='dashboard_a_status_9445e8_idx'),
+        ),
+    ]
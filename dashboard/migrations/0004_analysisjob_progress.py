@@ -0,0 +1,38 @@
+# Generated by Django 2.0.1 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='progress_datetime',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Progress Datetime'),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='progress_fps',
+            field=models.FloatField(default=0, verbose_name='Processing Speed (fps)'),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='progress_frames',
+            field=models.IntegerField(default=0, verbose_name='Processed Frames'),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='progress_stage',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='Progress Stage'),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='progress_total',
+            field=models.IntegerField(default=0, verbose_name='Total Frames'),
+        ),
+    ]
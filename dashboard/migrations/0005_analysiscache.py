@@ -0,0 +1,43 @@
+# Generated by Django 2.0.1 on 2026-10-18 13:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_analysisjob_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='cache_hit',
+            field=models.NullBooleanField(verbose_name='Cache Hit'),
+        ),
+        migrations.AddField(
+            model_name='files',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='Content Hash'),
+        ),
+        migrations.CreateModel(
+            name='AnalysisCache',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, help_text='Unique Id for each cached analysis', primary_key=True, serialize=False, verbose_name='Unique ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='Content Hash')),
+                ('analyzer_version', models.CharField(max_length=20, verbose_name='Analyzer Version')),
+                ('params_key', models.CharField(max_length=40, verbose_name='Parameters Key')),
+                ('size_bytes', models.BigIntegerField(default=0, verbose_name='Size (bytes)')),
+                ('hit_count', models.IntegerField(default=0, verbose_name='Count of Hits')),
+                ('create_datetime', models.DateTimeField(auto_now_add=True, verbose_name='Creation Datetime')),
+                ('last_used_datetime', models.DateTimeField(auto_now_add=True, verbose_name='Last Used Datetime')),
+                ('metrics', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.VideoMetrics')),
+            ],
+            options={
+                'ordering': ['-last_used_datetime'],
+                'unique_together': {('content_hash', 'analyzer_version', 'params_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.0.1 on 2026-10-18 14:30
+
+import dashboard.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_analysiscache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videometrics',
+            name='series_data',
+            field=models.FileField(blank=True, null=True, upload_to=dashboard.models.marked_file_path, verbose_name='Series Data'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.0.1 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_videometrics_series_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videometrics',
+            name='analyzer_version',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='Analyzer Version'),
+        ),
+        migrations.AddField(
+            model_name='videometrics',
+            name='params',
+            field=models.TextField(blank=True, default='{}', verbose_name='Parameters'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.0.1 on 2026-10-18 16:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('dashboard', '0007_videometrics_analyzer_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, help_text='Unique Id for each upload', primary_key=True, serialize=False, verbose_name='Unique ID')),
+                ('name', models.CharField(max_length=100, verbose_name='File Name')),
+                ('file_path', models.CharField(max_length=255, verbose_name='File Path')),
+                ('total_size', models.BigIntegerField(verbose_name='Total Size (bytes)')),
+                ('chunk_size', models.IntegerField(verbose_name='Chunk Size (bytes)')),
+                ('received_bytes', models.BigIntegerField(default=0, verbose_name='Received Size (bytes)')),
+                ('create_datetime', models.DateTimeField(auto_now_add=True, verbose_name='Creation Datetime')),
+                ('update_datetime', models.DateTimeField(auto_now=True, verbose_name='Update Datetime')),
+                ('upload_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-create_datetime'],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.0.1 on 2026-10-18 17:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# point each file to its latest analysis, in one UPDATE statement
+def set_latest_metrics(apps, schema_editor):
+    Files = apps.get_model('dashboard', 'Files')
+    VideoMetrics = apps.get_model('dashboard', 'VideoMetrics')
+    latest = VideoMetrics.objects.filter(file_id=models.OuterRef('pk')).order_by('-create_datetime').values('pk')[:1]
+    Files.objects.update(latest_metrics=models.Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='files',
+            name='latest_metrics',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='dashboard.VideoMetrics'),
+        ),
+        migrations.AddIndex(
+            model_name='files',
+            index=models.Index(fields=['upload_by', 'upload_datetime'], name='dashboard_f_upload__00f2ca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='files',
+            index=models.Index(fields=['upload_datetime', 'id'], name='dashboard_f_upload__d275b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videometrics',
+            index=models.Index(fields=['file_id', 'create_datetime'], name='dashboard_v_file_id_ab0f36_idx'),
+        ),
+        migrations.RunPython(set_latest_metrics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.1 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_files_latest_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videometrics',
+            name='stage_seconds',
+            field=models.TextField(blank=True, default='{}', verbose_name='Stage Seconds'),
+        ),
+    ]
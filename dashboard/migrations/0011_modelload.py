@@ -0,0 +1,30 @@
+# Generated by Django 2.0.1 on 2026-10-18 19:10
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_videometrics_stage_seconds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelLoad',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, help_text='Unique Id for each model load', primary_key=True, serialize=False, verbose_name='Unique ID')),
+                ('host', models.CharField(max_length=100, verbose_name='Host')),
+                ('model', models.CharField(max_length=50, verbose_name='Model')),
+                ('load_seconds', models.FloatField(verbose_name='Load Time (seconds)')),
+                ('rss_bytes', models.BigIntegerField(blank=True, null=True, verbose_name='Memory (bytes)')),
+                ('pid', models.IntegerField(verbose_name='Process ID')),
+                ('load_datetime', models.DateTimeField(auto_now=True, verbose_name='Load Datetime')),
+            ],
+            options={
+                'ordering': ['host', 'model'],
+                'unique_together': {('host', 'model')},
+            },
+        ),
+    ]
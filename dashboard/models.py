@@ -2,6 +2,8 @@ from django.db import models
 import uuid
 from django.contrib.auth.models import User
 import os
+import json
+import hashlib
 
 # In[]
 # always in upper case
@@ -12,6 +14,24 @@ FILE_EXTENSION_TO_TYPE ={
         'i':['.JPG','.PNG','.GIF',], # add more extensions for image
         }
 
+# magic bytes of each extension: a list of (offset, bytes), any of which identifies the format. Extensions without magic bytes are not checked.
+FILE_MAGIC_BYTES ={
+        '.MP4':[(4, b'ftyp'),], # ISO base media file
+        '.PDF':[(0, b'%PDF'),],
+        '.JPG':[(0, b'\xff\xd8\xff'),],
+        '.PNG':[(0, b'\x89PNG\r\n\x1a\n'),],
+        '.GIF':[(0, b'GIF87a'), (0, b'GIF89a'),],
+        }
+
+# number of first bytes that contain the magic bytes of every extension
+MAGIC_HEAD_SIZE = max(offset + len(magic) for magics in FILE_MAGIC_BYTES.values() for offset, magic in magics)
+
+# whether the first bytes of a file match the magic bytes of its extension (upper case, including beginning dot)
+def magic_bytes_match(extension, head):
+    if extension not in FILE_MAGIC_BYTES:
+        return True
+    return any(head[offset:offset+len(magic)] == magic for offset, magic in FILE_MAGIC_BYTES[extension])
+
 # In[]
 '''
 define a model to store user uploaded files. following fields are included:
@@ -30,9 +50,15 @@ define a model to store user uploaded files. following fields are included:
         * deleted: a boolean indicating soft deletion
         * deleted_by: foregin key to the user who deleted the file
         * delete_datetime: the datetime when the file the deleted
+        * content_hash: SHA-256 of the file content (hex). Identical uploads have the same hash, so their analysis can be reused. Empty until
+            the first analysis job for files uploaded in chunks (see dashboard.uploads).
+        * latest_metrics: foreign key to the latest VideoMetrics of the file, set when an analysis is saved (see dashboard.analysis), so that
+            pages do not search the metrics for it. None if the video has not been analyzed or the latest analysis is deleted.
     # methods:
         * extension(): return uploaded file extension, including beginning dot. e.g. ".txt"
-        * pop_file_type(): based on file extension, populate file_type of the instance and return the file_type value, 
+        * pop_file_type(save=True): based on file extension, populate file_type of the instance and return the file_type value, 
+        * pop_content_hash(save=True): read the file in chunks, populate content_hash of the instance and return the content_hash value
+        Both methods save the instance unless save is False, so that a caller populating several fields can save once.
 '''
 def user_upload_path(instance, filename):
     # file will be uploaded to uploadfiles/<username>/<filename>
@@ -58,10 +84,15 @@ class Files(models.Model):
     delete_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='delete_by')
     delete_datetime = models.DateTimeField(verbose_name='Deletion Datetime', null=True, blank=True)
     count_analyzed = models.IntegerField(verbose_name='Count of Analysis', default=0)
+    content_hash = models.CharField(verbose_name='Content Hash', max_length=64, default='', blank=True, db_index=True)
+    latest_metrics = models.ForeignKey('VideoMetrics', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     
     # meta
     class Meta:
         ordering = ['-upload_datetime'] # ording by descending upload datetime
+        indexes = [models.Index(fields=['upload_by', 'upload_datetime']), # files of a user, newest first
+                   models.Index(fields=['upload_datetime', 'id']), # keyset pagination of all files
+                   ]
         permissions = (('can_view_any_file', 'View Any File'), # can view any file across all users
                        ('can_delete_any_file', 'Delete Any File'), # can delete any file across all users
                 )
@@ -76,7 +107,7 @@ class Files(models.Model):
         return extension.upper()
 
     # populate and return file_type
-    def pop_file_type(self):
+    def pop_file_type(self, save=True):
         file_type = 'u'
         ext = self.extension()
         # iterate through FILE_EXTENSION_TO_TYPE for match
@@ -86,9 +117,22 @@ class Files(models.Model):
                 break
         # save file_type in model
         self.file_type = file_type
-        self.save()
+        if save:
+            self.save()
         # return file_type
         return file_type
+
+    # populate and return content_hash
+    def pop_content_hash(self, save=True):
+        sha = hashlib.sha256()
+        # chunks() streams the uploaded or stored file, so large videos are never held in memory
+        for chunk in self.file.chunks():
+            sha.update(chunk)
+        self.content_hash = sha.hexdigest()
+        # save content_hash in model
+        if save:
+            self.save()
+        return self.content_hash
             
 
 # In[]
@@ -99,7 +143,13 @@ define a model to store analysis results of videos. following fields are include
     # calc_status - indicate whether the metrics are resulted from success analysis. 
         * 's' - Success
         * 'e' - Error
-    # marked_video - post process video
+    # marked_video - post process video, exported on demand
+    # landmark_data - face positions and trackers of each frame, drawn by the browser over the original video (see facial_analysis.write_overlay_data)
+    # series_data - per-frame time series of the analysis: eye aspect ratio, blink count, boxes and trackers (see MLmodels.series_data)
+    # analyzer_version - dashboard.analysis.ANALYZER_VERSION of the analysis. Stored trackers are reused only by the same version.
+    # params - a JSON dictionary of the parameters of the analysis, e.g. {"blink_param": {"consec_frame": 2}}
+    # stage_seconds - a JSON dictionary of seconds spent in each stage of the analysis, e.g. {"decode": 1.2, "detect": 8.5, "copy": 0.1}
+        (see facial_analysis.StageTimer). Empty for analyses reused from the cache.
     # frame_num - number of frames in video
     # fps - frame per second
     # blink_count - number of blinks in the video
@@ -116,6 +166,11 @@ class VideoMetrics(models.Model):
     file_id = models.ForeignKey(Files, on_delete=models.SET_NULL, null=True, blank=True)
     calc_status = models.CharField(verbose_name='Analysis Status', max_length=1, choices=(('s','Success'),('e','Error')), null=True)
     marked_video = models.FileField(verbose_name='Marked Video', upload_to=marked_file_path, null=True)
+    landmark_data = models.FileField(verbose_name='Landmark Data', upload_to=marked_file_path, null=True, blank=True)
+    series_data = models.FileField(verbose_name='Series Data', upload_to=marked_file_path, null=True, blank=True)
+    analyzer_version = models.CharField(verbose_name='Analyzer Version', max_length=20, default='', blank=True)
+    params = models.TextField(verbose_name='Parameters', default='{}', blank=True)
+    stage_seconds = models.TextField(verbose_name='Stage Seconds', default='{}', blank=True)
     frame_num = models.IntegerField(verbose_name='Number of Frames', null=True)
     fps = models.FloatField(verbose_name='Frame per Second', null=True)
     blink_count = models.IntegerField(verbose_name='Number of Blinks', help_text='Number of blinks in the video', null=True)
@@ -125,6 +180,8 @@ class VideoMetrics(models.Model):
     # meta
     class Meta:
         ordering = ['-create_datetime']
+        indexes = [models.Index(fields=['file_id', 'create_datetime']), # analyses of a file, newest first
+                   ]
         permissions = (('can_view_any_metric', 'View Any Metric'), # can view any metric across all users
                        ('can_edit_any_metric', 'Edit Any Metric'), # can update or delete any metric across all users
                 )
@@ -159,4 +216,196 @@ class ImageMetrics(models.Model):
     # methods
     def __str__(self):
         string = '%s (%s)' % (self.file_id, self.create_datetime)
-        return string
\ No newline at end of file
+        return string
+# In[]
+'''
+define a model to queue analysis of files. Jobs are created by the web pages and run by python manage.py run_analysis_worker.
+    # fields:
+        * id: uuid primary key
+        * file_id: foreign key to Files model
+        * calc_method: the calculation to run (see dashboard.analysis.JOB_RUNNERS), e.g. 'video_analysis'
+        * status: the state of the job
+            'q': Queued
+            'r': Running
+            's': Success
+            'e': Error
+        * params: a JSON dictionary of parameters for the calculation, e.g. {"track_param": {...}, "blink_param": {...}}
+        * errors: a JSON list of error messages of the calculation
+        * metrics: foreign key to the VideoMetrics entry created or updated by the job
+        * cache_hit: whether the result is reused from AnalysisCache. None for jobs that do not use the cache.
+        * requested_by: foreign key to the user who requested the job
+        * worker: the worker (host and pid) running the job
+        * create_datetime: the datetime when the job is queued
+        * start_datetime: the datetime when a worker starts the job
+        * finish_datetime: the datetime when the job is finished
+        * progress_stage: the current stage of a running job, e.g. 'tracking', 'saving'
+        * progress_frames: number of frames processed
+        * progress_total: number of frames in the video
+        * progress_fps: processed frames per second
+        * progress_datetime: the datetime of the last progress update. A running job that is not updated for long may be stuck.
+    # methods:
+        * get_params(): return params as a dictionary
+        * get_errors(): return errors as a list
+        * eta(): estimated seconds until all frames are processed, from the last progress update. None if unknown.
+'''
+class AnalysisJob(models.Model):
+    # fields
+    id = models.UUIDField(verbose_name='Unique ID', primary_key=True, default=uuid.uuid4, help_text='Unique Id for each analysis job')
+    file_id = models.ForeignKey(Files, on_delete=models.CASCADE)
+    calc_method = models.CharField(verbose_name='Calculation Method', max_length=50)
+    STATUS_CHOICES = (
+            ('q','Queued'),
+            ('r','Running'),
+            ('s','Success'),
+            ('e','Error'),
+            )
+    status = models.CharField(verbose_name='Job Status', max_length=1, choices=STATUS_CHOICES, default='q')
+    params = models.TextField(verbose_name='Parameters', default='{}', blank=True)
+    errors = models.TextField(verbose_name='Errors', default='[]', blank=True)
+    metrics = models.ForeignKey(VideoMetrics, on_delete=models.SET_NULL, null=True, blank=True)
+    cache_hit = models.NullBooleanField(verbose_name='Cache Hit')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    worker = models.CharField(verbose_name='Worker', max_length=100, default='', blank=True)
+    create_datetime = models.DateTimeField(verbose_name='Creation Datetime', auto_now_add=True)
+    start_datetime = models.DateTimeField(verbose_name='Start Datetime', null=True, blank=True)
+    finish_datetime = models.DateTimeField(verbose_name='Finish Datetime', null=True, blank=True)
+    progress_stage = models.CharField(verbose_name='Progress Stage', max_length=20, default='', blank=True)
+    progress_frames = models.IntegerField(verbose_name='Processed Frames', default=0)
+    progress_total = models.IntegerField(verbose_name='Total Frames', default=0)
+    progress_fps = models.FloatField(verbose_name='Processing Speed (fps)', default=0)
+    progress_datetime = models.DateTimeField(verbose_name='Progress Datetime', null=True, blank=True)
+
+    # meta
+    class Meta:
+        ordering = ['create_datetime']
+        # workers look up the oldest queued job
+        indexes = [models.Index(fields=['status', 'create_datetime'])]
+
+    # methods
+    def __str__(self):
+        string = '%s %s (%s)' % (self.calc_method, self.file_id, self.get_status_display())
+        return string
+
+    def get_params(self):
+        return json.loads(self.params or '{}')
+
+    def get_errors(self):
+        return json.loads(self.errors or '[]')
+
+    def eta(self):
+        return job_eta(self.progress_frames, self.progress_total, self.progress_fps)
+
+# estimated seconds until all frames are processed
+def job_eta(frames, total, fps):
+    if fps <= 0 or total <= 0:
+        return None
+    return max(total - frames, 0) / fps
+
+
+# In[]
+'''
+define a model to reuse the analysis of identical videos. An entry points to the VideoMetrics of the first analysis of a content hash with
+a version of the analyzer and a set of parameters; later analyses with the same key create VideoMetrics that share its stored files.
+    # fields:
+        * id: uuid primary key
+        * content_hash: Files.content_hash of the analyzed video
+        * analyzer_version: dashboard.analysis.ANALYZER_VERSION when the entry is created
+        * params_key: SHA-1 of the parameters of the analysis (see dashboard.analysis.params_key)
+        * metrics: foreign key to the VideoMetrics of the analysis
+        * size_bytes: size of the stored files of the analysis
+        * hit_count: number of analyses that reused the entry
+        * create_datetime: the datetime when the entry is created
+        * last_used_datetime: the datetime when the entry is created or last reused
+'''
+class AnalysisCache(models.Model):
+    # fields
+    id = models.UUIDField(verbose_name='Unique ID', primary_key=True, default=uuid.uuid4, help_text='Unique Id for each cached analysis')
+    content_hash = models.CharField(verbose_name='Content Hash', max_length=64)
+    analyzer_version = models.CharField(verbose_name='Analyzer Version', max_length=20)
+    params_key = models.CharField(verbose_name='Parameters Key', max_length=40)
+    metrics = models.ForeignKey(VideoMetrics, on_delete=models.CASCADE)
+    size_bytes = models.BigIntegerField(verbose_name='Size (bytes)', default=0)
+    hit_count = models.IntegerField(verbose_name='Count of Hits', default=0)
+    create_datetime = models.DateTimeField(verbose_name='Creation Datetime', auto_now_add=True)
+    last_used_datetime = models.DateTimeField(verbose_name='Last Used Datetime', auto_now_add=True)
+
+    # meta
+    class Meta:
+        ordering = ['-last_used_datetime']
+        unique_together = (('content_hash', 'analyzer_version', 'params_key'),)
+
+    # methods
+    def __str__(self):
+        string = '%s (%s, %s)' % (self.content_hash[:12], self.analyzer_version, self.params_key[:8])
+        return string
+
+
+# In[]
+'''
+define a model to store the state of a chunked upload (see dashboard.uploads). Chunks are written straight into the final location of the file,
+and the Files record is created once all bytes are received.
+    # fields:
+        * id: uuid primary key, the upload id used to resume an upload
+        * upload_by: foreign key to the user who uploads the file
+        * name: the name of the file entered by the user
+        * file_path: the storage name of the file being written, e.g. uploadfiles/<username>/<filename>
+        * total_size: size of the file in bytes
+        * chunk_size: size of the chunks in bytes; the last chunk may be smaller
+        * received_bytes: number of bytes received from the beginning of the file
+        * create_datetime: the datetime when the upload is started
+        * update_datetime: the datetime when the last chunk is received
+'''
+class UploadSession(models.Model):
+    # fields
+    id = models.UUIDField(verbose_name='Unique ID', primary_key=True, default=uuid.uuid4, help_text='Unique Id for each upload')
+    upload_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(verbose_name='File Name', max_length=100)
+    file_path = models.CharField(verbose_name='File Path', max_length=255)
+    total_size = models.BigIntegerField(verbose_name='Total Size (bytes)')
+    chunk_size = models.IntegerField(verbose_name='Chunk Size (bytes)')
+    received_bytes = models.BigIntegerField(verbose_name='Received Size (bytes)', default=0)
+    create_datetime = models.DateTimeField(verbose_name='Creation Datetime', auto_now_add=True)
+    update_datetime = models.DateTimeField(verbose_name='Update Datetime', auto_now=True)
+
+    # meta
+    class Meta:
+        ordering = ['-create_datetime']
+
+    # methods
+    def __str__(self):
+        string = '%s (%s, %d/%d bytes)' % (self.name, self.upload_by, self.received_bytes, self.total_size)
+        return string
+
+
+# In[]
+'''
+define a model to store the load time and memory of the facial recognition models in the analysis workers (see
+dashboard.management.commands.run_analysis_worker), so that the web processes export them in /metrics (see dashboard.metrics).
+    # fields:
+        * id: uuid primary key
+        * host: host name of the server running the worker
+        * model: name of the model in MLmodels.model_registry, e.g. 'predictor'
+        * load_seconds: time to load the model
+        * rss_bytes: increase of resident memory while loading the model. None if unknown (see MLmodels.model_registry.stats)
+        * pid: the process that loaded the model
+        * load_datetime: the datetime when the model was last loaded on the host
+'''
+class ModelLoad(models.Model):
+    # fields
+    id = models.UUIDField(verbose_name='Unique ID', primary_key=True, default=uuid.uuid4, help_text='Unique Id for each model load')
+    host = models.CharField(verbose_name='Host', max_length=100)
+    model = models.CharField(verbose_name='Model', max_length=50)
+    load_seconds = models.FloatField(verbose_name='Load Time (seconds)')
+    rss_bytes = models.BigIntegerField(verbose_name='Memory (bytes)', null=True, blank=True)
+    pid = models.IntegerField(verbose_name='Process ID')
+    load_datetime = models.DateTimeField(verbose_name='Load Datetime', auto_now=True)
+
+    # meta
+    class Meta:
+        ordering = ['host', 'model']
+        unique_together = (('host', 'model'),)
+
+    # methods
+    def __str__(self):
+        string = '%s on %s (%.2fs)' % (self.model, self.host, self.load_seconds)
+        return string
@@ -1,3 +1,794 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth.models import Permission
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import DatabaseError
+from django.utils import timezone
+from unittest import mock
+from dashboard import analysis, metrics, uploads, views
+from dashboard.models import AnalysisCache, AnalysisJob, Files, ModelLoad, UploadSession, VideoMetrics
+import cv2
+import datetime
+import dlib
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import MLmodels.facial_analysis as fa
+from MLmodels import series_data
 
-# Create your tests here.
+# a face box and 68 trackers offset by i
+def make_face(i):
+    pos = dlib.rectangle(i, i + 1, i + 20, i + 21)
+    shape = dlib.full_object_detection(pos, [dlib.point(i + p, i + 2 * p) for p in range(68)])
+    return pos, shape
+
+# In[]: face tracker results
+class FaceTrackerResultTests(SimpleTestCase):
+
+    def make_result(self, frames, capacity=1):
+        result = fa.FaceTrackerResult(capacity=capacity)
+        for f in range(frames):
+            if f % 3 == 2:
+                result.append(f / 30)
+            else:
+                pos, shape = make_face(f)
+                result.append(f / 30, pos, shape, fa.SOURCE_TRACKED if f % 3 else fa.SOURCE_DETECTED)
+        return result
+
+    def test_append_grows_beyond_capacity(self):
+        result = self.make_result(10, capacity=3)
+        self.assertEqual(len(result), 10)
+        self.assertGreaterEqual(len(result._valid), 10)
+        np.testing.assert_allclose(result.start_times, np.arange(10) / 30)
+        np.testing.assert_array_equal(result.valid, [f % 3 != 2 for f in range(10)])
+        np.testing.assert_array_equal(result.source[:3], [fa.SOURCE_DETECTED, fa.SOURCE_TRACKED, fa.SOURCE_NONE])
+        # frames written before growing are kept
+        np.testing.assert_array_equal(result.boxes[1], [1, 2, 21, 22])
+        np.testing.assert_array_equal(result.landmarks[4, 67], [4 + 67, 4 + 134])
+        # frames without a face are zeros
+        self.assertFalse(result.boxes[2].any())
+        self.assertFalse(result.landmarks[2].any())
+
+    def test_trim_releases_capacity(self):
+        result = self.make_result(5, capacity=100)
+        landmarks = result.landmarks.copy()
+        self.assertIs(result.trim(), result)
+        for name in fa.FaceTrackerResult.ARRAY_NAMES:
+            self.assertEqual(len(getattr(result, name)), 5)
+        np.testing.assert_array_equal(result.landmarks, landmarks)
+        # a trimmed result still grows
+        result.append(5 / 30)
+        self.assertEqual(len(result), 6)
+        self.assertFalse(result.valid[5])
+
+    def test_trim_fills_faces_to_all_frames(self):
+        result = self.make_result(4)
+        pos, shape = make_face(1)
+        result.add_face(7, 1, pos, shape)
+        result.trim()
+        face = result.faces[7]
+        self.assertEqual(len(face), 4)
+        np.testing.assert_array_equal(face.valid, [False, True, False, False])
+        np.testing.assert_allclose(face.start_times, result.start_times)
+
+    def test_legacy_keys(self):
+        result = self.make_result(4)
+        self.assertIn('tracker_coords', result)
+        self.assertIn('valid', result)
+        self.assertNotIn('eye_aspect_ratio', result)
+        self.assertTrue(np.shares_memory(result['tracker_coords'], result['tracker_shapes']))
+        np.testing.assert_array_equal(result['tracker_coords'], result.landmarks)
+        np.testing.assert_array_equal(result['head_positions'], result.boxes)
+        np.testing.assert_array_equal(result['valid'], result.valid)
+        np.testing.assert_array_equal(result['start_times'], result.start_times)
+        with self.assertRaises(KeyError):
+            result['landmarks']
+        self.assertEqual(set(result.keys()), set(fa.FaceTrackerResult.LEGACY_KEYS))
+
+    def test_concatenate_and_from_arrays(self):
+        first = self.make_result(4)
+        second = self.make_result(3, capacity=50)
+        merged = fa.FaceTrackerResult.concatenate([first, second])
+        self.assertEqual(len(merged), 7)
+        np.testing.assert_array_equal(merged.landmarks[4:], second.landmarks)
+        wrapped = fa.FaceTrackerResult.from_arrays(merged.start_times, merged.boxes, merged.landmarks, merged.valid)
+        self.assertEqual(len(wrapped), 7)
+        np.testing.assert_array_equal(wrapped.source, np.where(merged.valid, fa.SOURCE_DETECTED, fa.SOURCE_NONE))
+        # wrapped arrays are not copied
+        self.assertTrue(np.shares_memory(wrapped['tracker_coords'], merged.landmarks))
+
+# In[]: blink thresholds
+class WindowThresholdTests(SimpleTestCase):
+    ENGINES = ['heap', 'vectorized', 'naive']
+
+    def assert_engines_agree(self, ear, adj_f, auto_thresh_qt=0.4, k=10):
+        expected = fa.window_thresholds(ear, adj_f, auto_thresh_qt, engine='naive', k=k)
+        self.assertEqual(len(expected), len(ear))
+        for engine in self.ENGINES[:-1]:
+            thresholds = fa.window_thresholds(ear, adj_f, auto_thresh_qt, engine=engine, k=k)
+            np.testing.assert_allclose(thresholds, expected, err_msg='%s, adj_f %d' % (engine, adj_f))
+        return expected
+
+    def test_engines_agree_with_gaps(self):
+        rng = np.random.RandomState(0)
+        ear = rng.uniform(0.1, 0.35, 600)
+        # single missing frames and a gap longer than the windows
+        ear[rng.uniform(size=600) < 0.15] = np.nan
+        ear[200:280] = np.nan
+        for adj_f in [0, 1, 5, 12, 30, 700]:
+            self.assert_engines_agree(ear, adj_f)
+        # the window of frame 240 (adj_f 30) lies in the gap
+        thresholds = self.assert_engines_agree(ear, 30)
+        self.assertTrue(np.isnan(thresholds[240]))
+        self.assertFalse(np.isnan(thresholds[100]))
+
+    def test_engines_agree_with_ties(self):
+        ear = np.round(np.random.RandomState(1).uniform(0.1, 0.3, 300), 2)
+        for k in [1, 3, 10]:
+            self.assert_engines_agree(ear, 8, auto_thresh_qt=0.25, k=k)
+
+    def test_edge_windows(self):
+        ear = np.linspace(0.1, 0.3, 25)
+        thresholds = self.assert_engines_agree(ear, 10)
+        # frame 0 covers frames [0, 10): exactly k frames, so the k-th largest is the minimum
+        self.assertAlmostEqual(thresholds[0], ear[0])
+        # frame 24 covers frames [14, 24), the last frame is never part of a window
+        self.assertAlmostEqual(thresholds[24], ear[14])
+        # windows with less than k frames with a face have no threshold
+        thresholds = self.assert_engines_agree(ear, 4)
+        self.assertTrue(np.isnan(thresholds).all())
+
+    def test_short_series(self):
+        for frame_N in [0, 1, 2, 11]:
+            thresholds = self.assert_engines_agree(np.full(frame_N, 0.2), 20)
+            self.assertEqual(np.isnan(thresholds).all(), frame_N < 11)
+        self.assertEqual(len(self.assert_engines_agree(np.full(15, np.nan), 3)), 15)
+
+    def test_invalid_engine(self):
+        with self.assertRaises(ValueError):
+            fa.window_thresholds(np.zeros(3), 1, 0.4, engine='fast')
+
+# In[]: blink detection
+# 68 trackers of each frame whose right and left eyes both have the given eye aspect ratio: 100 pixels wide, lids ratio * 50 above and below
+def eye_landmarks(eye_aspect_ratio):
+    landmarks = np.zeros((len(eye_aspect_ratio), 68, 2))
+    for x0 in [36, 42]:
+        landmarks[:, x0 + 3, 0] = 100
+        for upper, lower, x in [(1, 5, 30), (2, 4, 70)]:
+            landmarks[:, [x0 + upper, x0 + lower], 0] = x
+            landmarks[:, x0 + upper, 1] = -50 * np.asarray(eye_aspect_ratio)
+            landmarks[:, x0 + lower, 1] = 50 * np.asarray(eye_aspect_ratio)
+    return landmarks
+
+class BlinkDetectionTests(SimpleTestCase):
+    FPS = 30
+
+    # open eyes with blinks of 1 to 6 frames, frames without a face, and closed eyes at the end of the video
+    def make_series(self, frame_N=900, seed=0):
+        rng = np.random.RandomState(seed)
+        ear = np.round(rng.uniform(0.25, 0.35, frame_N), 3)
+        f = 10
+        while f < frame_N - 20:
+            length = rng.randint(1, 7)
+            ear[f:f + length] = np.round(rng.uniform(0.05, 0.15, length), 3)
+            f += length + rng.randint(5, 40)
+        ear[-4:] = 0.05
+        valid = rng.uniform(size=frame_N) > 0.05
+        valid[300:360] = False
+        return ear, valid
+
+    def detect(self, ear, valid, blink_param):
+        return fa.detect_blink({'fps': self.FPS}, {'tracker_coords': eye_landmarks(ear), 'valid': valid}, blink_param=blink_param)
+
+    def test_sweep_matches_detect_blink(self):
+        grid = {'ratio_thresh': [0.1, 0.2], 'auto_thresh_win': [0, 1, 4], 'auto_thresh_qt': [0.2, 0.4, 0.6], 'consec_frame': [1, 2, 3, 5]}
+        for seed in range(3):
+            ear, valid = self.make_series(seed=seed)
+            eye_aspect_ratio, blink_count, errors = self.detect(ear, valid, {})
+            self.assertTrue(np.isnan(eye_aspect_ratio[~valid]).all())
+            results = fa.sweep_blink(eye_aspect_ratio, self.FPS, grid)
+            self.assertEqual(len(results), 2 * 4 + 3 * 3 * 4)
+            for result in results:
+                blink_param = dict(result)
+                expected = blink_param.pop('blink_count')
+                eye_aspect_ratio, blink_count, errors = self.detect(ear, valid, blink_param)
+                self.assertEqual(expected, blink_count[-1], '%s, seed %d' % (blink_param, seed))
+                self.assertEqual(errors, [])
+        self.assertGreater(max(result['blink_count'] for result in results), 0)
+
+    def test_runs_at_the_end_and_gaps(self):
+        ear = np.array([0.3] * 20 + [0.05] * 5)
+        valid = np.ones(len(ear), dtype=bool)
+        param = {'ratio_thresh': 0.1, 'consec_frame': 3}
+        # closed eyes until the end of the video are not a blink
+        self.assertEqual(self.detect(ear, valid, param)[1][-1], 0)
+        self.assertEqual(fa.sweep_blink(self.detect(ear, valid, {})[0], self.FPS, {'ratio_thresh': [0.1]})[0]['blink_count'], 0)
+        ear = np.append(ear, 0.3)
+        valid = np.append(valid, True)
+        blink_count = self.detect(ear, valid, param)[1]
+        # the blink is counted on the first frame after the run
+        self.assertEqual((blink_count[-2], blink_count[-1]), (0, 1))
+        # a frame without a face splits the run into two runs of 2 frames
+        valid[22] = False
+        self.assertEqual(self.detect(ear, valid, param)[1][-1], 0)
+        self.assertEqual(fa.sweep_blink(self.detect(ear, valid, {})[0], self.FPS, {'ratio_thresh': [0.1], 'consec_frame': [2, 3]}),
+                         [{'ratio_thresh': 0.1, 'consec_frame': 2, 'blink_count': 2}, {'ratio_thresh': 0.1, 'consec_frame': 3, 'blink_count': 0}])
+
+    def test_few_or_no_faces(self):
+        ear, valid = self.make_series(frame_N=40)
+        valid[:] = False
+        valid[:5] = True
+        # less than 10 frames with a face: no threshold is above the minimum, so no blink is counted
+        eye_aspect_ratio, blink_count, errors = self.detect(ear, valid, {'consec_frame': 1})
+        self.assertEqual(blink_count[-1], 0)
+        self.assertEqual(fa.sweep_blink(eye_aspect_ratio, self.FPS, {'consec_frame': [1]})[0]['blink_count'], 0)
+        valid[:] = False
+        eye_aspect_ratio, blink_count, errors = self.detect(ear, valid, {})
+        self.assertEqual(blink_count, [0] * 40)
+        self.assertIn('no face', errors[0])
+
+    def test_eye_ratio_batch_matches_eye_ratio_calc(self):
+        rng = np.random.RandomState(0)
+        landmarks = rng.randint(0, 200, (50, 68, 2)).astype(np.int16)
+        valid = rng.uniform(size=50) > 0.2
+        batch = fa.eye_ratio_batch(landmarks, valid)
+        for method in ['both', 'left', 'right']:
+            expected = [fa.eye_ratio_calc(landmarks[f], method) if valid[f] else np.nan for f in range(50)]
+            np.testing.assert_allclose(batch[method], expected, err_msg=method)
+        # frames whose eye corners coincide have no ratio
+        landmarks[0, 39] = landmarks[0, 36]
+        self.assertTrue(np.isnan(fa.eye_ratio_batch(landmarks)['right'][0]))
+        self.assertTrue(np.isnan(fa.eye_ratio_batch(landmarks)['both'][0]))
+        self.assertFalse(np.isnan(fa.eye_ratio_batch(landmarks)['left'][0]))
+
+# In[]: near-duplicate frames
+class DuplicateFrameTests(SimpleTestCase):
+    BOX = dlib.rectangle(100, 60, 200, 160)
+
+    # 68 trackers with both eyes (36-47) in rows 95-101 of the box
+    def predict(self, gray, pos):
+        points = [dlib.point(110 + p, 150) for p in range(68)]
+        for n, x in enumerate([120, 160]):
+            for i, (dx, dy) in enumerate([(0, 3), (6, 0), (12, 0), (18, 3), (12, 6), (6, 6)]):
+                points[36 + 6 * n + i] = dlib.point(x + dx, 95 + dy)
+        return dlib.full_object_detection(pos, points)
+
+    def setUp(self):
+        # a face is detected in the same box of every frame
+        patches = [mock.patch('MLmodels.model_registry.get_detector', return_value=lambda gray, upsample: [self.BOX]),
+                   mock.patch('MLmodels.model_registry.get_predictor', return_value=self.predict)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.frame = np.tile(np.linspace(40, 200, 320, dtype=np.uint8)[None, :, None], (240, 1, 3))
+
+    def test_blink_is_not_a_duplicate(self):
+        analyzer = fa.FrameAnalyzer({'duplicate_thresh': 2})
+        self.assertEqual(analyzer.process(self.frame, 0)[2], fa.SOURCE_DETECTED)
+        self.assertEqual(analyzer.process(self.frame.copy(), 1)[2], fa.SOURCE_REUSED)
+        # closed eyes: the lids cover the eye region, which is too small to change the thumbnail
+        closed = self.frame.copy()
+        closed[94:103, 118:200] = 0
+        gray = cv2.cvtColor(closed, cv2.COLOR_BGR2GRAY)
+        self.assertLessEqual(cv2.absdiff(analyzer._thumbnail(gray), analyzer.last_thumb).mean(), analyzer.duplicate_thresh)
+        pos, shape, source, faces = analyzer.process(closed, 2)
+        self.assertEqual(source, fa.SOURCE_DETECTED)
+        self.assertEqual(analyzer.counts['duplicate'], 1)
+        # the blink frame is the new reference
+        self.assertEqual(analyzer.process(closed.copy(), 3)[2], fa.SOURCE_REUSED)
+        self.assertEqual(analyzer.process(self.frame, 4)[2], fa.SOURCE_DETECTED)
+
+    def test_without_duplicate_thresh(self):
+        analyzer = fa.FrameAnalyzer({})
+        for f in range(3):
+            self.assertEqual(analyzer.process(self.frame, f)[2], fa.SOURCE_DETECTED)
+        self.assertEqual(analyzer.counts['duplicate'], 0)
+
+# In[]: uploads
+# uploaded and analyzed files are written to a temporary MEDIA_ROOT
+class MediaRootTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.client.login(username='alice', password='pw')
+
+class UploadSessionTests(MediaRootTestCase):
+    DATA = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 40
+
+    def start(self, data=DATA, filename='clip.mp4'):
+        response = self.client.post('/dashboard/upload/session/', {'name': 'clip', 'filename': filename, 'size': len(data)})
+        self.assertEqual(response.status_code, 200)
+        return '/dashboard/upload/session/%s' % response.json()['id']
+
+    def put(self, url, offset, chunk):
+        return self.client.put('%s?offset=%d' % (url, offset), chunk, content_type='application/octet-stream')
+
+    def test_resume_and_finish(self):
+        url = self.start()
+        self.assertEqual(self.put(url, 0, self.DATA[:4000]).json()['received_bytes'], 4000)
+        # an interrupted upload resumes at received_bytes
+        state = self.client.get(url).json()
+        self.assertEqual((state['received_bytes'], state['total_size']), (4000, len(self.DATA)))
+        self.assertEqual(self.client.post(url + '/finish').status_code, 400)
+        self.assertEqual(self.put(url, 4000, self.DATA[4000:]).status_code, 200)
+        response = self.client.post(url + '/finish')
+        self.assertEqual(response.status_code, 200)
+        file = Files.objects.get(pk=response.json()['file_id'])
+        self.assertEqual(file.upload_by, self.user)
+        self.assertEqual(file.file_type, 'v')
+        # the first analysis job hashes the file
+        self.assertEqual(file.content_hash, '')
+        with open(file.file.path, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_finish_once(self):
+        url = self.start()
+        self.assertEqual(self.put(url, 0, self.DATA).status_code, 200)
+        # a second request that loaded the session before the first one finished it
+        session = UploadSession.objects.get()
+        uploads.finish_session(UploadSession.objects.get())
+        with self.assertRaises(ValueError):
+            uploads.finish_session(session)
+        self.assertEqual(Files.objects.count(), 1)
+        self.assertEqual(self.client.post(url + '/finish').status_code, 404)
+
+    def test_offset_mismatch(self):
+        url = self.start()
+        self.assertEqual(self.put(url, 0, self.DATA[:4000]).status_code, 200)
+        # a repeated or skipped chunk is rejected and nothing is written
+        for offset in [0, 6000]:
+            response = self.put(url, offset, self.DATA[offset:offset + 2000])
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['received_bytes'], 4000)
+        self.assertEqual(UploadSession.objects.get().received_bytes, 4000)
+
+    def test_magic_bytes(self):
+        url = self.start(b'not a video' * 10)
+        response = self.put(url, 0, b'not a video' * 10)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('does not match', response.json()['error'])
+        self.assertEqual(UploadSession.objects.get().received_bytes, 0)
+        # extensions without magic bytes are not checked
+        url = self.start(b'plain text', filename='notes.txt')
+        self.assertEqual(self.put(url, 0, b'plain text').status_code, 200)
+
+    def test_magic_bytes_of_form_upload(self):
+        upload = SimpleUploadedFile('clip.mp4', b'not a video' * 10)
+        response = self.client.post('/dashboard/upload/', {'name': 'clip', 'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('file', response.context['form'].errors)
+        self.assertFalse(Files.objects.exists())
+        upload = SimpleUploadedFile('clip.mp4', self.DATA)
+        response = self.client.post('/dashboard/upload/', {'name': 'clip', 'file': upload})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Files.objects.get().content_hash, hashlib.sha256(self.DATA).hexdigest())
+
+    def test_other_user(self):
+        url = self.start()
+        User.objects.create_user('eve', 'eve@example.com', 'pw')
+        self.client.login(username='eve', password='pw')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.put(url, 0, self.DATA[:4000]).status_code, 404)
+
+# In[]: media files
+class MediaFileTests(MediaRootTestCase):
+    DATA = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.file = Files(name='clip', upload_by=self.user)
+        self.file.file.save('clip.mp4', ContentFile(self.DATA))
+        self.url = settings.MEDIA_URL + self.file.file.name
+
+    def login_other(self):
+        other = User.objects.create_user('eve', 'eve@example.com', 'pw')
+        self.client.login(username='eve', password='pw')
+        return other
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.content(response), self.DATA)
+
+    def test_ranges(self):
+        for header, start, end in [('bytes=0-99', 0, 99), ('bytes=1000-', 1000, 1023), ('bytes=-24', 1000, 1023), ('bytes=1000-5000', 1000, 1023)]:
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response['Content-Range'], 'bytes %d-%d/1024' % (start, end))
+            self.assertEqual(response['Content-Length'], str(end - start + 1))
+            self.assertEqual(self.content(response), self.DATA[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1024-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        # a changed file is sent whole
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.DATA)
+
+    def test_owner_only(self):
+        self.login_other()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        # users who can view any file
+        User.objects.get(username='eve').user_permissions.add(Permission.objects.get(codename='can_view_any_file'))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_paths_outside_user_directories(self):
+        for path in ['clip.mp4', 'uploadfiles/clip.mp4', 'other/alice/clip.mp4', 'uploadfiles/alice/../alice/clip.mp4', 'uploadfiles/alice/']:
+            self.assertEqual(self.client.get(settings.MEDIA_URL + path).status_code, 404, path)
+        self.assertEqual(self.client.get(settings.MEDIA_URL + 'uploadfiles/alice/missing.mp4').status_code, 404)
+
+    def test_shared_analysis_outputs(self):
+        metrics = VideoMetrics(file_id=self.file, calc_status='s')
+        metrics.series_data.save('clip_series.npz', ContentFile(self.DATA))
+        url = settings.MEDIA_URL + metrics.series_data.name
+        other = self.login_other()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        # an analysis of another file reused from the cache refers to the same series data
+        other_file = Files.objects.create(name='copy', upload_by=other, file='uploadfiles/eve/copy.mp4')
+        VideoMetrics.objects.create(file_id=other_file, calc_status='s', series_data=metrics.series_data.name)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+# In[]: result cache
+# videos and analyses of the analysis tests
+class AnalysisTestCase(MediaRootTestCase):
+    PARAMS = {'blink_param': {'consec_frame': 2}}
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.file = self.make_file('clip', self.user)
+
+    def make_file(self, name, user, content_hash='a' * 64):
+        return Files.objects.create(name=name, upload_by=user, file='uploadfiles/%s/%s.mp4' % (user.username, name), file_type='v',
+                                    content_hash=content_hash)
+
+    # a successful analysis of the file with 100 bytes of landmark data and 50 bytes of series data, shown as its latest analysis
+    def analyze(self, file):
+        video_metrics = VideoMetrics(file_id=file, calc_status='s', analyzer_version=analysis.ANALYZER_VERSION)
+        video_metrics.landmark_data.save('%s_landmarks.bin' % file.name, ContentFile(b'l' * 100), save=False)
+        video_metrics.series_data.save('%s_series.npz' % file.name, ContentFile(b's' * 50), save=False)
+        video_metrics.save()
+        analysis._mark_analyzed(file, video_metrics)
+        return video_metrics
+
+class AnalysisCacheTests(AnalysisTestCase):
+
+    def cache(self, file, params=None):
+        return analysis.store_cache(file, self.PARAMS if params is None else params, self.analyze(file))
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(analysis.lookup_cache(self.file, self.PARAMS))
+        entry = self.cache(self.file)
+        self.assertEqual(entry.size_bytes, 150)
+        copy = self.make_file('copy', self.other)
+        self.assertEqual(analysis.lookup_cache(copy, self.PARAMS), entry)
+        # other parameters, contents or analyzer versions miss
+        self.assertIsNone(analysis.lookup_cache(copy, {}))
+        self.assertIsNone(analysis.lookup_cache(self.make_file('new', self.other, content_hash='b' * 64), self.PARAMS))
+        self.assertIsNone(analysis.lookup_cache(self.make_file('unhashed', self.other, content_hash=''), self.PARAMS))
+        with mock.patch.object(analysis, 'ANALYZER_VERSION', '0'):
+            self.assertIsNone(analysis.lookup_cache(copy, self.PARAMS))
+
+        video_metrics = analysis.metrics_from_cache(copy, entry)
+        # the stored files are shared, not copied
+        self.assertEqual(video_metrics.landmark_data.name, entry.metrics.landmark_data.name)
+        self.assertEqual(video_metrics.series_data.name, entry.metrics.series_data.name)
+        copy = Files.objects.get(pk=copy.pk)
+        self.assertEqual((copy.count_analyzed, copy.latest_metrics), (1, video_metrics))
+        self.assertEqual(AnalysisCache.objects.get().hit_count, 1)
+
+    def test_store_only_successful_analyses(self):
+        video_metrics = self.analyze(self.file)
+        video_metrics.calc_status = 'e'
+        self.assertIsNone(analysis.store_cache(self.file, self.PARAMS, video_metrics))
+        self.assertIsNone(analysis.store_cache(self.make_file('unhashed', self.user, content_hash=''), self.PARAMS, self.analyze(self.file)))
+        self.assertFalse(AnalysisCache.objects.exists())
+        # the first analysis of the same video and params stays cached
+        first = self.cache(self.file)
+        self.assertEqual(self.cache(self.file), first)
+
+    def set_last_used(self, entry, days):
+        AnalysisCache.objects.filter(pk=entry.pk).update(last_used_datetime=timezone.now() - datetime.timedelta(days=days))
+
+    def test_evict_by_size(self):
+        in_use = self.cache(self.file)
+        other = self.make_file('other', self.other, content_hash='b' * 64)
+        evictable = self.cache(other)
+        self.set_last_used(in_use, 10)
+        self.set_last_used(evictable, 5)
+        # a newer analysis of the other file replaces the cached one as its latest
+        self.analyze(other)
+        storage = evictable.metrics.landmark_data.storage
+        self.assertEqual(analysis.evict_cache(max_bytes=0, dry_run=True), {'evicted': 1, 'freed_bytes': 0, 'size_bytes': 150})
+        self.assertTrue(storage.exists(evictable.metrics.landmark_data.name))
+
+        # the least recently used entry is still the latest analysis of its file: it is kept and counted
+        self.assertEqual(analysis.evict_cache(max_bytes=0), {'evicted': 1, 'freed_bytes': 150, 'size_bytes': 150})
+        self.assertEqual(list(AnalysisCache.objects.all()), [in_use])
+        self.assertTrue(storage.exists(in_use.metrics.landmark_data.name))
+        self.assertFalse(storage.exists(evictable.metrics.landmark_data.name))
+        self.assertFalse(storage.exists(evictable.metrics.series_data.name))
+        evicted_metrics = VideoMetrics.objects.get(pk=evictable.metrics.pk)
+        self.assertFalse(evicted_metrics.landmark_data)
+        self.assertFalse(evicted_metrics.series_data)
+        # the kept entry still serves hits
+        self.assertEqual(analysis.lookup_cache(self.make_file('copy', self.other), self.PARAMS), in_use)
+
+    def test_evict_by_age(self):
+        in_use = self.cache(self.file)
+        other = self.make_file('other', self.other, content_hash='b' * 64)
+        old = self.cache(other)
+        recent = self.cache(self.make_file('recent', self.other, content_hash='c' * 64))
+        self.analyze(other)
+        self.set_last_used(in_use, 100)
+        self.set_last_used(old, 100)
+        self.assertEqual(analysis.evict_cache(max_age_days=30), {'evicted': 1, 'freed_bytes': 150, 'size_bytes': 300})
+        self.assertEqual(set(AnalysisCache.objects.all()), {in_use, recent})
+        # the files become evictable once the file is analyzed again
+        self.analyze(self.file)
+        self.assertEqual(analysis.evict_cache(max_age_days=30), {'evicted': 1, 'freed_bytes': 150, 'size_bytes': 150})
+        self.assertEqual(list(AnalysisCache.objects.all()), [recent])
+
+# In[]: prometheus metrics
+class MetricsTests(TestCase):
+
+    def test_model_loads_of_workers(self):
+        metrics.record_model_loads({'detector': {'load_seconds': 0.5, 'rss_bytes': None, 'pid': 10},
+                                    'predictor': {'load_seconds': 1.25, 'rss_bytes': 2**20, 'pid': 10}})
+        # a restarted worker replaces the loads of its host
+        metrics.record_model_loads({'predictor': {'load_seconds': 1.5, 'rss_bytes': 2**20, 'pid': 11}})
+        self.assertEqual(ModelLoad.objects.count(), 2)
+        with override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=['127.0.0.1']):
+            text = self.client.get('/metrics').content.decode()
+        host = ModelLoad.objects.get(model='predictor').host
+        self.assertIn('videoanalyzer_model_load_seconds{host="%s",model="detector"} 0.5\n' % host, text)
+        self.assertIn('videoanalyzer_model_load_seconds{host="%s",model="predictor"} 1.5\n' % host, text)
+        self.assertIn('videoanalyzer_model_memory_bytes{host="%s",model="predictor"} 1048576\n' % host, text)
+        # memory is unknown without psutil
+        self.assertNotIn('videoanalyzer_model_memory_bytes{host="%s",model="detector"}' % host, text)
+
+# In[]: job queue
+class AnalysisWorkerTests(SimpleTestCase):
+
+    def test_database_errors_do_not_stop_the_worker(self):
+        from dashboard.management.commands import run_analysis_worker
+        job = mock.Mock(calc_method='video_analysis', id='1', status='s')
+        with mock.patch.object(analysis, 'claim_job', side_effect=[DatabaseError('server closed the connection'), job, None]) as claim_job, \
+                mock.patch.object(analysis, 'run_job', return_value=job) as run_job, \
+                mock.patch('django.db.connections.close_all'), mock.patch('django.db.close_old_connections') as close_old_connections, \
+                mock.patch('time.sleep'), mock.patch('traceback.print_exc'), mock.patch('builtins.print'):
+            run_analysis_worker.work(poll=1, once=True)
+        self.assertEqual(claim_job.call_count, 3)
+        run_job.assert_called_once_with(job)
+        # stale connections are dropped before each claim
+        self.assertEqual(close_old_connections.call_count, 3)
+
+class JobQueueTests(AnalysisTestCase):
+
+    def set_datetime(self, job, **seconds_ago):
+        AnalysisJob.objects.filter(pk=job.pk).update(**dict((field, timezone.now() - datetime.timedelta(seconds=seconds))
+                                                            for field, seconds in seconds_ago.items()))
+
+    def other_file(self):
+        return self.make_file('other', self.other, content_hash='b' * 64)
+
+    def test_enqueue_reuses_queued_and_running_jobs(self):
+        job = analysis.enqueue_job(self.file, 'video_analysis', self.user, {'track_param': {}, 'blink_param': {}})
+        # the same params in another key order are the same job
+        self.assertEqual(analysis.enqueue_job(self.file, 'video_analysis', self.other, {'blink_param': {}, 'track_param': {}}), job)
+        self.assertNotEqual(analysis.enqueue_job(self.file, 'video_analysis', self.user, self.PARAMS), job)
+        self.assertNotEqual(analysis.enqueue_job(self.file, 'blink_analysis', self.user, {'track_param': {}, 'blink_param': {}}), job)
+        self.assertEqual(analysis.claim_job('w1'), job)
+        self.assertEqual(analysis.enqueue_job(self.file, 'video_analysis', self.user, {'track_param': {}, 'blink_param': {}}), job)
+        # a finished job is never reused
+        AnalysisJob.objects.filter(pk=job.pk).update(status='s')
+        self.assertNotEqual(analysis.enqueue_job(self.file, 'video_analysis', self.user, {'track_param': {}, 'blink_param': {}}), job)
+        with self.assertRaises(ValueError):
+            analysis.enqueue_job(self.file, 'transcript', self.user)
+
+    def test_claim_oldest_first(self):
+        first = analysis.enqueue_job(self.file, 'video_analysis', self.user)
+        second = analysis.enqueue_job(self.file, 'video_export', self.user)
+        self.set_datetime(first, create_datetime=10)
+        job = analysis.claim_job('host:1')
+        self.assertEqual(job, first)
+        job = AnalysisJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.worker), ('r', 'host:1'))
+        self.assertIsNotNone(job.start_datetime)
+        self.assertEqual(job.progress_datetime, job.start_datetime)
+        self.assertEqual(analysis.claim_job('host:2'), second)
+        self.assertIsNone(analysis.claim_job('host:3'))
+
+    def test_requeue_by_heartbeat(self):
+        stale = analysis.enqueue_job(self.file, 'video_analysis', self.user)
+        reporting = analysis.enqueue_job(self.file, 'video_export', self.user)
+        legacy = analysis.enqueue_job(self.file, 'blink_analysis', self.user)
+        for job in [stale, reporting, legacy]:
+            analysis.claim_job('host:1')
+        queued = analysis.enqueue_job(self.other_file(), 'video_analysis', self.user)
+        self.set_datetime(stale, start_datetime=600, progress_datetime=120)
+        # a long analysis that still reports progress is not stale
+        self.set_datetime(reporting, start_datetime=600)
+        analysis.job_progress(reporting)({'stage': 'tracking', 'frames': 10, 'total_frame': 100, 'fps': 5.0})
+        # jobs claimed without a heartbeat fall back to their start
+        AnalysisJob.objects.filter(pk=legacy.pk).update(progress_datetime=None)
+        self.set_datetime(legacy, start_datetime=600)
+        self.assertEqual(analysis.requeue_stale_jobs(60), 2)
+        statuses = dict(AnalysisJob.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[job.pk] for job in [stale, reporting, legacy, queued]], ['q', 'r', 'q', 'q'])
+        job = AnalysisJob.objects.get(pk=stale.pk)
+        self.assertEqual((job.worker, job.start_datetime, job.progress_datetime), ('', None, None))
+
+    def test_run_job_from_cache(self):
+        analysis.store_cache(self.file, self.PARAMS, self.analyze(self.file))
+        copy = self.make_file('copy', self.other)
+        job = analysis.enqueue_job(copy, 'video_analysis', self.other, self.PARAMS)
+        with mock.patch.object(analysis, 'compute_video_analysis', side_effect=AssertionError('the video is analyzed')):
+            job = analysis.run_job(analysis.claim_job('host:1'))
+        job = AnalysisJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.get_errors(), job.cache_hit), ('s', [], True))
+        self.assertEqual(Files.objects.get(pk=copy.pk).latest_metrics, job.metrics)
+        self.assertIsNotNone(job.finish_datetime)
+        self.assertEqual(analysis.cache_stats()['hits'], 1)
+
+    def test_run_job_hashes_and_reports_failures(self):
+        file = Files(name='new', upload_by=self.user, file_type='v')
+        file.file.save('new.mp4', ContentFile(b'video'))
+        job = analysis.enqueue_job(file, 'video_analysis', self.user)
+        with mock.patch.object(analysis, 'compute_video_analysis', side_effect=IOError('cannot decode')), \
+                mock.patch('traceback.print_exc'):
+            analysis.run_job(analysis.claim_job('host:1'))
+        job = AnalysisJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.get_errors(), job.cache_hit), ('e', ['The analysis failed unexpectedly.'], False))
+        # files uploaded in chunks are hashed by their first job
+        self.assertEqual(Files.objects.get(pk=file.pk).content_hash, hashlib.sha256(b'video').hexdigest())
+        self.assertEqual(analysis.cache_stats()['misses'], 1)
+
+# In[]: blink re-analysis
+class BlinkReanalysisTests(AnalysisTestCase):
+    # open eyes with 3 blinks of 2, 3 and 5 frames
+    EAR = np.array([0.3] * 10 + [0.06] * 2 + [0.3] * 10 + [0.06] * 3 + [0.3] * 10 + [0.06] * 5 + [0.3] * 10)
+
+    # a successful analysis of the file with series data of the trackers of EAR
+    def analyze_series(self, file, params, calc_status='s'):
+        frame_N = len(self.EAR)
+        face_tracker = fa.FaceTrackerResult.from_arrays(np.arange(frame_N) / 30.0, np.zeros((frame_N, 4), dtype=np.int16),
+                                                        eye_landmarks(self.EAR).astype(np.int16), np.ones(frame_N, dtype=bool))
+        summary = {'fps': 30.0, 'total_frame': frame_N, 'width': 640, 'height': 360}
+        eye_aspect_ratio, blink_count, errors = fa.detect_blink(summary, face_tracker)
+        path = os.path.join(self.media_root, 'series.npz')
+        series_data.write_series_data(face_tracker, eye_aspect_ratio, blink_count, summary, path)
+        video_metrics = VideoMetrics(file_id=file, calc_status=calc_status, analyzer_version=analysis.ANALYZER_VERSION, params=json.dumps(params))
+        video_metrics.landmark_data.save('%s_landmarks.bin' % file.name, ContentFile(b'l' * 100), save=False)
+        with open(path, 'rb') as f:
+            video_metrics.series_data.save('%s_series.npz' % file.name, File(f), save=False)
+        video_metrics.save()
+        analysis._mark_analyzed(file, video_metrics)
+        return video_metrics
+
+    def run_blink_job(self, params):
+        job = analysis.enqueue_job(self.file, 'blink_analysis', self.user, params)
+        job = analysis.run_job(analysis.claim_job('host:1'))
+        return AnalysisJob.objects.get(pk=job.pk)
+
+    def assert_based_on(self, video_metrics, source):
+        # the series data has only the blink columns and refers to the trackers of the source
+        base = series_data.base_reference(video_metrics.series_data.path)
+        base_name = os.path.normpath(os.path.join(os.path.dirname(video_metrics.series_data.name), base))
+        self.assertEqual(base_name, os.path.normpath(source.series_data.name))
+        self.assertEqual(video_metrics.landmark_data.name, source.landmark_data.name)
+        meta, series = series_data.read_series_data(video_metrics.series_data.path)
+        np.testing.assert_array_equal(series['landmarks'], series_data.read_series_data(source.series_data.path)[1]['landmarks'])
+
+    def test_source_with_the_same_trackers(self):
+        dense = self.analyze_series(self.file, {'track_param': {}})
+        scheduled = self.analyze_series(self.file, {'track_param': {'detect_every': 2}})
+        # newer analyses that cannot be reused: failed, or adaptive trackers
+        self.analyze_series(self.file, {'track_param': {}}, calc_status='e')
+        self.analyze_series(self.file, {'track_param': {}, 'sample_param': {'sample_every': 3}})
+        job = self.run_blink_job({'track_param': {}, 'blink_param': {'ratio_thresh': 0.1, 'consec_frame': 3}})
+        self.assertEqual((job.status, job.metrics.blink_count), ('s', 2))
+        self.assert_based_on(job.metrics, dense)
+        job = self.run_blink_job({'track_param': {'detect_every': 2}, 'blink_param': {'ratio_thresh': 0.1, 'consec_frame': 2}})
+        self.assertEqual((job.status, job.metrics.blink_count), ('s', 3))
+        self.assert_based_on(job.metrics, scheduled)
+        self.assertEqual(Files.objects.get(pk=self.file.pk).latest_metrics, job.metrics)
+
+    def test_reanalysis_of_a_reanalysis(self):
+        dense = self.analyze_series(self.file, {'track_param': {}})
+        first = self.run_blink_job({'track_param': {}, 'blink_param': {'ratio_thresh': 0.1, 'consec_frame': 5}}).metrics
+        self.assertEqual(first.blink_count, 1)
+        # the newest source is the first re-analysis; its base is used, so references never chain
+        second = self.run_blink_job({'track_param': {}, 'blink_param': {'ratio_thresh': 0.1, 'consec_frame': 1}}).metrics
+        self.assertEqual(second.blink_count, 3)
+        self.assert_based_on(second, dense)
+
+    def test_analyze_without_a_source(self):
+        self.analyze_series(self.file, {'track_param': {'detect_every': 2}})
+        self.analyze_series(self.file, {'track_param': {}, 'sample_param': {'sample_every': 3}})
+        for params in [{'track_param': {}, 'blink_param': {}}, {'track_param': {'detect_every': 2}, 'sample_param': {}}]:
+            with mock.patch.object(analysis, 'video_analysis_job', return_value=(None, 'e', [])) as video_analysis_job:
+                self.run_blink_job(params)
+            self.assertEqual(video_analysis_job.call_count, 1, params)
+
+# In[]: file lists
+class AllFilesPaginationTests(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.user_permissions.add(Permission.objects.get(codename='can_view_any_file'))
+        base = timezone.now() - datetime.timedelta(days=1)
+        # files uploaded at the same time are ordered by id
+        for n, seconds in enumerate([0, 10, 10, 10, 20, 30, 30]):
+            file = self.upload('file %d' % n)
+            Files.objects.filter(pk=file.pk).update(upload_datetime=base + datetime.timedelta(seconds=seconds))
+        self.expected = list(Files.objects.order_by('-upload_datetime', '-id').values_list('id', flat=True))
+
+    def upload(self, name):
+        file = Files(name=name, upload_by=self.user)
+        file.file.save('clip.mp4', ContentFile(b'video'))
+        return file
+
+    def pages(self):
+        pages = []
+        cursor = None
+        while True:
+            response = self.client.get('/dashboard/allfiles/', {'after': cursor} if cursor else {})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['is_first_page'], cursor is None)
+            self.assertEqual(response.context['file_count'], Files.objects.count())
+            pages.append([file.id for file in response.context['all_files']])
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                return pages
+            # files uploaded while browsing do not shift the next pages
+            self.upload('new')
+
+    def test_pages_follow_the_cursor(self):
+        # pages end between files uploaded at the same time
+        with mock.patch.object(views, 'FILES_PER_PAGE', 2):
+            pages = self.pages()
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_last_page_is_full(self):
+        with mock.patch.object(views, 'FILES_PER_PAGE', 7):
+            self.assertEqual(self.pages(), [self.expected])
+
+    def test_cursor(self):
+        file = Files.objects.get(pk=self.expected[2])
+        self.assertEqual(views.parse_file_cursor(views.file_cursor(file)), (file.upload_datetime, file.id))
+        for cursor in ['abc', '12.34', '12', '12.%s.1' % file.id.hex]:
+            self.assertEqual(self.client.get('/dashboard/allfiles/', {'after': cursor}).status_code, 404, cursor)
@@ -0,0 +1,104 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from dashboard.models import Files, UploadSession, user_upload_path, magic_bytes_match, MAGIC_HEAD_SIZE
+import datetime
+import os
+
+# In[]: chunked upload
+'''
+define functions for chunked, resumable uploads. A browser uploads a file in chunks of UPLOAD_CHUNK_SIZE bytes:
+    1. create_session(): the file is created empty at its final storage location (uploadfiles/<username>/<filename>)
+    2. write_chunk(): each chunk is streamed from the request straight into the file at its offset. Chunks are accepted in order only, so
+        an interrupted upload resumes at session.received_bytes (GET the session to find it).
+    3. finish_session(): the Files record is created, referring to the written file without copying it. The file is not hashed here, as
+        reading a large video again could outlast the request; its content_hash is left empty and set by the first analysis job
+        (see dashboard.analysis).
+The magic bytes are checked against the file extension when the first chunk arrives, and again on the written file by finish_session.
+Nothing is kept in the memory of the process, so chunks can arrive at any process (e.g. any gunicorn worker).
+    * create_session(user, name, filename, total_size): return a new UploadSession
+    * write_chunk(session, offset, stream, length): write length bytes read from stream at offset. Return (received_bytes, accepted), where
+        accepted is False if offset is not the next expected byte (nothing is written).
+    * finish_session(session): return the new Files record. Raise ValueError if the upload is incomplete or already finished.
+    * clear_sessions(hours): delete sessions not updated for hours and their partial files
+Invalid requests raise ValueError.
+'''
+# size of chunks sent by the browser
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# size of blocks read from the request and written to the file
+STREAM_BLOCK_SIZE = 64 * 1024
+
+def create_session(user, name, filename, total_size):
+    name = name.strip()
+    if len(name) == 0 or len(name) > 100:
+        raise ValueError('Enter a name for the file (less than 100 characters)')
+    if total_size <= 0:
+        raise ValueError('The file is empty')
+    filename = default_storage.get_valid_name(os.path.basename(filename))
+    # reserve the final location with an empty file; save() picks an available name
+    file_path = default_storage.save(user_upload_path(Files(upload_by=user), filename), ContentFile(b''))
+    session = UploadSession.objects.create(upload_by=user, name=name, file_path=file_path, total_size=total_size, chunk_size=UPLOAD_CHUNK_SIZE)
+    return session
+
+def write_chunk(session, offset, stream, length):
+    if offset != session.received_bytes:
+        return session.received_bytes, False
+    if length <= 0 or length > session.chunk_size or offset + length > session.total_size:
+        raise ValueError('Invalid chunk size: %d' % length)
+    extension = os.path.splitext(session.file_path)[1].upper()
+
+    written = 0
+    with open(default_storage.path(session.file_path), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            data = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+            if not data:
+                break
+            if offset == 0 and written == 0 and not magic_bytes_match(extension, data):
+                raise ValueError('The content of the file does not match its extension %s' % extension)
+            f.write(data)
+            written += len(data)
+    if written != length:
+        raise ValueError('Incomplete chunk: %d of %d bytes received' % (written, length))
+
+    # only one request can move received_bytes forward from offset
+    if UploadSession.objects.filter(pk=session.pk, received_bytes=offset).update(received_bytes=offset + length, update_datetime=timezone.now()) == 0:
+        session.refresh_from_db()
+        return session.received_bytes, False
+    session.received_bytes = offset + length
+    return session.received_bytes, True
+
+def finish_session(session):
+    with transaction.atomic():
+        # lock the session, so that of concurrent requests to finish the upload only the first creates the Files record
+        session = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+        if session is None:
+            raise ValueError('The upload is already finished')
+        if session.received_bytes != session.total_size:
+            raise ValueError('The upload is incomplete: %d of %d bytes received' % (session.received_bytes, session.total_size))
+        path = default_storage.path(session.file_path)
+        # drop bytes beyond the end written by an interrupted chunk
+        with open(path, 'r+b') as f:
+            f.truncate(session.total_size)
+            head = f.read(MAGIC_HEAD_SIZE)
+        extension = os.path.splitext(session.file_path)[1].upper()
+        if not magic_bytes_match(extension, head):
+            raise ValueError('The content of the file does not match its extension %s' % extension)
+
+        file = Files(name=session.name, upload_by=session.upload_by)
+        file.file.name = session.file_path
+        file.pop_file_type(save=False)
+        file.save()
+        session.delete()
+    return file
+
+def clear_sessions(hours):
+    limit = timezone.now() - datetime.timedelta(hours=hours)
+    sessions = UploadSession.objects.filter(update_datetime__lt=limit)
+    count = 0
+    for session in sessions:
+        default_storage.delete(session.file_path)
+        session.delete()
+        count += 1
+    return count
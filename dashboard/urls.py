@@ -9,6 +9,11 @@ urlpatterns = [
         # file upload page that user uploads files
         path('upload/', views.file_upload_view, name='uploadfile'),
         
+        # ajax calls of the upload page to upload a file in chunks: start, resume or write a chunk, and finish an upload
+        path('upload/session/', views.upload_session_create_view, name='upload_session'),
+        path('upload/session/<uuid:pk>', views.upload_session_view, name='upload_session_detail'),
+        path('upload/session/<uuid:pk>/finish', views.upload_session_finish_view, name='upload_session_finish'),
+        
         # file upload sucess page that indicates success upload and display file details 
         path('upload/done/<uuid:pk>', views.file_upload_sucess_view, name='uploadfile_done'),
         
@@ -21,9 +26,8 @@ urlpatterns = [
         # file delete page that use can delete a file
         path('file/delete/<uuid:pk>', views.file_delete_view, name='deletefile'),
         
-        # a wait page displayed to use while waiting for backend calculation
-        # pass calc_url to indicate the type of analysis to do on file
-        path('waiting/<str:calc_url>/<uuid:pk>', views.wait_for_calculation_view, name='waiting'),
+        # a wait page displayed to use while an analysis job runs in the background worker
+        path('waiting/<uuid:pk>', views.wait_for_calculation_view, name='waiting'),
 
         # view file page that show unclassified files
         path('file/details/<uuid:pk>', views.file_details_view, name='filedetails'),
@@ -31,8 +35,11 @@ urlpatterns = [
         # view file page that shows video contents and analysis results
 #        path('file/video/details/<uuid:pk>', views.video_details_view, name='videodetails'),
         
-        # ajax call to analyze video file in backend. The name will be used in calc_url argument in wasting page
-        path('__calculation/video_analysis/<uuid:pk>', views.video_analysis_calc, name='video_analysis'),
+        # ajax call polled by the waiting page to check the status of an analysis job
+        path('__calculation/job_status/<uuid:pk>', views.job_status_view, name='job_status'),
+        
+        # per-frame time series of the latest analysis of a video, for a time range
+        path('__data/series/<uuid:pk>', views.series_data_view, name='series_data'),
         
         # view file page that shows image contents and analysis results
 #        path('file/image/details/<uuid:pk>', views.image_details_view, name='imagedetails'),
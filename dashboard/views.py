@@ -1,17 +1,20 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from dashboard.models import Files, VideoMetrics, ImageMetrics, FILE_EXTENSION_TO_TYPE
-from django.http import HttpResponseRedirect, JsonResponse
+from dashboard.models import Files, VideoMetrics, ImageMetrics, AnalysisJob, FILE_EXTENSION_TO_TYPE, job_eta
+from dashboard import analysis
+from django.http import HttpResponseRedirect, JsonResponse, Http404
+from django.core.exceptions import PermissionDenied
 from django.urls import reverse
-from dashboard.forms import FileUploadModelForm
+from dashboard.forms import FileUploadModelForm, BlinkParamForm
 from django.views import generic
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 import datetime
-import MLmodels.facial_analysis as fa
-from django.conf import settings
-from django.core.files import File
-from django.template.defaultfilters import slugify
-import os
+from django.utils import timezone
+from django.db.models import Count, Q
+import json
+import uuid
+import numpy as np
+from MLmodels import series_data
 
 # Type of files that are supported in analysis
 SUPPORTED_FILE_TYPE ={
@@ -27,7 +30,6 @@ SUPPORTED_FILE_TYPE ={
 define a functional view that display summary information about user files. 
     # user login required
     # context - 
-        * my_files: the list of Files record that uploaded by logged in user.
         * file_count: the total number of files uploaded by user. 0 is stored if there is no file.
         * last_upload_file: the name of the last uploaded file. None is stored if there is no file.
         * last_upload_datetime: the datetime of the last uploaded file. None is stored if there is no file.
@@ -37,25 +39,14 @@ define a functional view that display summary information about user files.
 '''
 @login_required
 def index_view(request):
-    # retrieve all files of logged in user
-    my_files = Files.objects.filter(upload_by=request.user).order_by('-upload_datetime')
+    # count and latest upload of logged in user, both from the (upload_by, upload_datetime) index
+    my_files = Files.objects.filter(upload_by=request.user)
     file_count = my_files.count()
-    # in case of no file 
-    if file_count == 0:
-        context = {'my_files': my_files,
-                   'file_count': file_count,
-                   'last_upload_file': None,
-                   'last_upload_datetime': None,
-                   'user': request.user}
-    # in case of at lease one file
-    else:       
-        last_upload_file = my_files[0].name
-        last_upload_datetime = my_files[0].upload_datetime
-        context = {'my_files': my_files,
-                   'file_count': file_count,
-                   'last_upload_file': last_upload_file,
-                   'last_upload_datetime': last_upload_datetime,
-                   'user': request.user}
+    last_upload = my_files.order_by('-upload_datetime').values('name', 'upload_datetime').first()
+    context = {'file_count': file_count,
+               'last_upload_file': last_upload['name'] if last_upload is not None else None,
+               'last_upload_datetime': last_upload['upload_datetime'] if last_upload is not None else None,
+               'user': request.user}
     # count number of visits in session
     num_visits = request.session.get('num_visits', 0)
     num_visits += 1
@@ -86,16 +77,77 @@ def file_upload_view(request):
             uploadfile.name = upload_form.cleaned_data['name']
             uploadfile.file = upload_form.cleaned_data['file']
             uploadfile.upload_by = request.user
-            uploadfile.pop_file_type()
+            # hash the content while the upload is at hand, so that analysis of identical videos can be reused
+            uploadfile.pop_content_hash(save=False)
+            uploadfile.pop_file_type(save=False)
             uploadfile.save()
             # redirect to file upload sucess page
             return HttpResponseRedirect(reverse('uploadfile_done', args=[uploadfile.id]))
     else:
         upload_form = FileUploadModelForm()
     
-    context = {'form':upload_form}
+    context = {'form':upload_form, 'chunk_size':uploads.UPLOAD_CHUNK_SIZE}
     return render(request, 'upload_file.html', context)
 
+'''
+define views for chunked, resumable uploads (see dashboard.uploads), used by the upload page when the browser supports it. The form post of
+file_upload_view remains the fallback. All views return json, with an 'error' message and status 400 for invalid requests.
+    # user login required; only the user who started an upload can continue it
+    # upload_session_create_view - POST name, filename, size: start an upload
+        * context: id, chunk_size, received_bytes
+    # upload_session_view - GET: the state of an upload, to resume it; PUT with GET offset: write the request body at offset
+        * context: id, chunk_size, received_bytes, total_size. A chunk at another offset than received_bytes is rejected with status 409.
+    # upload_session_finish_view - POST: create the Files record once all bytes are received
+        * context: file_id, url: the upload success page
+'''
+from django.views.decorators.http import require_POST, require_http_methods
+from dashboard import uploads
+from dashboard.models import UploadSession
+
+def _upload_session(request, pk):
+    session = get_object_or_404(UploadSession, pk=pk)
+    if session.upload_by != request.user:
+        raise Http404('Upload does not exist')
+    return session
+
+def _upload_session_data(session):
+    return {'id': str(session.id), 'chunk_size': session.chunk_size, 'received_bytes': session.received_bytes, 'total_size': session.total_size}
+
+@login_required
+@require_POST
+def upload_session_create_view(request):
+    try:
+        session = uploads.create_session(request.user, request.POST.get('name', ''), request.POST.get('filename', ''),
+                                         int(request.POST.get('size', 0)))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(_upload_session_data(session))
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def upload_session_view(request, pk):
+    session = _upload_session(request, pk)
+    if request.method == 'GET':
+        return JsonResponse(_upload_session_data(session))
+    # the body is streamed from the request into the file; request.body would hold the whole chunk in memory
+    try:
+        offset = int(request.GET.get('offset', -1))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        _, accepted = uploads.write_chunk(session, offset, request, length)
+    except ValueError as e:
+        return JsonResponse({'error': str(e), 'received_bytes': session.received_bytes}, status=400)
+    return JsonResponse(_upload_session_data(session), status=200 if accepted else 409)
+
+@login_required
+@require_POST
+def upload_session_finish_view(request, pk):
+    session = _upload_session(request, pk)
+    try:
+        uploadfile = uploads.finish_session(session)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'file_id': str(uploadfile.id), 'url': reverse('uploadfile_done', args=[uploadfile.id])})
+
 '''
 define a functional view for success file upload.
     # user login required
@@ -131,58 +183,74 @@ class MyFilesListView(LoginRequiredMixin, generic.ListView):
     context_object_name = 'my_files'
     template_name = 'my_files.html'
     
-    # define query set
+    # define query set; the template shows who deleted a file
     def get_queryset(self):
-        my_files = Files.objects.filter(upload_by=self.request.user).order_by('-upload_datetime')
-        # do not return actual file to browser if it is deleted
-        for file in my_files:
-            if file.deleted:
-#                file.file = 'removed'
-                pass
-        return my_files
+        return Files.objects.filter(upload_by=self.request.user).select_related('delete_by').order_by('-upload_datetime')
     
     # add counts to context:
     def get_context_data(self, **kwargs):
         context = super(MyFilesListView, self).get_context_data(**kwargs)
-        # list of user uploaded files
-        my_files = Files.objects.filter(upload_by=self.request.user)
-        context['file_count'] = my_files.count()
-        context['delete_count'] = my_files.filter(deleted=True).count()
+        # both counts in one query
+        context.update(Files.objects.filter(upload_by=self.request.user)
+                       .aggregate(file_count=Count('id'), delete_count=Count('id', filter=Q(deleted=True))))
         return context
 
 '''
-define a class view for staff user to review all uploaded files.
+define a class view for staff user to review all uploaded files. Files are listed FILES_PER_PAGE at a time, newest first, with keyset pagination:
+the next page starts after the last file of the page (see file_cursor), so a page costs one index range scan however deep it is, and files
+uploaded while browsing do not shift the pages.
     # user login required
     # permission - dashboard.can_view_any_file
+    # input
+        * GET after: the cursor of the last file of the previous page. Default value is None, which lists the newest files.
     # context - 
-        * all_files: the list of files uploaded by any user (including deleted files)
+        * all_files: a page of files uploaded by any user (including deleted files)
         * file_count: the number of files uploaded
         * delete_count: the number of deleted files
+        * next_cursor: the cursor of the next page, or None on the last page
+        * is_first_page: a boolean indicating the first page
     # template - all_files.html
 '''
+FILES_PER_PAGE = 50
+
+# the position of a file in the (upload_datetime, id) order: '<microseconds since epoch>.<uuid hex>'
+def file_cursor(file):
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    return '%d.%s' % ((file.upload_datetime - epoch) // datetime.timedelta(microseconds=1), file.id.hex)
+
+def parse_file_cursor(cursor):
+    microseconds, file_id = cursor.split('.')
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    return epoch + datetime.timedelta(microseconds=int(microseconds)), uuid.UUID(file_id)
+
 class AllFilesListView(PermissionRequiredMixin, generic.ListView):
     model = Files
     context_object_name = 'all_files'
     template_name = 'all_files.html'
     permission_required = 'dashboard.can_view_any_file'
     
-    # define query set
+    # define query set: one page after the cursor, uploader and deleter joined for the template
     def get_queryset(self):
-        my_files = Files.objects.all().order_by('-upload_datetime')
-        # do not return actual file to browser if it is deleted
-        for file in my_files:
-            if file.deleted:
-#                file.file = 'removed'
-                pass
-        return my_files
+        all_files = Files.objects.select_related('upload_by', 'delete_by').order_by('-upload_datetime', '-id')
+        cursor = self.request.GET.get('after')
+        if cursor:
+            try:
+                upload_datetime, file_id = parse_file_cursor(cursor)
+            except ValueError:
+                raise Http404('Invalid page')
+            all_files = all_files.filter(Q(upload_datetime__lt=upload_datetime) | Q(upload_datetime=upload_datetime, id__lt=file_id))
+        # one more file tells whether there is a next page
+        page = list(all_files[:FILES_PER_PAGE + 1])
+        self.next_cursor = file_cursor(page[FILES_PER_PAGE - 1]) if len(page) > FILES_PER_PAGE else None
+        return page[:FILES_PER_PAGE]
     
-    # add counts to context:
+    # add counts and pagination to context:
     def get_context_data(self, **kwargs):
         context = super(AllFilesListView, self).get_context_data(**kwargs)
-        # list of user uploaded files
-        my_files = Files.objects.all()
-        context['file_count'] = my_files.count()
-        context['delete_count'] = my_files.filter(deleted=True).count()
+        # both counts in one query
+        context.update(Files.objects.aggregate(file_count=Count('id'), delete_count=Count('id', filter=Q(deleted=True))))
+        context['next_cursor'] = self.next_cursor
+        context['is_first_page'] = not self.request.GET.get('after')
         return context   
 
 # In[]: File delete
@@ -226,17 +294,17 @@ def file_delete_view(request, pk):
 define a function view to show progress of background calculation
     # login required
     # input
-        * calc_url: specify the type of analysis to perform on file
-        * pk: the unique id of the file
+        * pk: the unique id of the AnalysisJob
     # context
-        * calc_url: same as input
-        * pk: same as input
+        * job: the AnalysisJob. The page polls job_status_view until the job is finished.
     # template: wait_for_calculation.html
 '''
-# need to add more security to prevent direct page visit
 @login_required
-def wait_for_calculation_view(request, calc_url, pk):
-    return render(request, 'wait_for_calculation.html', {'calc_url': calc_url, 'pk':pk})
+def wait_for_calculation_view(request, pk):
+    job = get_object_or_404(AnalysisJob.objects.select_related('file_id'), pk=pk)
+    if job.requested_by != request.user and job.file_id.upload_by != request.user and not request.user.has_perm('dashboard.can_view_any_file'):
+        raise PermissionDenied
+    return render(request, 'wait_for_calculation.html', {'job': job})
 
 # In[]: file details
 '''
@@ -247,15 +315,16 @@ define a functional view for user to view file contents, request analysis and vi
     # context
         * file: the Files instance retrieved from data model
         * file_metrics: the metrics instances retrieved from data model
+        * blink_form: the BlinkParamForm for the blink detection parameters of a video analysis
         * errors: a list of error messages
     # template: 'video_details.html' or 'image_details.html' or 'file_details_generic.html' (based on the type of file)
 '''
 @login_required
 def file_details_view(request, pk):
-    # retrieve file
-    file = get_object_or_404(Files, pk=pk)
+    # retrieve file, with the uploader and the latest analysis shown by the templates
+    file = get_object_or_404(Files.objects.select_related('upload_by', 'delete_by', 'latest_metrics'), pk=pk)
     # check user access: only owner and user with 'can_view_any_file' access can see video details.
-    perm = file.upload_by==request.user or request.user.has_perm('dashboard.can_view_any_file')
+    perm = file.upload_by_id==request.user.id or request.user.has_perm('dashboard.can_view_any_file')
     # remove video if user has no permission
     if not perm:
         file = None
@@ -266,8 +335,7 @@ def file_details_view(request, pk):
     errors = []
     if file is not None:
         if file.file_type == 'v': # video
-            if file.count_analyzed != 0:
-                file_metrics = VideoMetrics.objects.filter(file_id=file.id).order_by('-create_datetime')[0]
+            file_metrics = file.latest_metrics
             calc_method = 'video_analysis'
             template = 'video_details.html'
         elif file.file_type == 'i': # image
@@ -290,77 +358,176 @@ def file_details_view(request, pk):
                             '</ul>')
             errors.append(error_string % (file.extension(), ', '.join(FILE_EXTENSION_TO_TYPE['v']), ', '.join(FILE_EXTENSION_TO_TYPE['t']), 
                                           ', '.join(FILE_EXTENSION_TO_TYPE['o']), ', '.join(FILE_EXTENSION_TO_TYPE['i'])))
+    # blink detection parameters of the next analysis; the parameters of the latest analysis are shown by default
+    if request.method=='POST':
+        blink_form = BlinkParamForm(request.POST)
+    elif file_metrics is not None:
+        metrics_params = json.loads(file_metrics.params or '{}')
+        blink_form = BlinkParamForm(initial=dict(metrics_params.get('blink_param', {}), **metrics_params.get('sample_param', {})))
+    else:
+        blink_form = BlinkParamForm()
     # analyze the file if requested, has permission and file is no unclassified
-    if request.method=='POST' and request.POST['analyze']=='T' and perm and file.file_type != 'u':
+    if request.method=='POST' and request.POST.get('analyze')=='T' and perm and file.file_type != 'u':
         # check whether file format is acceptable
         if file.extension() in SUPPORTED_FILE_TYPE[file.file_type]:
-            # redirect to waiting page and image video analysis
-            return HttpResponseRedirect(reverse('waiting', args=(calc_method, pk)))
+            params = {}
+            if file.file_type == 'v' and blink_form.is_valid():
+                if len(blink_form.blink_param()) > 0:
+                    params['blink_param'] = blink_form.blink_param()
+                if blink_form.sample_param() is not None:
+                    params['sample_param'] = blink_form.sample_param()
+                # only detect blinks again from the stored trackers of the latest analysis, unless the face should be tracked again
+                if file_metrics is not None and file_metrics.calc_status == 's' and not blink_form.cleaned_data['full_recompute']:
+                    calc_method = 'blink_analysis'
+            if file.file_type != 'v' or blink_form.is_valid():
+                # queue the analysis for the background worker and redirect to waiting page
+                job = analysis.enqueue_job(file, calc_method, request.user, params)
+                return HttpResponseRedirect(reverse('waiting', args=(job.id,)))
         else:
             errors.append('File format "%s" is not supported at the moment. Try the followings file types: %s.' % (file.extension(), ', '.join(SUPPORTED_FILE_TYPE[file.file_type])))
+    # export a marked video from the landmark data of the latest analysis if requested
+    if request.method=='POST' and request.POST.get('export')=='T' and perm and file_metrics is not None and file_metrics.landmark_data:
+        job = analysis.enqueue_job(file, 'video_export', request.user)
+        return HttpResponseRedirect(reverse('waiting', args=(job.id,)))
     
     context = {'file':file,
                'file_metrics':file_metrics,
+               'blink_form': blink_form,
                'errors': errors,
                } 
     return render(request, template, context)
 
-# In[]: video analysis
+
+# In[]: analysis job status
 '''
-define a calculation view to analyze video
+define a view for the waiting page to poll the state of an analysis job. The analysis itself runs in python manage.py run_analysis_worker.
     # login_required
     # input
-        * pk: the unique id of the file
+        * pk: the unique id of the AnalysisJob
     # context
-        * status: indicate whether the calculation is successful 's', or contains errors 'e'.
+        * status: the status of the job: 'q' (queued), 'r' (running), 's' (successful) or 'e' (contains errors).
         * errors: the error messages from calculation
+        * queue_position: number of queued jobs ahead of this job (only when status is 'q')
+        * stage: the current stage of a running job, e.g. 'tracking'
+        * frames, total_frame: number of frames processed and number of frames in the video
+        * fps: processed frames per second
+        * eta: estimated seconds until all frames are processed, or None
+        * updated: seconds since the last progress update, or None
 '''
+@login_required
+def job_status_view(request, pk):
+    # one query on the job row and the file owner; this view is polled every few seconds
+    job = AnalysisJob.objects.filter(pk=pk).values('status', 'errors', 'create_datetime', 'requested_by', 'file_id__upload_by', 'progress_stage',
+                                                   'progress_frames', 'progress_total', 'progress_fps', 'progress_datetime').first()
+    if job is None:
+        raise Http404('Job does not exist')
+    if request.user.id not in (job['requested_by'], job['file_id__upload_by']) and not request.user.has_perm('dashboard.can_view_any_file'):
+        raise PermissionDenied
+    data = {'status': job['status'], 'errors': json.loads(job['errors'] or '[]')}
+    if job['status'] == 'q':
+        data['queue_position'] = AnalysisJob.objects.filter(status='q', create_datetime__lt=job['create_datetime']).count()
+    elif job['status'] == 'r':
+        data['stage'] = job['progress_stage']
+        data['frames'] = job['progress_frames']
+        data['total_frame'] = job['progress_total']
+        data['fps'] = job['progress_fps']
+        data['eta'] = job_eta(job['progress_frames'], job['progress_total'], job['progress_fps'])
+        data['updated'] = (timezone.now() - job['progress_datetime']).total_seconds() if job['progress_datetime'] else None
+    return JsonResponse(data)
 
-# need to add more security to prevent direct page visit
+# In[]: time series of an analysis
+'''
+define a view that returns the per-frame time series of the latest analysis of a video, for charts and reports. Only the frames of the requested
+time range are read from the stored series data (see MLmodels.series_data).
+    # login_required
+    # input
+        * pk: the unique id of the file
+        * GET start, end: the time range in seconds. Default value is the whole video.
+        * GET columns: comma separated columns (see series_data.SERIES_COLUMNS). Default value is 'start_times,eye_aspect_ratio,blink_count'.
+        * GET step: return every step-th frame of the range. Default value is 1.
+    # context
+        * meta: version, fps, total_frame, width, height, and the frame range (start, stop) of the series
+        * series: a list of values per column. Eye aspect ratio is null for frames without a face.
+'''
 @login_required
-def video_analysis_calc(request, pk):
-    # initialization and retrieve video
-#    video = get_object_or_404(Files, pk=pk, file_type__exact='v')
-    video = get_object_or_404(Files, pk=pk)
-    status = 's'
-    errors = []
-    # the path to save marked video; slugify() converts string to URL and filename friendly
-    save_name= '%s_analyzed.mp4' % (slugify(video.name))
-    temp_path = settings.BASE_DIR + '/__tempfile/%s/%s' % (video.upload_by.username, save_name)
-    
-    # get facial trackers of the video
-    summary, face_tracker, tracker_errors = fa.face_68_tracker(video.file.path, verbose=False, save_video=True, save_path=temp_path)
-    # conduct further analysis if facial tracker is successfull run. Otherwise append error messages.
-    if summary != {}:
-        # analyze blinking
-        eye_aspect_ratio, blink_count, blink_errors = fa.detect_blink(summary, face_tracker)
-        errors.append(blink_errors)
-    else:
-        status = 'e'
-        errors.append(tracker_errors)
-            
-    # store output in VideoMetrics model as a new entry
-    video_metrics = VideoMetrics()
-    video_metrics.file_id = video
-    # save marked_video and remove temporary file. If failed then write to error messages.
+def series_data_view(request, pk):
+    file = get_object_or_404(Files.objects.select_related('latest_metrics'), pk=pk)
+    if not (file.upload_by_id==request.user.id or request.user.has_perm('dashboard.can_view_any_file')):
+        raise PermissionDenied
+    file_metrics = file.latest_metrics
+    # analyses without series data (e.g. a failed analysis or an older analyzer version) fall back to the latest one with series data
+    if file_metrics is None or not file_metrics.series_data:
+        file_metrics = VideoMetrics.objects.filter(file_id=file.id, series_data__gt='').order_by('-create_datetime').first()
+    if file_metrics is None:
+        raise Http404('The video has no stored time series')
     try:
-        with open(temp_path, mode='rb') as f:
-            marked_file = File(f)
-            video_metrics.marked_video.save(save_name, marked_file, save=True)
-        os.remove(temp_path)
-    except:
-        status = 'e'
-        errors.append('An error prevent processed video content to be saved. Only analysis metrics are available.')
-
-    video_metrics.calc_status = status
-    video_metrics.frame_num = summary['total_frame']
-    video_metrics.fps = summary['fps']
-    video_metrics.blink_count = blink_count[-1]
-    video.count_analyzed += 1
-    
-    video_metrics.save()
-    video.save()
-    
-    data = {'status': status, 'errors':errors}
+        start = float(request.GET['start']) if 'start' in request.GET else None
+        end = float(request.GET['end']) if 'end' in request.GET else None
+        step = max(int(request.GET.get('step', 1)), 1)
+        columns = request.GET.get('columns', 'start_times,eye_aspect_ratio,blink_count').split(',')
+        meta, series = series_data.read_series_data(file_metrics.series_data.path, start, end, columns)
+    except ValueError as e:
+        return JsonResponse({'errors': [str(e)]}, status=400)
+    data = {'meta': meta, 'series': {}}
+    for column in columns:
+        values = series[column][::step]
+        if values.dtype.kind == 'f':
+            # NaN is not valid JSON
+            values = np.where(np.isnan(values), None, values)
+        data['series'][column] = values.tolist()
     return JsonResponse(data)
 
+# In[]: media files
+'''
+define a view that serves uploaded files and analysis outputs under MEDIA_URL, with byte ranges so that videos can be seeked (see dashboard.media).
+Only files in the directory of a user are served: uploadfiles/<username>/ (see models.user_upload_path) and markedfiles/<username>/ (see
+models.marked_file_path).
+    # login_required
+    # input
+        * path: the storage name of the file, e.g. uploadfiles/<username>/<filename>
+    # access: same as file_details_view. The owner is the user named in the path, so no record is queried, or a user with 'can_view_any_file'
+      access. Landmark and series data reused from the cache (see dashboard.analysis.metrics_from_cache) are also served to the owners of the
+      files whose analyses refer to them.
+'''
+from django.views.decorators.http import require_safe
+from dashboard import media
+
+MEDIA_USER_DIRS = ['uploadfiles', 'markedfiles']
+
+@login_required
+@require_safe
+def media_file_view(request, path):
+    parts = path.split('/')
+    if len(parts) < 3 or parts[0] not in MEDIA_USER_DIRS or '..' in parts or '' in parts:
+        raise Http404('File does not exist')
+    if not (parts[1] == request.user.username or request.user.has_perm('dashboard.can_view_any_file')):
+        shared = (parts[0] == 'markedfiles' and VideoMetrics.objects.filter(Q(landmark_data=path) | Q(series_data=path),
+                                                                             file_id__upload_by=request.user).exists())
+        if not shared:
+            raise PermissionDenied
+    try:
+        return media.media_response(request, path)
+    except FileNotFoundError:
+        raise Http404('File does not exist')
+
+# In[]
+'''
+define a view to export metrics of the analyses in the Prometheus text format (see dashboard.metrics), e.g. for a Prometheus server scraping
+/metrics. It is not behind a login, so that the scraper needs no session.
+    # access: a request with header "Authorization: Bearer <METRICS_TOKEN>" when settings.METRICS_TOKEN is set, otherwise a request from an
+      address in settings.METRICS_ALLOWED_IPS (default: 127.0.0.1 only)
+'''
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from dashboard import metrics
+
+@require_safe
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        if not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token):
+            raise PermissionDenied
+    elif request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1']):
+        raise PermissionDenied
+    return HttpResponse(metrics.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
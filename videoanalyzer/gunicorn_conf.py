@@ -0,0 +1,17 @@
+'''
+gunicorn configuration for videoanalyzer.
+gunicorn -c videoanalyzer/gunicorn_conf.py videoanalyzer.wsgi
+
+Set environment variable PRELOAD_ML_MODELS=1 on servers that analyze videos. The dlib models are then loaded once in the gunicorn master
+before workers are forked, and all workers share the model pages copy-on-write. Web-only servers leave it unset and never load the models.
+'''
+
+import os
+
+def on_starting(server):
+    if os.environ.get('PRELOAD_ML_MODELS', '0') == '1':
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "videoanalyzer.settings")
+        from MLmodels import model_registry
+        stats = model_registry.preload()
+        for name in stats:
+            server.log.info('Loaded %s in %s' % (name, model_registry.format_stats(stats[name])))
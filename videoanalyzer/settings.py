@@ -151,4 +151,17 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # setup MEDIA_ROOT and MEDIA_URL for uploaded files
 MEDIA_ROOT = BASE_DIR # 'data' is my media folder
-MEDIA_URL = '/accessfile/'
\ No newline at end of file
+MEDIA_URL = '/accessfile/'
+# let the front server send media files after django checks access (see dashboard.media): None, 'X-Accel-Redirect' (nginx) or 'X-Sendfile'
+MEDIA_SENDFILE_HEADER = None
+# internal nginx location aliasing MEDIA_ROOT, used with X-Accel-Redirect
+MEDIA_ACCEL_PREFIX = '/protected/'
+
+# access to the Prometheus metrics at /metrics (see dashboard.metrics): a bearer token, or else the addresses allowed without token
+METRICS_TOKEN = None
+METRICS_ALLOWED_IPS = ['127.0.0.1', ]
+
+# processes that track the chunks of one video analysis (see MLmodels.facial_analysis.face_68_tracker_parallel). 1 analyzes each video in
+# a single process. Each of the --concurrency processes of run_analysis_worker starts its own ANALYSIS_WORKERS processes, so a server runs up
+# to concurrency x ANALYSIS_WORKERS analysis processes, e.g. --concurrency 4 with ANALYSIS_WORKERS = 4 on 16 cores.
+ANALYSIS_WORKERS = 1
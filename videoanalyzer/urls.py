@@ -42,5 +42,13 @@ from django.conf.urls.static import static
 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
-# add MEDIA_URL and MEDIA_ROOT for uploaded file
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# serve uploaded files and analysis outputs under MEDIA_URL with access checks and byte ranges (static() serves any file and cannot seek)
+from django.urls import re_path
+from dashboard.views import media_file_view
+
+urlpatterns += [re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), media_file_view, name='media')]
+
+# metrics of the analyses for Prometheus
+from dashboard.views import metrics_view
+
+urlpatterns += [path('metrics', metrics_view, name='metrics')]